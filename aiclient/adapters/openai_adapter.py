@@ -2,13 +2,13 @@
 OpenAI API适配器 - 支持Function Call
 """
 
-import json
 import logging
-from typing import Optional, List, Dict, Any
+from typing import Optional, Dict, Any, Callable, Awaitable
 
 from .base import BaseAdapter
 from ..models import AIRequest, AIResponse
 from ..config import ModelConfig
+from ..tool_dispatcher import TOOL_DISPATCHER
 
 
 logger = logging.getLogger(__name__)
@@ -17,8 +17,8 @@ logger = logging.getLogger(__name__)
 class OpenAIAdapter(BaseAdapter):
     """OpenAI API适配器 - 支持Function Call"""
     
-    def __init__(self, config: ModelConfig):
-        super().__init__(config)
+    def __init__(self, config: ModelConfig, services=None):
+        super().__init__(config, services)
         self.supports_function_calling = True
     
     async def chat_completion(self, request: AIRequest) -> AIResponse:
@@ -37,6 +37,25 @@ class OpenAIAdapter(BaseAdapter):
         
         return self._parse_response(response_data)
     
+    async def stream_chat_completion(self, request: AIRequest,
+                                     on_delta: Optional[Callable[[str], Awaitable[None]]] = None) -> AIResponse:
+        """执行OpenAI流式聊天补全请求"""
+        url = f"{self.config.base_url.rstrip('/')}/chat/completions"
+        headers = {
+            "Authorization": f"Bearer {self.config.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        data = self._prepare_request(request)
+        data["model"] = self.config.model_name
+        
+        self.logger.info(f"发送OpenAI流式请求: {self.config.model_name}")
+        response_data, first_token_ms = await self._make_stream_request(url, headers, data, on_delta)
+        
+        response = self._parse_response(response_data)
+        response.time_to_first_token = first_token_ms
+        return response
+    
     def _prepare_request(self, request: AIRequest) -> dict:
         """准备OpenAI API请求数据"""
         data = request.to_openai_format()
@@ -73,7 +92,7 @@ class OpenAIAdapter(BaseAdapter):
     
     async def execute_function_call(self, function_name: str, function_args: Dict[str, Any]) -> Dict[str, Any]:
         """
-        执行function call
+        执行function call（按名称查分发表，参数类型转换、超时和并发限制见 tool_dispatcher）
         
         Args:
             function_name: 函数名 
@@ -82,176 +101,4 @@ class OpenAIAdapter(BaseAdapter):
         Returns:
             函数执行结果
         """
-        from ..database_service import DatabaseAPIService
-        
-        # 初始化数据库服务
-        db_service = DatabaseAPIService()
-        
-        try:
-            # 新API函数调用
-            if function_name == "create_appointment":
-                # 处理标准预约创建
-                appointment_data = {
-                    'therapist_id': function_args.get('therapist_id'),
-                    'user_name': function_args.get('user_name'),
-                    'user_phone': function_args.get('user_phone'),
-                    'appointment_date': function_args.get('appointment_date'),
-                    'appointment_time': function_args.get('appointment_time'),
-                    'notes': function_args.get('notes', '')
-                }
-                
-                result = await db_service.create_appointment(appointment_data)
-                return result
-            
-            elif function_name == "get_user_appointments":
-                phone = function_args.get("phone")
-                results = await db_service.get_user_appointments(phone)
-                return {
-                    "success": True,
-                    "data": results,
-                    "message": f"查询到 {len(results)} 个预约记录"
-                }
-            
-            elif function_name == "cancel_appointment":
-                appointment_id = function_args.get("appointment_id")
-                phone = function_args.get("phone")
-                result = await db_service.cancel_appointment(appointment_id, phone)
-                return result
-            
-            elif function_name == "get_therapist_schedule":
-                therapist_id = function_args.get("therapist_id")
-                date = function_args.get("date")
-                result = await db_service.get_therapist_schedule(therapist_id, date)
-                return {
-                    "success": True,
-                    "data": result,
-                    "message": "技师排班查询成功"
-                }
-            
-            elif function_name == "search_therapists":
-                store_id = function_args.get("store_id")
-                specialty = function_args.get("specialty")
-                min_experience = function_args.get("min_experience")
-                
-                # 使用新的搜索方法
-                results = await db_service.search_therapists(
-                    store_id=store_id
-                )
-                
-                # 如果有专长或经验要求，进行后过滤
-                if specialty or min_experience:
-                    filtered_results = []
-                    for therapist in results:
-                        # 检查专长
-                        if specialty:
-                            specialties = therapist.get('specialties', [])
-                            if isinstance(specialties, str):
-                                specialties = [specialties]
-                            if not any(specialty.lower() in s.lower() for s in specialties):
-                                continue
-                        
-                        # 检查经验年限
-                        if min_experience:
-                            experience = therapist.get('years_of_experience', 0)
-                            if experience < min_experience:
-                                continue
-                        
-                        filtered_results.append(therapist)
-                    
-                    results = filtered_results
-                
-                return {
-                    "success": True,
-                    "data": results,
-                    "message": f"查询到 {len(results)} 个技师"
-                }
-            
-            elif function_name == "query_technician_schedule":
-                technician_id = function_args.get("technician_id")
-                start_date = function_args.get("start_date")
-                end_date = function_args.get("end_date")
-                results = await db_service.query_technician_schedule(technician_id, start_date, end_date)
-                return {
-                    "success": True,
-                    "data": results,
-                    "message": f"查询到 {len(results)} 个排班记录"
-                }
-            
-            elif function_name == "get_appointment_details":
-                appointment_id = function_args.get("appointment_id")
-                result = await db_service.get_appointment_details(appointment_id)
-                return {
-                    "success": True,
-                    "data": result,
-                    "message": "预约详情查询成功"
-                }
-            
-            elif function_name == "get_stores":
-                results = await db_service.get_stores()
-                return {
-                    "success": True,
-                    "data": results,
-                    "message": f"查询到 {len(results)} 个门店"
-                }
-            
-            elif function_name == "send_appointment_emails":
-                # 导入邮件通知服务
-                from ..services.email_notification import EmailNotificationService
-                from ..services.email_sender_adapter import EmailSenderAdapter
-                
-                # 创建邮件发送器适配器实例
-                email_sender = EmailSenderAdapter()
-                
-                # 创建邮件通知服务实例
-                email_service = EmailNotificationService(
-                    email_sender=email_sender,
-                    database_service=db_service
-                )
-                
-                # 发送预约邮件通知
-                result = await email_service.send_appointment_notification_emails(function_args)
-                return result
-            
-            elif function_name == "create_smart_appointment":
-                # 方式1: 直接调用智能预约API (推荐)
-                customer_message = function_args.get("customer_message", "")
-                context_info = function_args.get("context_info", {})
-                
-                # 如果提供了解析好的数据，直接使用智能预约API
-                if "therapist_name" in function_args or "appointment_time" in function_args:
-                    self.logger.info("使用直接智能预约API模式")
-                    result = await db_service.create_smart_appointment(function_args)
-                    return result
-                
-                # 方式2: 使用智能预约服务进行自然语言解析
-                else:
-                    self.logger.info("使用智能预约服务解析模式")
-                    from ..services.smart_appointment import SmartAppointmentService
-                    
-                    smart_appointment_service = SmartAppointmentService(
-                        database_service=db_service
-                    )
-                    
-                    result = await smart_appointment_service.create_smart_appointment(
-                        customer_message=customer_message,
-                        context_info=context_info
-                    )
-                    return result
-            
-            else:
-                return {
-                    "success": False,
-                    "error": f"未知的函数: {function_name}",
-                    "message": "不支持的函数调用"
-                }
-                
-        except Exception as e:
-            logger.error(f"执行函数调用失败 ({function_name}): {e}")
-            return {
-                "success": False,
-                "error": str(e),
-                "message": f"函数 {function_name} 执行失败"
-            }
-        finally:
-            # 确保数据库连接关闭
-            await db_service.close() 
\ No newline at end of file
+        return await TOOL_DISPATCHER.dispatch(function_name, function_args, self.services)
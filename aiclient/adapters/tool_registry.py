@@ -0,0 +1,463 @@
+"""
+工具定义注册表
+所有函数调用工具的JSON Schema在模块加载时只构建一次，并预先序列化为JSON字节：
+- 按对话阶段（咨询/预约）提供工具子集，减小请求体
+- 请求体编码时直接拼接预序列化的工具字节，不再每次重复序列化
+- 执行函数调用前按Schema校验模型给出的参数
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .. import serialization
+
+
+DATABASE_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_therapist_schedule",
+            "description": "查询指定技师在指定日期的可用预约时间段和排班信息",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "therapist_id": {
+                        "type": "integer",
+                        "description": "技师ID"
+                    },
+                    "date": {
+                        "type": "string",
+                        "description": "查询日期，格式: YYYY-MM-DD"
+                    }
+                },
+                "required": ["therapist_id", "date"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "search_therapists",
+            "description": "搜索技师信息，支持按门店ID、专长关键词、最少从业年限等条件搜索",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "store_id": {
+                        "type": "integer",
+                        "description": "门店ID，用于搜索指定门店的技师"
+                    },
+                    "specialty": {
+                        "type": "string",
+                        "description": "专长关键词，如：按摩、推拿、艾灸等"
+                    },
+                    "min_experience": {
+                        "type": "integer",
+                        "description": "最少从业年限"
+                    },
+                    "page": {
+                        "type": "integer",
+                        "description": "页码，默认1"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "每页数量，默认20"
+                    }
+                },
+                "required": []
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "create_appointment",
+            "description": "创建新的预约记录，需要提供完整的客户信息和预约时间",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "therapist_id": {
+                        "type": "integer",
+                        "description": "技师ID"
+                    },
+                    "user_name": {
+                        "type": "string",
+                        "description": "用户姓名"
+                    },
+                    "user_phone": {
+                        "type": "string",
+                        "description": "用户电话号码"
+                    },
+                    "appointment_date": {
+                        "type": "string",
+                        "description": "预约日期，格式: YYYY-MM-DD"
+                    },
+                    "appointment_time": {
+                        "type": "string",
+                        "description": "预约时间，格式: HH:MM"
+                    },
+                    "notes": {
+                        "type": "string",
+                        "description": "备注信息（可选）"
+                    }
+                },
+                "required": ["therapist_id", "user_name", "user_phone", "appointment_date", "appointment_time"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_user_appointments", 
+            "description": "查看指定用户的所有预约列表，通过手机号查询",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "phone": {
+                        "type": "string",
+                        "description": "用户电话号码"
+                    }
+                },
+                "required": ["phone"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_appointment_details",
+            "description": "获取指定预约的详细信息",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "appointment_id": {
+                        "type": "integer",
+                        "description": "预约ID"
+                    }
+                },
+                "required": ["appointment_id"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "cancel_appointment",
+            "description": "取消指定的预约，需要提供预约ID和用户电话进行身份验证",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "appointment_id": {
+                        "type": "integer",
+                        "description": "预约ID"
+                    },
+                    "phone": {
+                        "type": "string",
+                        "description": "用户电话号码，用于验证身份"
+                    }
+                },
+                "required": ["appointment_id", "phone"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_stores",
+            "description": "获取所有门店列表信息，包括门店名称、地址、营业时间、技师数量等",
+            "parameters": {
+                "type": "object",
+                "properties": {},
+                "required": []
+            }
+        }
+    }
+]
+
+EMAIL_NOTIFICATION_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "send_appointment_emails",
+            "description": "发送预约相关的邮件通知，包括给客户发送确认邮件和给技师发送新预约通知邮件",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "customer_name": {
+                        "type": "string",
+                        "description": "客户姓名"
+                    },
+                    "customer_phone": {
+                        "type": "string",
+                        "description": "客户电话号码，用于生成163邮箱地址"
+                    },
+                    "therapist_id": {
+                        "type": "integer",
+                        "description": "技师ID，用于查询技师信息和发送通知邮件"
+                    },
+                    "appointment_date": {
+                        "type": "string",
+                        "description": "预约日期，格式: YYYY-MM-DD"
+                    },
+                    "appointment_time": {
+                        "type": "string",
+                        "description": "预约时间，格式: HH:MM"
+                    },
+                    "service_type": {
+                        "type": "string",
+                        "description": "服务类型（可选）"
+                    },
+                    "notes": {
+                        "type": "string",
+                        "description": "预约备注信息（可选）"
+                    }
+                },
+                "required": ["customer_name", "customer_phone", "therapist_id", "appointment_date", "appointment_time"]
+            }
+        }
+    }
+]
+
+SMART_APPOINTMENT_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "create_smart_appointment",
+            "description": """智能预约功能：创建预约并处理各种情况。
+
+🎯 功能说明：
+- 支持自然语言解析预约信息
+- 自动处理时间冲突和技师不可用情况
+- 返回友好的错误信息和建议
+
+⚠️ 错误处理：
+当预约失败时，工具会返回具体原因：
+- "时间冲突"：技师在该时间已有安排，建议选择其他时间或技师
+- "技师不存在"：技师信息错误，建议选择其他技师
+- "营业时间限制"：时间超出营业范围
+- "系统错误"：临时故障，建议稍后重试
+
+📝 使用建议：
+- 优先使用结构化数据模式（直接传递解析好的信息）
+- 当预约失败时，根据返回的suggestion字段给客户友好建议
+- 不要说"未知错误"，而要根据具体错误类型给出有用的建议""",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "therapist_name": {
+                        "type": "string",
+                        "description": "技师姓名，例如：'马老师'、'李老师'、'张师傅'等"
+                    },
+                    "appointment_time": {
+                        "type": "string",
+                        "description": "预约时间，格式：HH:MM，例如：'16:30'、'14:00'"
+                    },
+                    "customer_name": {
+                        "type": "string",
+                        "description": "客户姓名，从客户消息中提取真实姓名，例如：'吴城良'、'张三'"
+                    },
+                    "customer_phone": {
+                        "type": "string",
+                        "description": "客户电话号码，从客户的最新消息中提取11位手机号。如果客户提供了电话号码，必须提取此字段。优先使用消息中的电话号码，而不是历史记录或上下文中的。"
+                    },
+                    "store_name": {
+                        "type": "string",
+                        "description": "门店名称。优先从用户最新消息中获取门店信息，如果未提供，则可使用上下文中的门店。"
+                    },
+                    "appointment_date": {
+                        "type": "string",
+                        "description": "预约日期，格式：YYYY-MM-DD，如不提供则默认今天"
+                    },
+                    "notes": {
+                        "type": "string",
+                        "description": "备注信息，可选"
+                    },
+                    "customer_message": {
+                        "type": "string",
+                        "description": "【自然语言模式】客户的原始预约请求，当没有提供结构化数据时使用"
+                    },
+                    "context_info": {
+                        "type": "object",
+                        "description": "【自然语言模式】对话上下文信息，当没有提供结构化数据时使用",
+                        "properties": {
+                            "shopName": {
+                                "type": "string",
+                                "description": "门店名称"
+                            },
+                            "contactName": {
+                                "type": "string",
+                                "description": "联系人名称"
+                            },
+                            "combinedName": {
+                                "type": "string",
+                                "description": "组合名称"
+                            },
+                            "chatId": {
+                                "type": "string",
+                                "description": "聊天会话ID"
+                            }
+                        }
+                    }
+                },
+                "required": []
+            }
+        }
+    }
+]
+
+class ToolSet(list):
+    """一组工具定义（只读使用），附带预序列化的JSON字节"""
+
+    def __init__(self, tools: Iterable[Dict[str, Any]]):
+        super().__init__(tools)
+        self.names: Tuple[str, ...] = tuple(tool["function"]["name"] for tool in self)
+        self.json_bytes: bytes = serialization.dumpb(list(self))
+
+
+# Schema类型 -> 允许的Python类型（integer/number 也接受模型常给出的数字字符串）
+_SCHEMA_TYPES: Dict[str, Tuple[type, ...]] = {
+    "string": (str,),
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+    "array": (list,),
+    "object": (dict,),
+}
+_INTEGER_STRING = re.compile(r"^-?\d+$")
+_NUMBER_STRING = re.compile(r"^-?\d+(\.\d+)?$")
+
+
+def _check_type(expected: str, value: Any) -> bool:
+    if expected in ("integer", "number") and isinstance(value, bool):
+        return False
+    if isinstance(value, _SCHEMA_TYPES.get(expected, (object,))):
+        return True
+    if isinstance(value, str):
+        pattern = _INTEGER_STRING if expected == "integer" else _NUMBER_STRING if expected == "number" else None
+        return bool(pattern and pattern.match(value.strip()))
+    return False
+
+
+def _validate_object(schema: Dict[str, Any], value: Dict[str, Any], path: str, errors: List[str]):
+    properties = schema.get("properties", {})
+    for name in schema.get("required", []):
+        if value.get(name) in (None, ""):
+            errors.append(f"缺少必填参数 {path}{name}")
+    for name, item in value.items():
+        prop = properties.get(name)
+        if prop is None or item is None:
+            continue
+        expected = prop.get("type")
+        if expected and not _check_type(expected, item):
+            errors.append(f"参数 {path}{name} 应为 {expected} 类型，实际为 {type(item).__name__}")
+            continue
+        if "enum" in prop and item not in prop["enum"]:
+            errors.append(f"参数 {path}{name} 取值应为 {prop['enum']} 之一")
+        if expected == "object" and isinstance(item, dict):
+            _validate_object(prop, item, f"{path}{name}.", errors)
+
+
+class ToolRegistry:
+    """工具定义注册表"""
+
+    def __init__(self):
+        self._tools: Dict[str, Dict[str, Any]] = {}
+        self._groups: Dict[str, List[str]] = {}
+        self._sets: Dict[Tuple[str, ...], ToolSet] = {}
+
+    def register(self, group: str, tools: Iterable[Dict[str, Any]]):
+        """注册一组工具定义"""
+        for tool in tools:
+            name = tool["function"]["name"]
+            self._tools[name] = tool
+            self._groups.setdefault(group, []).append(name)
+        self._sets.clear()
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._tools)
+
+    def group(self, group: str) -> ToolSet:
+        """获取一个分组的全部工具"""
+        return self.tool_set(self._groups.get(group, []))
+
+    def tool_set(self, names: Optional[Iterable[str]] = None) -> ToolSet:
+        """获取指定工具组成的工具集（按名称组合缓存，未指定时为全部工具）"""
+        key = tuple(self._tools) if names is None else tuple(name for name in names if name in self._tools)
+        if key not in self._sets:
+            self._sets[key] = ToolSet(self._tools[name] for name in key)
+        return self._sets[key]
+
+    def for_stage(self, stage: str) -> ToolSet:
+        """获取对话阶段对应的工具集，未知阶段返回全部工具"""
+        return self.tool_set(STAGE_TOOLS.get(stage))
+
+    def validate(self, name: str, arguments: Dict[str, Any]) -> List[str]:
+        """
+        按Schema校验函数调用参数
+
+        Returns:
+            错误列表，为空表示校验通过（未注册的函数不做校验）
+        """
+        tool = self._tools.get(name)
+        if tool is None:
+            return []
+        if not isinstance(arguments, dict):
+            return ["参数必须是JSON对象"]
+        errors: List[str] = []
+        _validate_object(tool["function"].get("parameters", {}), arguments, "", errors)
+        return errors
+
+
+# 对话阶段 -> 可用工具。咨询阶段只提供查询类工具；预约阶段提供全部工具
+CONSULT_STAGE = "consult"
+BOOKING_STAGE = "booking"
+STAGE_TOOLS: Dict[str, Optional[List[str]]] = {
+    CONSULT_STAGE: ["get_stores", "search_therapists", "get_therapist_schedule",
+                    "get_user_appointments", "get_appointment_details"],
+    BOOKING_STAGE: None,
+}
+
+# 客户消息中出现预约意向、具体时间或联系方式时进入预约阶段
+# 只匹配多字的表达：单字（约、点、姓、订）会命中“大约”“点评”“百姓”等咨询用语
+_BOOKING_PATTERN = re.compile(
+    r"预约|预订|约个|约一下|约下|想约|能约|可以约|可约|帮我约|约到|改约|改期|取消预约|"
+    r"几点有空|什么时候有空|有空吗|有空位|有位置|排得上|到店|"
+    r"我姓|免贵|留个电话|留电话|手机号|电话号|联系方式|"
+    r"明天|后天|大后天|(?:这|下)周[一二三四五六日天末]|(?:这|下)个?星期|"
+    r"(?:上午|中午|下午|晚上)[一二三四五六七八九十两\d]{1,3}点|[一二三四五六七八九十两\d]{1,3}点(?:半|钟|\d{1,2}分?)|"
+    r"\d{1,2}[:：]\d{2}|(?<!\d)1\d{10}(?!\d)"
+)
+
+
+def detect_conversation_stage(customer_message: str, conversation_history: Optional[List[Dict[str, Any]]] = None,
+                              lookback: int = 10) -> str:
+    """
+    根据当前客户消息和最近的客户消息判断对话阶段
+
+    判断偏向预约阶段：最近任何一条客户消息出现预约意向、时间或联系方式即视为预约阶段，
+    避免在需要创建预约时缺少工具。商家（assistant）的消息不参与判断，
+    否则“欢迎预约”之类的话术会让所有对话都进入预约阶段。
+    """
+    recent = (conversation_history or [])[-lookback:]
+    texts = [customer_message] + [str(m.get("content") or "") for m in recent if m.get("role") == "user"]
+    if any(_BOOKING_PATTERN.search(text) for text in texts):
+        return BOOKING_STAGE
+    return CONSULT_STAGE
+
+
+def encode_request_body(data: Dict[str, Any]) -> bytes:
+    """编码请求体：工具集使用预序列化的字节，其余字段正常序列化"""
+    tools = data.get("tools")
+    if not isinstance(tools, ToolSet):
+        return serialization.dumpb(data)
+    rest = {key: value for key, value in data.items() if key != "tools"}
+    head = serialization.dumpb(rest)
+    if head == b"{}":
+        return b'{"tools":' + tools.json_bytes + b"}"
+    return head[:-1] + b',"tools":' + tools.json_bytes + b"}"
+
+
+TOOL_REGISTRY = ToolRegistry()
+TOOL_REGISTRY.register("database", DATABASE_TOOLS)
+TOOL_REGISTRY.register("email", EMAIL_NOTIFICATION_TOOLS)
+TOOL_REGISTRY.register("smart_appointment", SMART_APPOINTMENT_TOOLS)
@@ -2,6 +2,8 @@
 智谱AI适配器
 """
 
+from typing import Optional, Callable, Awaitable
+
 from .base import BaseAdapter
 from ..models import AIRequest, AIResponse
 
@@ -24,6 +26,24 @@ class ZhipuAdapter(BaseAdapter):
         
         return self._parse_response(response_data)
     
+    async def stream_chat_completion(self, request: AIRequest,
+                                     on_delta: Optional[Callable[[str], Awaitable[None]]] = None) -> AIResponse:
+        """执行智谱AI流式聊天补全请求"""
+        url = f"{self.config.base_url.rstrip('/')}/chat/completions"
+        headers = {
+            "Authorization": f"Bearer {self.config.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        data = self._prepare_request(request)
+        
+        self.logger.info(f"发送智谱AI流式请求: {self.config.model_name}")
+        response_data, first_token_ms = await self._make_stream_request(url, headers, data, on_delta)
+        
+        response = self._parse_response(response_data)
+        response.time_to_first_token = first_token_ms
+        return response
+    
     def _prepare_request(self, request: AIRequest) -> dict:
         """准备智谱AI请求数据"""
         data = request.to_openai_format()  # 智谱AI兼容OpenAI格式
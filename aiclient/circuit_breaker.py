@@ -0,0 +1,157 @@
+"""
+AI提供商熔断器
+按提供商统计最近请求的失败率和慢请求比例，超过阈值时熔断（直接拒绝请求），
+冷却期过后放行少量探测请求，探测成功则恢复。
+"""
+
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState(Enum):
+    """熔断器状态"""
+    CLOSED = "closed"        # 正常放行
+    OPEN = "open"            # 熔断中，直接拒绝
+    HALF_OPEN = "half_open"  # 冷却结束，放行探测请求
+
+
+class CircuitOpenError(Exception):
+    """提供商处于熔断状态，请求被拒绝"""
+
+
+@dataclass
+class CircuitBreaker:
+    """单个提供商的熔断器
+
+    在最近 window 次请求中，失败率达到 failure_rate_threshold，
+    或耗时超过 slow_call_ms 的请求比例达到 slow_call_rate_threshold 时熔断。
+    """
+    name: str = "provider"
+    failure_rate_threshold: float = 0.5
+    slow_call_ms: float = 20000.0
+    slow_call_rate_threshold: float = 0.8
+    min_calls: int = 5               # 窗口内至少多少次请求才判断是否熔断
+    window: int = 20
+    open_seconds: float = 30.0       # 熔断后多久进入半开状态
+    half_open_max_calls: int = 1     # 半开状态同时放行的探测请求数
+    clock: Callable[[], float] = time.monotonic
+
+    state: CircuitState = field(default=CircuitState.CLOSED, init=False)
+    outcomes: Deque[Tuple[bool, float]] = field(default_factory=deque, init=False)  # (是否成功, 耗时ms)
+    opened_at: float = field(default=0.0, init=False)
+    half_open_in_flight: int = field(default=0, init=False)
+    rejected_count: int = field(default=0, init=False)
+    open_count: int = field(default=0, init=False)
+
+    def allow_request(self) -> bool:
+        """是否放行一次请求（放行半开探测请求时占用一个探测名额）"""
+        if self.state == CircuitState.OPEN:
+            if self.clock() - self.opened_at < self.open_seconds:
+                self.rejected_count += 1
+                return False
+            self._transition(CircuitState.HALF_OPEN)
+
+        if self.state == CircuitState.HALF_OPEN:
+            if self.half_open_in_flight >= self.half_open_max_calls:
+                self.rejected_count += 1
+                return False
+            self.half_open_in_flight += 1
+        return True
+
+    def record_success(self, latency_ms: float):
+        """记录一次成功请求"""
+        if self.state == CircuitState.HALF_OPEN:
+            self.half_open_in_flight = max(0, self.half_open_in_flight - 1)
+            if latency_ms < self.slow_call_ms:
+                self.outcomes.clear()
+                self._transition(CircuitState.CLOSED)
+            else:
+                self._open()
+            return
+        self._record(True, latency_ms)
+
+    def record_failure(self, latency_ms: float):
+        """记录一次失败请求"""
+        if self.state == CircuitState.HALF_OPEN:
+            self.half_open_in_flight = max(0, self.half_open_in_flight - 1)
+            self._open()
+            return
+        self._record(False, latency_ms)
+
+    def release(self):
+        """请求被取消（未得出结果）时归还半开探测名额"""
+        if self.state == CircuitState.HALF_OPEN:
+            self.half_open_in_flight = max(0, self.half_open_in_flight - 1)
+
+    def _record(self, success: bool, latency_ms: float):
+        self.outcomes.append((success, latency_ms))
+        if len(self.outcomes) > self.window:
+            self.outcomes.popleft()
+        if self.state == CircuitState.CLOSED and len(self.outcomes) >= self.min_calls:
+            if self.failure_rate >= self.failure_rate_threshold:
+                logger.warning(f"提供商 {self.name} 失败率 {self.failure_rate:.0%}，触发熔断")
+                self._open()
+            elif self.slow_call_rate >= self.slow_call_rate_threshold:
+                logger.warning(f"提供商 {self.name} 慢请求比例 {self.slow_call_rate:.0%}，触发熔断")
+                self._open()
+
+    def _open(self):
+        self.opened_at = self.clock()
+        self.open_count += 1
+        self._transition(CircuitState.OPEN)
+
+    def _transition(self, state: CircuitState):
+        if state != self.state:
+            logger.info(f"提供商 {self.name} 熔断器: {self.state.value} -> {state.value}")
+            self.state = state
+        if state != CircuitState.HALF_OPEN:
+            self.half_open_in_flight = 0
+
+    @property
+    def failure_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for success, _ in self.outcomes if not success) / len(self.outcomes)
+
+    @property
+    def slow_call_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for _, latency in self.outcomes if latency >= self.slow_call_ms) / len(self.outcomes)
+
+    @property
+    def avg_latency_ms(self) -> Optional[float]:
+        latencies = [latency for success, latency in self.outcomes if success]
+        return sum(latencies) / len(latencies) if latencies else None
+
+    def health_score(self) -> float:
+        """健康分（0~1）：熔断为0，否则为成功率乘以延迟系数（平均延迟超过慢请求阈值才扣分）"""
+        if self.state == CircuitState.OPEN and self.clock() - self.opened_at < self.open_seconds:
+            return 0.0
+        score = 1.0 - self.failure_rate
+        avg_latency = self.avg_latency_ms
+        if avg_latency and avg_latency > self.slow_call_ms:
+            score *= self.slow_call_ms / avg_latency
+        if self.state != CircuitState.CLOSED:
+            score *= 0.5  # 半开（或冷却已结束待探测）的提供商排在健康提供商之后
+        return round(score, 3)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        avg_latency = self.avg_latency_ms
+        return {
+            "state": self.state.value,
+            "health_score": self.health_score(),
+            "calls": len(self.outcomes),
+            "failure_rate": round(self.failure_rate, 3),
+            "slow_call_rate": round(self.slow_call_rate, 3),
+            "avg_latency_ms": round(avg_latency, 1) if avg_latency is not None else None,
+            "open_count": self.open_count,
+            "rejected_count": self.rejected_count,
+        }
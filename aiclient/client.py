@@ -2,26 +2,44 @@
 统一AI客户端
 """
 
-import json
 import logging
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Awaitable
 import asyncio
 
 from .config import AIConfig, AIProvider
 from .models import AIRequest, AIResponse, AIMessage, MessageRole
 from .adapters import OpenAIAdapter, ZhipuAdapter, DeepSeekAdapter, BaseAdapter
+from .tool_scheduler import SIDE_EFFECT_TOOLS, ToolScheduler
+from .tool_dispatcher import TOOL_DISPATCHER
+from .adapters.tool_registry import TOOL_REGISTRY
+from .hedging import HedgePolicy, HedgedRequest, LatencyTracker
+from .history import HistoryCompactor
+from .services.container import ServiceContainer
 
 
 logger = logging.getLogger(__name__)
 
+# 默认优先级: OpenAI > 智谱AI > Deepseek
+PROVIDER_PRIORITY = [AIProvider.OPENAI, AIProvider.ZHIPU, AIProvider.DEEPSEEK]
+
 
 class AIClient:
     """统一AI客户端"""
     
-    def __init__(self):
+    def __init__(self, services: Optional[ServiceContainer] = None):
         self.config = AIConfig()
+        self.services = services or ServiceContainer()  # 所有适配器共享的业务服务
         self.adapters: Dict[AIProvider, BaseAdapter] = {}
         self._conversation_memory: List[Dict[str, Any]] = []  # 当前对话记忆
+        self.tool_scheduler = ToolScheduler(validator=TOOL_REGISTRY.validate)
+        self.latency = LatencyTracker()  # 各提供商的延迟直方图，驱动对冲等待时间
+        self.hedge_policy = HedgePolicy(**self.config.hedge_settings)
+        self.hedge_stats: Dict[str, Any] = {"requests": 0, "hedged": 0, "wins": {}}
+        self.history_compactor = HistoryCompactor(
+            token_budget=self.config.history_token_budget,
+            summary_tokens=self.config.history_summary_tokens,
+            min_recent=self.config.history_min_recent
+        )
         self._init_adapters()
     
     def _init_adapters(self):
@@ -32,18 +50,36 @@ class AIClient:
                 continue
                 
             if provider == AIProvider.OPENAI:
-                self.adapters[provider] = OpenAIAdapter(model_config)
+                self.adapters[provider] = OpenAIAdapter(model_config, self.services)
             elif provider == AIProvider.ZHIPU:
-                self.adapters[provider] = ZhipuAdapter(model_config)
+                self.adapters[provider] = ZhipuAdapter(model_config, self.services)
             elif provider == AIProvider.DEEPSEEK:
-                self.adapters[provider] = DeepSeekAdapter(model_config)
+                self.adapters[provider] = DeepSeekAdapter(model_config, self.services)
         
         logger.info(f"初始化了 {len(self.adapters)} 个AI适配器: {list(self.adapters.keys())}")
     
+    async def start(self):
+        """启动共享业务服务（预先建立数据库API会话）"""
+        await self.services.start()
+    
+    async def close(self):
+        """关闭所有适配器持有的HTTP连接池和共享业务服务"""
+        for provider, adapter in self.adapters.items():
+            try:
+                await adapter.close()
+            except Exception as e:
+                logger.warning(f"关闭适配器连接池失败 ({provider.value}): {e}")
+        await self.services.close()
+        logger.info("AI客户端连接池已关闭")
+    
     async def generate_customer_service_reply(self, customer_message: str, 
                                              preferred_provider: Optional[AIProvider] = None,
                                              conversation_history: Optional[List[Dict[str, Any]]] = None,
-                                             context_info: Optional[Dict[str, Any]] = None) -> AIResponse:
+                                             context_info: Optional[Dict[str, Any]] = None,
+                                             on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+                                             chat_id: Optional[str] = None,
+                                             on_side_effect: Optional[Callable[[List[str]], None]] = None,
+                                             on_round_start: Optional[Callable[[int], Awaitable[None]]] = None) -> AIResponse:
         """生成客服回复（支持Function Call）
         
         Args:
@@ -51,6 +87,12 @@ class AIClient:
             preferred_provider: 偏好的AI提供商
             conversation_history: 对话历史
             context_info: 上下文信息（店铺名称、联系人信息等）
+            on_delta: 流式输出回调，提供时以SSE流式请求模型，每段文本增量回调一次
+            chat_id: 聊天ID，提供时缓存该聊天的早期对话摘要，新消息到达时增量更新
+            on_side_effect: 即将执行有副作用的工具（预约、邮件）时同步回调一次，参数为这些工具名；
+                调用方应从此不再取消本次生成
+            on_round_start: 工具调用后开始新一轮模型请求时回调一次，参数为轮次（从2开始）；
+                之前各轮的流式文本不属于最终回复，调用方应清空预览
         """
         if not customer_message.strip():
             raise ValueError("客户消息不能为空")
@@ -83,99 +125,201 @@ class AIClient:
                 content = mem.get("content", "")[:30]
                 logger.info(f"  {i}. {role}: {content}...")
         
+        # 按token预算压缩对话历史：最近的消息保留原文，更早的折叠为摘要
+        compacted = self.history_compactor.compact(history_to_use, chat_id)
+        
         # 创建带有对话历史和上下文的客服提示词
-        request = adapter.create_customer_service_prompt_with_history(customer_message, history_to_use, context_info)
+        request = adapter.create_customer_service_prompt_with_history(
+            customer_message, compacted.recent, context_info, history_summary=compacted.summary
+        )
         
         logger.info(f"为客户消息生成回复，使用提供商: {provider.value}")
         logger.debug(f"客户消息: {customer_message}")
         logger.debug(f"使用对话历史: {len(history_to_use)}条记录")
         
+        # 工具循环直接在 request.messages 上追加，记录原始长度以便回退
+        original_count = len(request.messages)
+        side_effects_run: List[str] = []
+        
+        def track_side_effect(tools: List[str]):
+            side_effects_run.extend(tools)
+            if on_side_effect is not None:
+                on_side_effect(tools)
+        
         try:
-            # 第一次AI调用
-            response = await adapter.chat_completion(request)
-            
-            # 检查是否需要处理function call
-            if response.tool_calls and len(response.tool_calls) > 0:
-                logger.info(f"检测到 {len(response.tool_calls)} 个函数调用")
-                
-                # 处理函数调用
-                tool_results = []
-                for tool_call in response.tool_calls:
-                    function_name = tool_call["function"]["name"]
-                    function_args = json.loads(tool_call["function"]["arguments"])
-                    
-                    logger.info(f"执行函数: {function_name} 参数: {function_args}")
-                    
-                    if hasattr(adapter, 'execute_function_call'):
-                        result = await adapter.execute_function_call(function_name, function_args)
-                        tool_results.append({
-                            "tool_call_id": tool_call["id"],
-                            "role": "tool",
-                            "name": function_name,
-                            "content": json.dumps(result, ensure_ascii=False)
-                        })
-                    else:
-                        logger.warning(f"适配器不支持函数调用: {function_name}")
-                
-                if tool_results:
-                    # 构建包含函数调用结果的新请求
-                    follow_up_messages = request.messages.copy()
-                    
-                    # 添加助手的函数调用消息
-                    follow_up_messages.append(AIMessage(
-                        role=MessageRole.ASSISTANT, 
-                        content=response.content or ""
-                    ))
-                    
-                    # 添加函数调用结果
-                    for tool_result in tool_results:
-                        follow_up_messages.append(AIMessage(
-                            role=MessageRole.USER,  # 工具结果作为用户消息
-                            content=f"函数 {tool_result['name']} 执行结果: {tool_result['content']}"
-                        ))
-                    
-                    # 创建新的请求
-                    follow_up_request = AIRequest(
-                        messages=follow_up_messages,
-                        max_tokens=request.max_tokens,
-                        temperature=request.temperature
-                    )
-                    
-                    # 再次调用AI，让它基于函数调用结果生成最终回复
-                    logger.info("基于函数调用结果生成最终回复")
-                    final_response = await adapter.chat_completion(follow_up_request)
-                    
-                    # 合并响应信息
-                    final_response.tool_calls = response.tool_calls  # 保留原始工具调用信息
-                    return final_response
-            
-            logger.info(f"AI回复生成成功: {response.content[:100]}...")
-            return response
-            
+            return await self._run_tool_loop(adapter, request, on_delta, track_side_effect, on_round_start)
         except Exception as e:
             logger.error(f"AI回复生成失败 ({provider.value}): {e}")
-            # 尝试备用提供商
+            if side_effects_run:
+                # 预约、邮件等已经执行：保留工具调用记录，备用提供商只能据此生成文本回复，不能再次调用工具
+                logger.warning(f"已执行有副作用的工具 {side_effects_run}，备用提供商沿用工具调用记录且不再提供工具")
+                request = AIRequest(messages=request.messages, max_tokens=request.max_tokens,
+                                    temperature=request.temperature)
+            else:
+                # 备用提供商从原始对话开始，不重放失败前追加的只读工具调用和结果
+                del request.messages[original_count:]
             return await self._try_fallback_providers(request, provider)
     
-    def _select_provider(self, preferred_provider: Optional[AIProvider] = None) -> AIProvider:
-        """选择AI提供商（优先使用OpenAI）"""
-        if preferred_provider and preferred_provider in self.adapters:
-            return preferred_provider
+    async def _run_tool_loop(self, adapter: BaseAdapter, request: AIRequest,
+                             on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+                             on_side_effect: Optional[Callable[[List[str]], None]] = None,
+                             on_round_start: Optional[Callable[[int], Awaitable[None]]] = None) -> AIResponse:
+        """多轮工具调用循环
         
-        # 修改默认优先级: OpenAI > 智谱AI > Deepseek 
-        priority_order = [AIProvider.OPENAI, AIProvider.ZHIPU, AIProvider.DEEPSEEK]
+        模型每返回一轮 tool_calls 就执行并把结果追加到同一个消息列表，再次请求模型，
+        直到模型不再调用工具、达到最大轮数或超出时间预算。最后一次请求不带工具，
+        强制模型给出文本回复。提供on_delta时每轮都使用流式请求。
+        """
+        loop = asyncio.get_running_loop()
+        reply_start = loop.time()
+        deadline = reply_start + self.config.tool_time_budget
+        first_delta_ms: Optional[float] = None
+        
+        async def forward_delta(text: str):
+            nonlocal first_delta_ms
+            if first_delta_ms is None:
+                first_delta_ms = (loop.time() - reply_start) * 1000
+            await on_delta(text)
         
-        for provider in priority_order:
-            if provider in self.adapters:
-                return provider
+        streaming = on_delta is not None
+        messages = request.messages  # 每轮直接追加，不复制消息列表
+        current_request = request
+        if self.config.max_tool_rounds <= 0 and request.tools:
+            current_request = AIRequest(messages=messages, max_tokens=request.max_tokens,
+                                        temperature=request.temperature)
+        executed_tool_calls: List[Dict[str, Any]] = []
+        round_timings: List[Dict[str, Any]] = []
         
-        raise Exception("没有可用的AI提供商")
+        for round_index in range(self.config.max_tool_rounds + 1):
+            if round_index and on_round_start is not None:
+                await on_round_start(round_index + 1)
+            round_start = loop.time()
+            response = await self._complete(adapter, current_request, forward_delta if streaming else None)
+            llm_ms = (loop.time() - round_start) * 1000
+            ttft_ms = round(response.time_to_first_token, 1) if response.time_to_first_token is not None else None
+            
+            if not response.tool_calls or not hasattr(adapter, 'execute_function_call'):
+                if response.tool_calls:
+                    logger.warning(f"适配器不支持函数调用: {[tc['function']['name'] for tc in response.tool_calls]}")
+                round_timings.append({"round": round_index + 1, "llm_ms": round(llm_ms, 1), "ttft_ms": ttft_ms,
+                                      "tools_ms": 0.0, "tools": []})
+                break
+            
+            logger.info(f"第 {round_index + 1} 轮检测到 {len(response.tool_calls)} 个函数调用")
+            
+            side_effects = [tc.get("function", {}).get("name") for tc in response.tool_calls
+                            if tc.get("function", {}).get("name") in SIDE_EFFECT_TOOLS]
+            if side_effects and on_side_effect is not None:
+                on_side_effect(side_effects)
+            
+            # 并发执行相互独立的函数调用（按依赖关系排序，结果顺序与调用顺序一致）
+            tools_start = loop.time()
+            results = await self.tool_scheduler.run(response.tool_calls, adapter.execute_function_call)
+            tools_ms = (loop.time() - tools_start) * 1000
+            executed_tool_calls.extend(response.tool_calls)
+            round_timings.append({
+                "round": round_index + 1,
+                "llm_ms": round(llm_ms, 1),
+                "ttft_ms": ttft_ms,
+                "tools_ms": round(tools_ms, 1),
+                "tools": [r.name for r in results]
+            })
+            
+            # 添加助手的函数调用消息和函数调用结果
+            messages.append(AIMessage(role=MessageRole.ASSISTANT, content=response.content or ""))
+            for result in results:
+                messages.append(AIMessage(
+                    role=MessageRole.USER,  # 工具结果作为用户消息
+                    content=f"函数 {result.name} 执行结果: {result.to_content()}"
+                ))
+            
+            # 达到轮数上限或时间预算耗尽时，下一次请求不再提供工具
+            last_round = round_index + 1 >= self.config.max_tool_rounds or loop.time() >= deadline
+            if last_round:
+                logger.info(f"工具调用结束（轮数 {round_index + 1}，剩余预算 {deadline - loop.time():.1f}s），生成最终回复")
+            current_request = AIRequest(
+                messages=messages,
+                max_tokens=request.max_tokens,
+                temperature=request.temperature,
+                tools=None if last_round else request.tools
+            )
+        
+        if executed_tool_calls:
+            response.tool_calls = executed_tool_calls  # 保留所有轮次的工具调用信息
+        response.round_timings = round_timings
+        if streaming:
+            # 从开始生成回复到第一段可见文本的耗时（包含工具调用轮次）
+            response.time_to_first_token = first_delta_ms
+            if first_delta_ms is not None:
+                logger.info(f"流式回复首字耗时: {first_delta_ms:.0f}ms")
+        logger.info(f"AI回复生成成功 ({len(round_timings)} 轮): {(response.content or '')[:100]}...")
+        return response
     
-    async def _try_fallback_providers(self, request: AIRequest, failed_provider: AIProvider) -> AIResponse:
-        """尝试备用提供商"""
-        available_providers = [p for p in self.adapters.keys() if p != failed_provider]
+    async def _complete(self, adapter: BaseAdapter, request: AIRequest,
+                        on_delta: Optional[Callable[[str], Awaitable[None]]] = None) -> AIResponse:
+        """执行单次模型请求，开启对冲时在主提供商变慢或失败时并行请求下一个提供商"""
+        provider = next((p for p, a in self.adapters.items() if a is adapter), None)
+        streaming = on_delta is not None
+        
+        def attempt_for(target: BaseAdapter):
+            def attempt(delta_callback):
+                if streaming:
+                    return target.stream_chat_completion(request, delta_callback)
+                return target.chat_completion(request)
+            return attempt
+        
+        if provider is None or not self.hedge_policy.enabled or len(self.adapters) < 2:
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            response = await attempt_for(adapter)(on_delta)
+            if provider is not None:
+                self.latency.record(provider, response, (loop.time() - start) * 1000, streaming)
+            return response
+        
+        attempts = [(provider, attempt_for(adapter))] + [
+            (other, attempt_for(self.adapters[other])) for other in self._fallback_order(provider)
+        ]
+        hedged = HedgedRequest(self.hedge_policy, self.latency, on_delta)
+        self.hedge_stats["requests"] += 1
+        try:
+            return await hedged.run(attempts)
+        finally:
+            if hedged.stats["hedged"]:
+                self.hedge_stats["hedged"] += 1
+            winner = hedged.stats["winner"]
+            if winner:
+                self.hedge_stats["wins"][winner] = self.hedge_stats["wins"].get(winner, 0) + 1
+    
+    def _select_provider(self, preferred_provider: Optional[AIProvider] = None) -> AIProvider:
+        """选择AI提供商（按健康分排序，健康分相同时优先使用OpenAI）"""
+        if preferred_provider and preferred_provider in self.adapters:
+            if self._health_score(preferred_provider) > 0:
+                return preferred_provider
+            logger.warning(f"偏好的提供商 {preferred_provider.value} 处于熔断状态，改用其他提供商")
         
-        for provider in available_providers:
+        ranked = self._rank_providers()
+        if not ranked:
+            raise Exception("没有可用的AI提供商")
+        return ranked[0]
+    
+    def _rank_providers(self) -> List[AIProvider]:
+        """按健康分从高到低排列可用提供商，健康分相同时按默认优先级"""
+        def priority(provider: AIProvider) -> int:
+            return PROVIDER_PRIORITY.index(provider) if provider in PROVIDER_PRIORITY else len(PROVIDER_PRIORITY)
+        return sorted(self.adapters, key=lambda p: (-self._health_score(p), priority(p)))
+    
+    def _health_score(self, provider: AIProvider) -> float:
+        """提供商健康分（0~1），没有熔断器的适配器视为健康"""
+        breaker = getattr(self.adapters[provider], "breaker", None)
+        return breaker.health_score() if breaker else 1.0
+    
+    def _fallback_order(self, primary: AIProvider) -> List[AIProvider]:
+        """主提供商之外、未熔断的可用提供商，按健康分排列"""
+        return [p for p in self._rank_providers() if p != primary and self._health_score(p) > 0]
+    
+    async def _try_fallback_providers(self, request: AIRequest, failed_provider: AIProvider) -> AIResponse:
+        """尝试备用提供商（跳过处于熔断状态的提供商）"""
+        for provider in self._fallback_order(failed_provider):
             try:
                 logger.info(f"尝试备用提供商: {provider.value}")
                 adapter = self.adapters[provider]
@@ -269,6 +413,7 @@ class AIClient:
 
     def get_status(self) -> Dict[str, Any]:
         """获取客户端状态"""
+        database_cache = getattr(self.services.database_service, "cache", None)
         return {
             "available_providers": [p.value for p in self.adapters.keys()],
             "total_providers": len(self.adapters),
@@ -278,5 +423,20 @@ class AIClient:
             "function_call_enabled": any(
                 getattr(adapter, 'supports_function_calling', False) 
                 for adapter in self.adapters.values()
-            )
+            ),
+            "database_cache": database_cache.get_stats() if database_cache else {},
+            "latency": self.latency.get_stats(),
+            "history_compaction": self.history_compactor.get_stats(),
+            "tools": TOOL_DISPATCHER.get_stats(),
+            "circuit_breakers": {
+                p.value: adapter.breaker.get_stats()
+                for p, adapter in self.adapters.items() if hasattr(adapter, "breaker")
+            },
+            "hedging": {
+                "enabled": self.hedge_policy.enabled,
+                "delays": {
+                    p.value: self.hedge_policy.delay_for(self.latency.total.get(p)) for p in self.adapters
+                },
+                **self.hedge_stats
+            }
         } 
\ No newline at end of file
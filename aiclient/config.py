@@ -27,6 +27,18 @@ class ModelConfig:
     temperature: float = 0.7
     max_retries: int = 3
     timeout: int = 30
+    # HTTP连接池配置（每个提供商独立的长连接池）
+    pool_limit: int = 20
+    pool_limit_per_host: int = 10
+    keepalive_timeout: float = 60.0
+    dns_cache_ttl: int = 300
+    # 熔断器配置
+    breaker_failure_rate: float = 0.5
+    breaker_slow_call_ms: float = 20000.0
+    breaker_slow_call_rate: float = 0.8
+    breaker_min_calls: int = 5
+    breaker_window: int = 20
+    breaker_open_seconds: float = 30.0
 
 
 class AIConfig:
@@ -34,6 +46,12 @@ class AIConfig:
     
     def __init__(self):
         self.models: Dict[AIProvider, ModelConfig] = {}
+        self.max_tool_rounds: int = 4  # 单次回复最多执行的工具调用轮数
+        self.tool_time_budget: float = 25.0  # 单次回复的工具调用总时间预算（秒）
+        self.hedge_settings: Dict[str, Any] = {}  # 跨提供商对冲请求配置
+        self.history_token_budget: int = 1500  # 对话历史（摘要 + 原文）的token预算
+        self.history_summary_tokens: int = 300  # 其中早期对话摘要的token上限
+        self.history_min_recent: int = 6  # 至少保留原文的最近消息条数
         self._load_config()
     
     def _load_config(self):
@@ -60,6 +78,15 @@ class AIConfig:
                 abs_path = os.path.abspath(path)
                 print(f"  - {abs_path} {'[存在]' if os.path.exists(abs_path) else '[不存在]'}")
         
+        # 连接池和熔断器参数所有提供商共用
+        adapter_settings = {**self._load_pool_settings(), **self._load_breaker_settings()}
+        self.max_tool_rounds = int(os.getenv("AI_MAX_TOOL_ROUNDS", str(self.max_tool_rounds)))
+        self.tool_time_budget = float(os.getenv("AI_TOOL_TIME_BUDGET", str(self.tool_time_budget)))
+        self.hedge_settings = self._load_hedge_settings()
+        self.history_token_budget = int(os.getenv("AI_HISTORY_TOKEN_BUDGET", str(self.history_token_budget)))
+        self.history_summary_tokens = int(os.getenv("AI_HISTORY_SUMMARY_TOKENS", str(self.history_summary_tokens)))
+        self.history_min_recent = int(os.getenv("AI_HISTORY_MIN_RECENT", str(self.history_min_recent)))
+        
         # 智谱AI配置
         zhipu_key = os.getenv("ZHIPU_API_KEY")
         if zhipu_key:
@@ -69,7 +96,8 @@ class AIConfig:
                 api_key=zhipu_key,
                 base_url="https://open.bigmodel.cn/api/paas/v4/",
                 max_tokens=int(os.getenv("ZHIPU_MAX_TOKENS", "1000")),
-                temperature=float(os.getenv("ZHIPU_TEMPERATURE", "0.7"))
+                temperature=float(os.getenv("ZHIPU_TEMPERATURE", "0.7")),
+                **adapter_settings
             )
         
         # Deepseek配置
@@ -81,7 +109,8 @@ class AIConfig:
                 api_key=deepseek_key,
                 base_url="https://api.deepseek.com/v1/",
                 max_tokens=int(os.getenv("DEEPSEEK_MAX_TOKENS", "1000")),
-                temperature=float(os.getenv("DEEPSEEK_TEMPERATURE", "0.7"))
+                temperature=float(os.getenv("DEEPSEEK_TEMPERATURE", "0.7")),
+                **adapter_settings
             )
         
         # OpenAI配置
@@ -93,9 +122,41 @@ class AIConfig:
                 api_key=openai_key,
                 base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai-next.com/v1"),
                 max_tokens=int(os.getenv("OPENAI_MAX_TOKENS", "1000")),
-                temperature=float(os.getenv("OPENAI_TEMPERATURE", "0.7"))
+                temperature=float(os.getenv("OPENAI_TEMPERATURE", "0.7")),
+                **adapter_settings
             )
 
+    def _load_pool_settings(self) -> Dict[str, Any]:
+        """从环境变量加载HTTP连接池配置（所有提供商共用同一套参数）"""
+        return {
+            "pool_limit": int(os.getenv("AI_POOL_LIMIT", "20")),
+            "pool_limit_per_host": int(os.getenv("AI_POOL_LIMIT_PER_HOST", "10")),
+            "keepalive_timeout": float(os.getenv("AI_KEEPALIVE_TIMEOUT", "60")),
+            "dns_cache_ttl": int(os.getenv("AI_DNS_CACHE_TTL", "300")),
+        }
+    
+    def _load_breaker_settings(self) -> Dict[str, Any]:
+        """从环境变量加载熔断器配置（每个提供商独立计数，参数共用）"""
+        return {
+            "breaker_failure_rate": float(os.getenv("AI_BREAKER_FAILURE_RATE", "0.5")),
+            "breaker_slow_call_ms": float(os.getenv("AI_BREAKER_SLOW_CALL_MS", "20000")),
+            "breaker_slow_call_rate": float(os.getenv("AI_BREAKER_SLOW_CALL_RATE", "0.8")),
+            "breaker_min_calls": int(os.getenv("AI_BREAKER_MIN_CALLS", "5")),
+            "breaker_window": int(os.getenv("AI_BREAKER_WINDOW", "20")),
+            "breaker_open_seconds": float(os.getenv("AI_BREAKER_OPEN_SECONDS", "30")),
+        }
+    
+    def _load_hedge_settings(self) -> Dict[str, Any]:
+        """从环境变量加载对冲请求配置"""
+        return {
+            "enabled": os.getenv("AI_HEDGING", "false").lower() == "true",
+            "percentile": float(os.getenv("AI_HEDGE_PERCENTILE", "0.95")),
+            "default_delay": float(os.getenv("AI_HEDGE_DELAY", "3.0")),
+            "min_delay": float(os.getenv("AI_HEDGE_MIN_DELAY", "0.5")),
+            "max_delay": float(os.getenv("AI_HEDGE_MAX_DELAY", "10.0")),
+            "min_samples": int(os.getenv("AI_HEDGE_MIN_SAMPLES", "20")),
+            "max_attempts": int(os.getenv("AI_HEDGE_MAX_ATTEMPTS", "2")),
+        }
     
     def get_model_config(self, provider: AIProvider) -> Optional[ModelConfig]:
         """获取指定提供商的模型配置"""
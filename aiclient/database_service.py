@@ -4,38 +4,192 @@
 """
 
 import aiohttp
+import asyncio
+import copy
 import logging
-from typing import List, Dict, Any, Optional
+import time
+from collections import OrderedDict
+from urllib.parse import quote
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Tuple
 from datetime import datetime, timedelta
 
+from . import serialization
+
 logger = logging.getLogger(__name__)
 
 
+# 各GET端点的缓存有效期（秒）；门店和技师名单一天只变动几次
+DEFAULT_CACHE_TTLS: Dict[str, float] = {
+    "/client/stores": 600.0,
+    "/client/therapists/search": 300.0,
+}
+
+# 批量排班查询的最大并发请求数
+DEFAULT_SCHEDULE_CONCURRENCY = 8
+
+# 营业时段（与Node端 therapistService.getTherapistSchedule 保持一致：9:00-21:00 每小时一个时段）
+BUSINESS_SLOTS = [f"{hour:02d}:00" for hour in range(9, 21)]
+
+
+class _LoadCancelled(Exception):
+    """发起加载的任务被取消，等待同一加载的其他调用方应重新加载"""
+
+
+class AsyncTTLCache:
+    """
+    异步读穿缓存：按条目TTL过期、LRU淘汰，并合并并发的相同请求（single-flight）
+    - 加载失败或结果为空时不写入缓存
+    - 返回值为缓存内容的副本，调用方修改不影响缓存
+    - invalidate() 之前开始的加载不会把结果写入缓存
+    """
+    
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+        self._generation = 0  # 每次 invalidate 加一
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.retries = 0
+    
+    async def get_or_load(self, key: Tuple, ttl: float,
+                          loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        读取缓存，未命中时调用loader加载并写入缓存
+        
+        Args:
+            key: 缓存键
+            ttl: 有效期（秒）
+            loader: 加载数据的协程函数，抛出异常时不写入缓存
+        """
+        while True:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(value)
+                del self._entries[key]
+            
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                return await self._load(key, ttl, loader)
+            self.coalesced += 1
+            try:
+                return copy.deepcopy(await asyncio.shield(inflight))
+            except _LoadCancelled:
+                # 只是发起加载的任务被取消，本调用方没有被取消，重新查询/加载
+                self.retries += 1
+    
+    async def _load(self, key: Tuple, ttl: float, loader: Callable[[], Awaitable[Any]]) -> Any:
+        self.misses += 1
+        generation = self._generation
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.set_exception(_LoadCancelled())
+            future.exception()  # 标记异常已读取，避免无人等待时的告警
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        else:
+            # 等待同一加载的调用方拿到的是与缓存相同的快照，不受本调用方后续修改影响
+            snapshot = copy.deepcopy(value)
+            future.set_result(snapshot)
+            if value and generation == self._generation:
+                self._store(key, ttl, snapshot)
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+    
+    def _store(self, key: Tuple, ttl: float, value: Any):
+        """写入缓存并按LRU淘汰超出容量的条目"""
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def invalidate(self, endpoint_prefix: Optional[str] = None) -> int:
+        """
+        使缓存失效
+        
+        Args:
+            endpoint_prefix: 只清除该端点前缀的条目，为空时清除全部
+            
+        Returns:
+            清除的条目数
+        """
+        if endpoint_prefix is None:
+            keys = list(self._entries)
+        else:
+            keys = [k for k in self._entries if k[0].startswith(endpoint_prefix)]
+        for key in keys:
+            del self._entries[key]
+        # 进行中的加载可能读到了失效前的数据：结果不再写入缓存，之后的请求也不再合并到这些加载上
+        self._generation += 1
+        for key in [k for k in self._inflight if endpoint_prefix is None or k[0].startswith(endpoint_prefix)]:
+            del self._inflight[key]
+        self.invalidations += 1
+        return len(keys)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "retries": self.retries,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0
+        }
+
+
 class DatabaseAPIService:
     """数据库API服务类 - 为AI功能调用提供数据接口"""
     
-    def __init__(self, base_url: str = "http://localhost:3001"):
+    def __init__(self, base_url: str = "http://localhost:3001",
+                 cache_ttls: Optional[Dict[str, float]] = None,
+                 cache_max_entries: int = 256):
         """
         初始化数据库API服务
         
         Args:
             base_url: API服务器基础URL
+            cache_ttls: 各GET端点的缓存有效期（秒），为空时使用默认配置，传入{}禁用缓存
+            cache_max_entries: 缓存最大条目数
         """
         self.base_url = base_url.rstrip('/')
         self.api_base = f"{self.base_url}/api/v1"  # 使用v1版本API
         self.session = None
+        self.cache_ttls = DEFAULT_CACHE_TTLS if cache_ttls is None else cache_ttls
+        self.cache = AsyncTTLCache(cache_max_entries)
         self.logger = logger.getChild(self.__class__.__name__)
     
     async def _ensure_session(self):
         """确保HTTP会话存在"""
         if not self.session:
             self.session = aiohttp.ClientSession(
-                timeout=aiohttp.ClientTimeout(total=10)
+                timeout=aiohttp.ClientTimeout(total=10),
+                json_serialize=serialization.dumps
             )
     
     async def _make_request(self, endpoint: str, params: Dict = None) -> List[Dict[str, Any]]:
         """
-        发送HTTP请求到API服务器
+        发送HTTP请求到API服务器（门店、技师查询走读穿缓存）
         
         Args:
             endpoint: API端点
@@ -44,29 +198,38 @@ class DatabaseAPIService:
         Returns:
             API响应数据
         """
-        await self._ensure_session()
-        url = f"{self.api_base}{endpoint}"
-        
+        ttl = self.cache_ttls.get(endpoint)
         try:
-            async with self.session.get(url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    # 处理新API结构的响应
-                    if isinstance(data, dict):
-                        if 'success' in data and data['success'] and 'data' in data:
-                            # 新API格式：{"success": true, "data": {...}}
-                            return data['data']
-                        elif 'data' in data:
-                            # 旧API格式兼容
-                            return data['data']
-                    return data if isinstance(data, list) else []
-                else:
-                    self.logger.error(f"API请求失败: {url}, 状态码: {response.status}")
-                    return []
+            if ttl:
+                key = (endpoint, tuple(sorted((params or {}).items())))
+                return await self.cache.get_or_load(key, ttl, lambda: self._fetch(endpoint, params))
+            return await self._fetch(endpoint, params)
         except Exception as e:
-            self.logger.error(f"API请求异常: {url}, 错误: {e}")
+            self.logger.error(f"API请求异常: {self.api_base}{endpoint}, 错误: {e}")
             return []
     
+    async def _fetch(self, endpoint: str, params: Dict = None) -> List[Dict[str, Any]]:
+        """发送GET请求并解析响应，请求失败时抛出异常（失败结果不会被缓存）"""
+        await self._ensure_session()
+        url = f"{self.api_base}{endpoint}"
+        
+        async with self.session.get(url, params=params) as response:
+            if response.status != 200:
+                raise Exception(f"API请求失败: {url}, 状态码: {response.status}")
+            data = await response.json(loads=serialization.loads)
+            # 处理新API结构的响应
+            if isinstance(data, dict):
+                if data.get('success') is False:
+                    # 失败响应不能当作数据返回，更不能被缓存
+                    raise Exception(f"API返回失败: {url}, {data.get('error') or data.get('message')}")
+                if 'success' in data and data['success'] and 'data' in data:
+                    # 新API格式：{"success": true, "data": {...}}
+                    return data['data']
+                elif 'data' in data:
+                    # 旧API格式兼容
+                    return data['data']
+            return data if isinstance(data, list) else []
+    
     async def _make_post_request(self, endpoint: str, data: Dict) -> Dict[str, Any]:
         """
         发送POST请求到API服务器
@@ -83,7 +246,7 @@ class DatabaseAPIService:
         
         try:
             async with self.session.post(url, json=data) as response:
-                result = await response.json()
+                result = await response.json(loads=serialization.loads)
                 if response.status == 200:
                     return result
                 else:
@@ -151,14 +314,22 @@ class DatabaseAPIService:
     
     async def search_therapists(self, store_name: Optional[str] = None,
                               therapist_name: Optional[str] = None,
-                              store_id: Optional[int] = None) -> List[Dict[str, Any]]:
+                              store_id: Optional[int] = None,
+                              specialty: Optional[str] = None,
+                              min_experience: Optional[int] = None,
+                              page: Optional[int] = None,
+                              limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """
-        搜索技师信息（新版本接口）
+        搜索技师信息（新版本接口，专长/经验/分页条件由API服务器过滤）
         
         Args:
             store_name: 门店名称 (可选)
             therapist_name: 技师姓名 (可选)
             store_id: 门店ID (可选)
+            specialty: 专长关键词 (可选)
+            min_experience: 最少从业年限 (可选)
+            page: 页码 (可选)
+            limit: 每页数量 (可选)
             
         Returns:
             技师列表
@@ -175,6 +346,14 @@ class DatabaseAPIService:
             params['store_id'] = store_id
         if therapist_name:
             params['name'] = therapist_name
+        if specialty:
+            params['specialty'] = specialty
+        if min_experience:
+            params['min_experience'] = min_experience
+        if page:
+            params['page'] = page
+        if limit:
+            params['limit'] = limit
             
         self.logger.info(f"搜索技师: {params}")
         therapists_data = await self._make_request("/client/therapists/search", params)
@@ -247,10 +426,35 @@ class DatabaseAPIService:
         
         return []
     
+    @staticmethod
+    def _date_range(start_date: str, end_date: str) -> List[str]:
+        """生成闭区间内的日期列表 (YYYY-MM-DD)"""
+        current_date = datetime.strptime(start_date, '%Y-%m-%d')
+        end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
+        dates = []
+        while current_date <= end_date_obj:
+            dates.append(current_date.strftime('%Y-%m-%d'))
+            current_date += timedelta(days=1)
+        return dates
+    
+    @staticmethod
+    async def _gather_bounded(coros: List[Awaitable[Any]], limit: int) -> List[Any]:
+        """并发执行协程，同时运行的数量不超过limit，结果顺序与输入一致"""
+        semaphore = asyncio.Semaphore(max(1, limit))
+        
+        async def run(coro):
+            async with semaphore:
+                return await coro
+        
+        return await asyncio.gather(*(run(coro) for coro in coros))
+    
     async def query_technician_schedule(self, technician_id: int, 
                                        start_date: str, end_date: str) -> List[Dict[str, Any]]:
         """
-        查询技师排班信息
+        查询技师排班信息（多天并发查询）
+        
+        不经过 get_availability_matrix：这里需要返回每天完整的排班和已约时段，
+        矩阵只保留可用时段，且没有门店时也无法使用批量接口。
         
         Args:
             technician_id: 技师ID
@@ -260,20 +464,94 @@ class DatabaseAPIService:
         Returns:
             排班信息列表
         """
-        # 使用新的技师排班API
-        schedule_list = []
-        current_date = datetime.strptime(start_date, '%Y-%m-%d')
-        end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
-        
-        while current_date <= end_date_obj:
-            date_str = current_date.strftime('%Y-%m-%d')
-            schedule = await self.get_therapist_schedule(technician_id, date_str)
-            schedule_list.append(schedule)
-            current_date += timedelta(days=1)
+        dates = self._date_range(start_date, end_date)
+        schedule_list = await self._gather_bounded(
+            [self.get_therapist_schedule(technician_id, date_str) for date_str in dates],
+            DEFAULT_SCHEDULE_CONCURRENCY
+        )
         
         self.logger.info(f"查询到 {len(schedule_list)} 条排班记录")
         return schedule_list
     
+    async def get_availability_matrix(self, start_date: str, end_date: Optional[str] = None,
+                                      store_id: Optional[int] = None,
+                                      store_name: Optional[str] = None,
+                                      therapist_ids: Optional[List[int]] = None,
+                                      max_concurrency: int = DEFAULT_SCHEDULE_CONCURRENCY) -> Dict[str, Any]:
+        """
+        批量查询门店 × 技师 × 时段的可预约矩阵
+        
+        优先使用门店批量接口 /client/stores/:storeName/therapists-schedule（一次请求），
+        批量接口不可用时退回到按技师、按日期并发查询单个排班（并发数受max_concurrency限制）。
+        
+        Args:
+            start_date: 开始日期 (YYYY-MM-DD)
+            end_date: 结束日期 (YYYY-MM-DD)，默认与开始日期相同
+            store_id: 门店ID (可选)
+            store_name: 门店名称 (可选，与store_id二选一)
+            therapist_ids: 只查询这些技师 (可选)
+            max_concurrency: 退回逐个查询时的最大并发数
+            
+        Returns:
+            {"store": {...}, "dates": [...], "therapists": [{"id", "name", "available": {日期: [时段]}}], "source": "bulk"|"per_day"}
+        """
+        dates = self._date_range(start_date, end_date or start_date)
+        store = None
+        if store_name or store_id:
+            stores = await self.get_stores()
+            for candidate in stores:
+                if (store_id and candidate.get('id') == store_id) or \
+                        (store_name and not store_id and store_name in candidate.get('name', '')):
+                    store = candidate
+                    break
+        
+        wanted = set(therapist_ids) if therapist_ids else None
+        
+        # 1. 门店批量接口：一次返回所有技师的预约，在本地计算可用时段
+        if store and store.get('name'):
+            bulk = await self._make_request(f"/client/stores/{quote(store['name'], safe='')}/therapists-schedule")
+            if isinstance(bulk, dict) and isinstance(bulk.get('therapists'), list):
+                therapists = []
+                for therapist in bulk['therapists']:
+                    if wanted and therapist.get('id') not in wanted:
+                        continue
+                    booked: Dict[str, set] = {}
+                    for apt in therapist.get('appointments', []):
+                        booked.setdefault(str(apt.get('date', ''))[:10], set()).add(str(apt.get('start_time', ''))[:5])
+                    therapists.append({
+                        "id": therapist.get('id'),
+                        "name": therapist.get('name'),
+                        "available": {
+                            date: [slot for slot in BUSINESS_SLOTS if slot not in booked.get(date, ())]
+                            for date in dates
+                        }
+                    })
+                self.logger.info(f"批量接口查询到 {len(therapists)} 位技师 × {len(dates)} 天的排班")
+                return {"store": bulk.get('store', store), "dates": dates, "therapists": therapists, "source": "bulk"}
+        
+        # 2. 退回：并发查询每位技师每天的排班
+        if wanted and not store:
+            therapists = [{"id": therapist_id, "name": None} for therapist_id in therapist_ids]
+        else:
+            therapists = await self.search_therapists(store_id=store['id'] if store else store_id)
+            if wanted:
+                therapists = [t for t in therapists if t.get('id') in wanted]
+        
+        pairs = [(therapist, date) for therapist in therapists for date in dates]
+        schedules = await self._gather_bounded(
+            [self.get_therapist_schedule(therapist['id'], date) for therapist, date in pairs],
+            max_concurrency
+        )
+        matrix: Dict[Any, Dict[str, Any]] = {}
+        for (therapist, date), schedule in zip(pairs, schedules):
+            entry = matrix.setdefault(therapist['id'], {
+                "id": therapist['id'], "name": therapist.get('name'), "available": {}
+            })
+            entry["available"][date] = schedule.get('available_times', [])
+        
+        self.logger.info(f"并发查询 {len(pairs)} 个技师排班（并发上限 {max_concurrency}）")
+        return {"store": store, "dates": dates, "therapists": list(matrix.values()), "source": "per_day"}
+    
     async def query_available_appointments(self, date: str, 
                                          store_id: Optional[int] = None,
                                          technician_id: Optional[int] = None) -> List[Dict[str, Any]]:
@@ -293,13 +571,12 @@ class DatabaseAPIService:
             schedule = await self.get_therapist_schedule(technician_id, date)
             return schedule.get('available_times', [])
         
-        # 否则查询门店的所有技师
+        # 否则批量查询门店的所有技师
         if store_id:
-            therapists = await self.search_therapists(store_id=store_id)
+            matrix = await self.get_availability_matrix(date, store_id=store_id)
             available_slots = []
-            for therapist in therapists:
-                schedule = await self.get_therapist_schedule(therapist['id'], date)
-                for time_slot in schedule.get('available_times', []):
+            for therapist in matrix['therapists']:
+                for time_slot in therapist['available'].get(date, []):
                     available_slots.append({
                         'therapist_id': therapist['id'],
                         'therapist_name': therapist['name'],
@@ -325,6 +602,7 @@ class DatabaseAPIService:
         
         if result.get('success'):
             self.logger.info(f"预约创建成功: {result.get('data', {}).get('id', 'N/A')}")
+            self.cache.invalidate()
             return {"success": True, "data": result.get('data', {})}
         else:
             self.logger.error(f"预约创建失败: {result}")
@@ -345,6 +623,7 @@ class DatabaseAPIService:
         
         if result.get('success'):
             self.logger.info(f"智能预约创建成功: {result.get('data', {}).get('id', 'N/A')}")
+            self.cache.invalidate()
             return {
                 "success": True, 
                 "data": result.get('data', {}),
@@ -395,7 +674,7 @@ class DatabaseAPIService:
         try:
             async with self.session.get(url) as response:
                 if response.status == 200:
-                    result = await response.json()
+                    result = await response.json(loads=serialization.loads)
                     if result.get('success') and result.get('data'):
                         return result['data']
                     return result
@@ -423,9 +702,10 @@ class DatabaseAPIService:
         
         try:
             async with self.session.delete(url, json=data) as response:
-                result = await response.json()
+                result = await response.json(loads=serialization.loads)
                 if response.status == 200 and result.get('success'):
                     self.logger.info(f"预约取消成功: {appointment_id}")
+                    self.cache.invalidate()
                     return {"success": True, "data": result.get('data', {})}
                 else:
                     self.logger.error(f"预约取消失败: {result}")
@@ -0,0 +1,234 @@
+"""
+对冲请求（Hedged Requests）
+主提供商在按历史延迟推算的等待时间（默认p95）内没有返回时，向下一个提供商发出同样的请求，
+取最先成功的结果并取消其余请求；主提供商直接失败时立即切换，不再等待重试退避。
+"""
+
+import asyncio
+import bisect
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from .config import AIProvider
+from .models import AIResponse
+
+logger = logging.getLogger(__name__)
+
+
+# 延迟直方图桶上界（毫秒），按约1.5倍递增，覆盖100ms~60s
+DEFAULT_BUCKET_BOUNDS_MS: Tuple[float, ...] = (
+    100, 150, 250, 400, 600, 800, 1000, 1500, 2000, 3000, 4000, 5000,
+    6000, 8000, 10000, 12000, 15000, 20000, 25000, 30000, 45000, 60000,
+)
+
+
+class LatencyHistogram:
+    """滑动窗口延迟直方图
+
+    只统计最近 window 个样本：新样本入桶，最旧样本出桶，分位数按桶上界估算。
+    """
+
+    def __init__(self, window: int = 200, bounds_ms: Sequence[float] = DEFAULT_BUCKET_BOUNDS_MS):
+        self.bounds_ms = tuple(bounds_ms)
+        self.counts: List[int] = [0] * (len(self.bounds_ms) + 1)  # 最后一个桶为溢出桶
+        self.samples: Deque[Tuple[int, float]] = deque()
+        self.window = window
+        self.total_count = 0
+
+    def observe(self, latency_ms: float):
+        """记录一次延迟（毫秒）"""
+        bucket = bisect.bisect_left(self.bounds_ms, latency_ms)
+        self.counts[bucket] += 1
+        self.samples.append((bucket, latency_ms))
+        self.total_count += 1
+        if len(self.samples) > self.window:
+            old_bucket, _ = self.samples.popleft()
+            self.counts[old_bucket] -= 1
+
+    @property
+    def count(self) -> int:
+        """窗口内样本数"""
+        return len(self.samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """估算分位数（毫秒），窗口为空时返回None"""
+        if not self.samples:
+            return None
+        rank = max(1, int(q * len(self.samples) + 0.999999))
+        seen = 0
+        for bucket, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                if bucket < len(self.bounds_ms):
+                    return float(self.bounds_ms[bucket])
+                return max(latency for _, latency in self.samples)  # 溢出桶取实际最大值
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            "count": self.count,
+            "total_count": self.total_count,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+        }
+
+
+@dataclass
+class HedgePolicy:
+    """对冲策略"""
+    enabled: bool = False
+    percentile: float = 0.95     # 用于推算对冲等待时间的分位数
+    default_delay: float = 3.0   # 样本不足时的对冲等待时间（秒）
+    min_delay: float = 0.5
+    max_delay: float = 10.0
+    min_samples: int = 20        # 至少积累多少个样本才使用直方图
+    max_attempts: int = 2        # 单次请求最多同时发给几个提供商（含主提供商）
+
+    def delay_for(self, histogram: Optional[LatencyHistogram]) -> float:
+        """根据提供商的延迟直方图计算对冲等待时间（秒）"""
+        if histogram is None or histogram.count < self.min_samples:
+            return self.default_delay
+        estimate = histogram.percentile(self.percentile)
+        if estimate is None:
+            return self.default_delay
+        return min(self.max_delay, max(self.min_delay, estimate / 1000))
+
+
+class LatencyTracker:
+    """按提供商记录的延迟直方图
+
+    非流式请求记录完整响应耗时，流式请求记录首字耗时，两者分别驱动对应模式下的对冲等待时间。
+    """
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self.total: Dict[AIProvider, LatencyHistogram] = {}
+        self.first_token: Dict[AIProvider, LatencyHistogram] = {}
+
+    def histogram(self, provider: AIProvider, streaming: bool = False) -> LatencyHistogram:
+        """获取（必要时创建）提供商的延迟直方图"""
+        histograms = self.first_token if streaming else self.total
+        if provider not in histograms:
+            histograms[provider] = LatencyHistogram(self.window)
+        return histograms[provider]
+
+    def record(self, provider: AIProvider, response: AIResponse, elapsed_ms: float, streaming: bool = False):
+        """记录一次成功请求的延迟"""
+        self.histogram(provider).observe(elapsed_ms)
+        if streaming and response.time_to_first_token is not None:
+            self.histogram(provider, streaming=True).observe(response.time_to_first_token)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        providers = set(self.total) | set(self.first_token)
+        return {
+            provider.value: {
+                "total": self.total[provider].get_stats() if provider in self.total else {},
+                "first_token": self.first_token[provider].get_stats() if provider in self.first_token else {},
+            }
+            for provider in providers
+        }
+
+
+# 单个提供商的请求：接收（可能为None的）流式回调，返回响应
+Attempt = Callable[[Optional[Callable[[str], Awaitable[None]]]], Awaitable[AIResponse]]
+
+
+class HedgedRequest:
+    """一次对冲请求的执行过程
+
+    流式模式下以首字到达作为胜出条件：最先输出文本的提供商获得输出权，其余请求立即取消，
+    未获得输出权的请求产生的文本不会转发给调用方。
+    """
+
+    def __init__(self, policy: HedgePolicy, tracker: LatencyTracker,
+                 on_delta: Optional[Callable[[str], Awaitable[None]]] = None):
+        self.policy = policy
+        self.tracker = tracker
+        self.on_delta = on_delta
+        self.streaming = on_delta is not None
+        self.tasks: Dict[AIProvider, asyncio.Task] = {}
+        self.owner: Optional[AIProvider] = None  # 流式模式下获得输出权的提供商
+        self.stats = {"hedged": False, "winner": None, "attempts": []}
+
+    async def run(self, attempts: List[Tuple[AIProvider, Attempt]]) -> AIResponse:
+        """
+        按顺序启动各提供商的请求
+
+        Args:
+            attempts: (提供商, 请求函数) 列表，按优先级排列
+
+        Returns:
+            最先成功的响应
+        """
+        attempts = attempts[:max(1, self.policy.max_attempts)]
+        loop = asyncio.get_running_loop()
+        pending: Dict[asyncio.Task, AIProvider] = {}
+        last_error: Optional[BaseException] = None
+        next_index = 0
+
+        try:
+            while True:
+                if next_index < len(attempts) and (not pending or self.owner is None):
+                    provider, attempt = attempts[next_index]
+                    next_index += 1
+                    if pending:
+                        self.stats["hedged"] = True
+                        logger.info(f"主请求未在对冲等待时间内返回，对冲请求提供商: {provider.value}")
+                    task = asyncio.ensure_future(self._timed(provider, attempt, loop.time()))
+                    self.tasks[provider] = task
+                    pending[task] = provider
+                    self.stats["attempts"].append(provider.value)
+
+                # 流式已有提供商获得输出权，或已无可对冲的提供商时，一直等待到有请求结束
+                if self.owner is not None or next_index >= len(attempts):
+                    timeout = None
+                else:
+                    timeout = self.policy.delay_for(
+                        self.tracker.histogram(pending[next(iter(pending))], self.streaming)
+                    )
+
+                done, _ = await asyncio.wait(list(pending), timeout=timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    provider = pending.pop(task)
+                    if task.cancelled():
+                        continue  # 流式模式下输给其他提供商被取消
+                    if task.exception() is None:
+                        self.stats["winner"] = provider.value
+                        return task.result()
+                    last_error = task.exception()
+                    logger.warning(f"对冲请求失败 ({provider.value}): {last_error}")
+                    if self.owner == provider:
+                        # 已输出部分文本的提供商失败，无法无缝切换到其他提供商
+                        raise last_error
+
+                if not pending and next_index >= len(attempts):
+                    raise last_error or Exception("所有AI提供商都失败了")
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _timed(self, provider: AIProvider, attempt: Attempt, start: float) -> AIResponse:
+        """执行单个提供商的请求并记录延迟"""
+        loop = asyncio.get_running_loop()
+        response = await attempt(self._gated_delta(provider) if self.streaming else None)
+        self.tracker.record(provider, response, (loop.time() - start) * 1000, self.streaming)
+        return response
+
+    def _gated_delta(self, provider: AIProvider) -> Callable[[str], Awaitable[None]]:
+        """只有获得输出权的提供商的文本增量才会转发"""
+        async def forward(text: str):
+            if self.owner is None:
+                self.owner = provider
+                for other, task in self.tasks.items():
+                    if other != provider and not task.done():
+                        logger.info(f"流式对冲: {provider.value} 先输出，取消 {other.value}")
+                        task.cancel()
+            if self.owner == provider:
+                await self.on_delta(text)
+        return forward
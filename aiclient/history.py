@@ -0,0 +1,189 @@
+"""
+对话历史压缩
+在token预算内保留最近的对话原文，更早的对话折叠为按聊天缓存的滚动摘要：
+有新消息被挤出原文窗口时只把这部分消息增量并入摘要，不重新处理整段历史。
+"""
+
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from .prompts import MESSAGE_TOKEN_OVERHEAD, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+SUMMARY_LINE_CHARS = 60      # 摘要中每条消息保留的最大字符数
+TRUNCATED_MARKER = "（更早的对话已省略）"
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    """估算单条历史消息的token数"""
+    return estimate_tokens(str(message.get("content") or "")) + MESSAGE_TOKEN_OVERHEAD
+
+
+def _fingerprint(message: Dict[str, Any]) -> str:
+    key = f"{message.get('role', '')}|{message.get('content', '')}|{message.get('timestamp', '')}"
+    return hashlib.md5(key.encode("utf-8")).hexdigest()
+
+
+def extractive_summary(previous_summary: str, new_messages: List[Dict[str, Any]], max_tokens: int) -> str:
+    """
+    抽取式摘要：每条消息保留一行截断后的原文，超出预算时优先删除最早的客服消息，再删除最早的客户消息
+
+    Args:
+        previous_summary: 之前的摘要（可为空）
+        new_messages: 需要并入摘要的消息
+        max_tokens: 摘要的token上限
+    """
+    lines = [line for line in previous_summary.split("\n") if line and line != TRUNCATED_MARKER]
+    truncated = TRUNCATED_MARKER in previous_summary
+    for message in new_messages:
+        speaker = "客户" if message.get("role") == "user" else "客服"
+        content = " ".join(str(message.get("content") or "").split())
+        if len(content) > SUMMARY_LINE_CHARS:
+            content = content[:SUMMARY_LINE_CHARS] + "…"
+        lines.append(f"{speaker}: {content}")
+
+    def size(candidate: List[str]) -> int:
+        return estimate_tokens("\n".join(candidate)) + (estimate_tokens(TRUNCATED_MARKER) if truncated else 0)
+
+    for speaker in ("客服", "客户"):
+        index = 0
+        while size(lines) > max_tokens and index < len(lines):
+            if lines[index].startswith(speaker):
+                del lines[index]
+                truncated = True
+            else:
+                index += 1
+
+    return "\n".join(([TRUNCATED_MARKER] if truncated else []) + lines)
+
+
+@dataclass
+class CompactedHistory:
+    """压缩后的对话历史"""
+    recent: List[Dict[str, Any]]         # 原文保留的最近消息
+    summary: Optional[str] = None        # 更早对话的摘要
+    raw_tokens: int = 0
+    compacted_tokens: int = 0
+
+    @property
+    def compression_ratio(self) -> float:
+        """压缩后token数 / 原始token数"""
+        return self.compacted_tokens / self.raw_tokens if self.raw_tokens else 1.0
+
+
+@dataclass
+class _SummaryState:
+    fingerprint: str   # 已并入摘要的最后一条消息
+    summary: str
+
+
+@dataclass
+class HistoryCompactor:
+    """对话历史压缩器
+
+    token_budget 为历史部分（摘要 + 原文）的总预算，其中最多 summary_tokens 用于摘要；
+    无论预算多少，至少保留最近 min_recent 条原文。
+    """
+    token_budget: int = 1500
+    summary_tokens: int = 300
+    min_recent: int = 6
+    max_recent: int = 30
+    max_chats: int = 1000
+    summarizer: Callable[[str, List[Dict[str, Any]], int], str] = extractive_summary
+    _summaries: "OrderedDict[str, _SummaryState]" = field(default_factory=OrderedDict, init=False)
+    stats: Dict[str, Any] = field(default_factory=lambda: {
+        "compactions": 0, "summarized": 0, "summary_cache_hits": 0, "summary_updates": 0,
+        "summary_rebuilds": 0, "raw_tokens": 0, "compacted_tokens": 0
+    }, init=False)
+
+    def compact(self, history: List[Dict[str, Any]], chat_id: Optional[str] = None) -> CompactedHistory:
+        """
+        压缩对话历史
+
+        Args:
+            history: 按时间顺序排列的历史消息
+            chat_id: 聊天ID，提供时缓存该聊天的摘要以便增量更新
+
+        Returns:
+            压缩结果
+        """
+        messages = [m for m in history or [] if str(m.get("content") or "").strip()]
+        tokens = [message_tokens(m) for m in messages]
+        raw_tokens = sum(tokens)
+
+        recent_budget = self.token_budget - self.summary_tokens
+        split = len(messages)
+        used = 0
+        while split > 0:
+            kept = len(messages) - split
+            if kept >= self.max_recent:
+                break
+            if kept >= self.min_recent and used + tokens[split - 1] > recent_budget:
+                break
+            split -= 1
+            used += tokens[split]
+
+        if split == 0:
+            # 全部历史都在预算内，不需要摘要
+            result = CompactedHistory(recent=messages, raw_tokens=raw_tokens, compacted_tokens=raw_tokens)
+        else:
+            summary = self._summarize(messages[:split], chat_id)
+            result = CompactedHistory(
+                recent=messages[split:],
+                summary=summary,
+                raw_tokens=raw_tokens,
+                compacted_tokens=used + estimate_tokens(summary) + MESSAGE_TOKEN_OVERHEAD
+            )
+            self.stats["summarized"] += 1
+
+        self.stats["compactions"] += 1
+        self.stats["raw_tokens"] += result.raw_tokens
+        self.stats["compacted_tokens"] += result.compacted_tokens
+        if result.summary:
+            logger.info(f"历史压缩: {len(messages)} 条 -> 摘要 + {len(result.recent)} 条原文，"
+                        f"token {result.raw_tokens} -> {result.compacted_tokens} "
+                        f"(压缩比 {result.compression_ratio:.2f})")
+        return result
+
+    def _summarize(self, older: List[Dict[str, Any]], chat_id: Optional[str]) -> str:
+        """生成更早消息的摘要，有缓存时只并入新增的消息"""
+        state = self._summaries.get(chat_id) if chat_id else None
+        new_messages = older
+        previous = ""
+
+        if state is not None:
+            self._summaries.move_to_end(chat_id)
+            position = next((i for i in range(len(older) - 1, -1, -1)
+                             if _fingerprint(older[i]) == state.fingerprint), None)
+            if position is not None:
+                new_messages = older[position + 1:]
+                previous = state.summary
+            if position is not None and not new_messages:
+                self.stats["summary_cache_hits"] += 1
+                return state.summary
+            if position is None:
+                self.stats["summary_rebuilds"] += 1
+
+        summary = self.summarizer(previous, new_messages, self.summary_tokens)
+        if previous:
+            self.stats["summary_updates"] += 1
+        if chat_id:
+            self._summaries[chat_id] = _SummaryState(_fingerprint(older[-1]), summary)
+            self._summaries.move_to_end(chat_id)
+            while len(self._summaries) > self.max_chats:
+                self._summaries.popitem(last=False)
+        return summary
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息（compression_ratio 为累计压缩后token数 / 原始token数）"""
+        raw = self.stats["raw_tokens"]
+        return {
+            **self.stats,
+            "cached_chats": len(self._summaries),
+            "compression_ratio": round(self.stats["compacted_tokens"] / raw, 3) if raw else 1.0,
+        }
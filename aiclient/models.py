@@ -66,6 +66,8 @@ class AIResponse:
     finish_reason: Optional[str] = None
     tool_calls: Optional[List[Dict[str, Any]]] = None
     timestamp: datetime = None
+    round_timings: Optional[List[Dict[str, Any]]] = None  # 多轮工具调用每轮耗时
+    time_to_first_token: Optional[float] = None  # 流式输出首个token耗时（毫秒）
     
     def __post_init__(self):
         if self.timestamp is None:
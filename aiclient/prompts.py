@@ -0,0 +1,188 @@
+"""
+客服提示词构建
+请求消息按「固定前缀 + 上下文块 + 消息尾部」组织：
+- 固定前缀：与客户、对话无关的客服规则，每次请求逐字节相同，便于模型服务端的前缀缓存命中
+- 上下文块：当前对话对象等少量动态信息，紧跟在固定前缀之后
+- 消息尾部：去重后的对话历史和当前客户消息，以消息列表发送，不再重复写入系统提示词
+"""
+
+import re
+from typing import Any, Dict, List, Optional
+
+from . import serialization
+from .models import AIMessage, MessageRole
+
+
+# 客服规则（固定前缀）：不得插入任何随请求变化的内容
+CUSTOMER_SERVICE_INSTRUCTIONS = """你是名医堂的智能客服助理，负责回复大众点评上客户的咨询。
+
+【客服工作流程】
+根据对话阶段采用不同策略：
+
+🔸 首次咨询阶段（客户刚开始咨询时）：
+1. 第一句话简洁地向客户介绍可用技师和推荐
+2. 主动调用 get_stores 获取门店列表
+3. 根据当前门店名称找到对应的门店ID
+4. 调用 search_therapists 获取该门店技师信息
+5. 总结该门店技师给对方，询问：你好您需要预约哪位技师？
+
+
+🔸 预约阶段（客户表达预约意向后）：
+1. 主动询问客户贵姓和联系电话
+3. 一次性确认所有信息（确认时不要重复电话号码）
+4. 立即调用 create_smart_appointment 创建预约（根据前面的门店、技师、客户姓名和电话）
+5. 调用 send_appointment_emails 发送邮件通知
+
+【工具使用优先级】
+**咨询初期时优先使用**：
+- get_stores: 获取门店信息和门店ID映射
+- search_therapists: 搜索技师信息（必须传入正确的store_id）
+
+**预约阶段优先使用**：
+- create_smart_appointment: 智能预约 （如果预约返回500错误，说明已被预约，请推荐同门店其他技师）
+- send_appointment_emails: 发送预约邮件通知
+
+**次要工具**（客户特别需要时才调用）：
+- get_user_appointments: 查看用户预约列表
+- get_stores: 获取门店信息（预约阶段时为次要）
+- search_therapists: 搜索技师信息（预约阶段时为次要）
+
+工作原则：
+1. 识别对话阶段，采用对应的工作流程
+2. 首次咨询时主动提供对应门店技师信息（不要其他门店）
+3. 预约阶段主动收集客户信息（姓名、电话）
+4. 确认信息时不要显示电话号码，预约码（避免屏蔽）
+5. 一次确认后立即创建预约并发送邮件（技师邮件未开通，只要发送客户邮件）
+6. 回复简洁明了，不使用markdown格式
+7. 基于对话历史提供连贯的回复
+
+【基础信息】
+医保支付：不支持医保
+店内餐饮：仅提供养生茶和小食糖果（无正餐）
+
+【预约规则】
+指定技师：可约/需等待/推荐同级替补
+双人间：有空房直接约，满员则改期
+女技师：可预约，若无则推荐男技师
+迟到处理：短时宽容/影响后续则改期
+退款流程：平台直接退款或改约
+
+【服务项目】
+推荐套餐：小调理（颈肩腰腿痛专项）
+团购建议：到店评估后购买
+生理期服务：量少时可艾灸，需预约
+技师资质：持推拿证，8年以上经验
+
+【其他咨询】
+招聘信息：停招/招聘中
+节假日：全年营业（仅春节放假）
+
+请根据客户消息，判断当前对话阶段，使用相应的工具和流程提供准确回复。
+禁止直接发送真实的手机号、确认编号等长串字符给客户，这些消息会被屏蔽
+"""
+
+DEFAULT_HISTORY_LIMIT = 30  # 发送给模型的最近历史消息条数
+
+
+def build_context_block(context_info: Optional[Dict[str, Any]]) -> str:
+    """构建紧凑的上下文块（当前对话对象/门店），无上下文时返回空字符串"""
+    if not context_info:
+        return ""
+    shop_name = context_info.get('shopName')
+    contact_name = context_info.get('contactName')
+    combined_name = context_info.get('combinedName')
+
+    if combined_name:
+        return f"【当前对话对象】: {combined_name}"
+    if shop_name and contact_name:
+        return f"【当前对话对象】: {shop_name} - {contact_name}"
+    if shop_name:
+        return f"【当前门店】: {shop_name}"
+    return ""
+
+
+def build_system_prompt(context_info: Optional[Dict[str, Any]] = None,
+                        history_summary: Optional[str] = None) -> str:
+    """固定前缀在前、上下文块（对话对象、早期对话摘要）在后的系统提示词"""
+    blocks = [CUSTOMER_SERVICE_INSTRUCTIONS]
+    context_block = build_context_block(context_info)
+    if context_block:
+        blocks.append(context_block)
+    if history_summary:
+        blocks.append(f"【早期对话摘要】\n{history_summary}")
+    return "\n".join(blocks)
+
+
+def build_message_tail(customer_message: str, conversation_history: Optional[List[Dict[str, Any]]] = None,
+                       history_limit: int = DEFAULT_HISTORY_LIMIT) -> List[AIMessage]:
+    """
+    构建去重后的消息尾部
+
+    - 跳过空消息，合并连续重复的同角色同内容消息（扩展端重复上报的记忆）
+    - 历史末尾已经是当前客户消息时不再重复追加
+    """
+    messages: List[AIMessage] = []
+    for memory_item in (conversation_history or [])[-history_limit:]:
+        role = MessageRole.USER if memory_item.get("role") == "user" else MessageRole.ASSISTANT
+        content = str(memory_item.get("content") or "").strip()
+        if not content:
+            continue
+        if messages and messages[-1].role == role and messages[-1].content == content:
+            continue
+        messages.append(AIMessage(role=role, content=content))
+
+    customer_message = customer_message.strip()
+    if not (messages and messages[-1].role == MessageRole.USER and messages[-1].content == customer_message):
+        messages.append(AIMessage(role=MessageRole.USER, content=customer_message))
+    return messages
+
+
+def build_customer_service_messages(customer_message: str,
+                                    conversation_history: Optional[List[Dict[str, Any]]] = None,
+                                    context_info: Optional[Dict[str, Any]] = None,
+                                    history_limit: int = DEFAULT_HISTORY_LIMIT,
+                                    history_summary: Optional[str] = None) -> List[AIMessage]:
+    """构建完整的客服请求消息列表"""
+    system_prompt = build_system_prompt(context_info, history_summary)
+    return [AIMessage(role=MessageRole.SYSTEM, content=system_prompt)] + \
+        build_message_tail(customer_message, conversation_history, history_limit)
+
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+MESSAGE_TOKEN_OVERHEAD = 4  # 每条消息的角色/分隔符开销
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的token数（不依赖分词器）
+
+    中文（含全角标点）约每字1个token，其余字符约每4个字符1个token
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
+
+
+def estimate_request_tokens(messages: List[AIMessage], tools: Optional[List[Dict[str, Any]]] = None) -> int:
+    """估算一次请求的输入token数（消息 + 工具定义）"""
+    total = sum(estimate_tokens(message.content) + MESSAGE_TOKEN_OVERHEAD for message in messages)
+    if tools:
+        total += estimate_tokens(serialization.dumps(tools))
+    return total
+
+
+def shared_prefix_tokens(previous: List[AIMessage], current: List[AIMessage]) -> int:
+    """估算两次请求之间可被前缀缓存复用的token数（逐字符比较序列化后的消息）"""
+    def serialize(messages: List[AIMessage]) -> str:
+        return "".join(f"<{m.role.value}>{m.content}" for m in messages)
+
+    a, b = serialize(previous), serialize(current)
+    length = 0
+    for char_a, char_b in zip(a, b):
+        if char_a != char_b:
+            break
+        length += 1
+    return estimate_tokens(a[:length])
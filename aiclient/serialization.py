@@ -0,0 +1,190 @@
+"""
+JSON序列化层
+WebSocket服务器、聊天数据库和AI客户端统一通过这里编码/解码JSON：
+优先使用 orjson，其次 msgspec，都不可用时回退到标准库 json。
+可以通过环境变量 JSON_BACKEND=orjson|msgspec|json 指定实现。
+
+所有实现的行为保持一致：
+- dumps 输出不转义非ASCII字符（等价于 ensure_ascii=False）
+- 解码失败统一抛出 json.JSONDecodeError
+- 快速实现无法编码的对象（如超过64位的整数）回退到标准库
+"""
+
+import dataclasses
+import json
+import logging
+import os
+import typing
+from typing import Any, Callable, Dict, Tuple, Type, TypeVar, Union
+
+logger = logging.getLogger(__name__)
+
+JSONDecodeError = json.JSONDecodeError
+
+T = TypeVar("T")
+
+
+def _std_dumpb(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _std_loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+    if isinstance(data, memoryview):
+        data = bytes(data)
+    return json.loads(data)
+
+
+def _load_backend(name: str):
+    """返回 (dumpb, loads)，对应实现不可用时抛出 ImportError"""
+    if name == "orjson":
+        import orjson
+
+        options = orjson.OPT_NON_STR_KEYS
+
+        def dumpb(obj):
+            try:
+                return orjson.dumps(obj, option=options)
+            except TypeError:
+                return _std_dumpb(obj)
+
+        # orjson.JSONDecodeError 是 json.JSONDecodeError 的子类
+        return dumpb, orjson.loads
+
+    if name == "msgspec":
+        import msgspec
+
+        encoder = msgspec.json.Encoder()
+        decoder = msgspec.json.Decoder()
+
+        def dumpb(obj):
+            try:
+                return encoder.encode(obj)
+            except (TypeError, OverflowError):
+                return _std_dumpb(obj)
+
+        def loads(data):
+            try:
+                return decoder.decode(data)
+            except msgspec.DecodeError as e:
+                text = data if isinstance(data, str) else bytes(data).decode("utf-8", "replace")
+                raise JSONDecodeError(str(e), text, 0) from e
+
+        return dumpb, loads
+
+    if name == "json":
+        return _std_dumpb, _std_loads
+
+    raise ImportError(f"未知的JSON实现: {name}")
+
+
+def _select_backend():
+    preferred = os.getenv("JSON_BACKEND", "").strip().lower()
+    candidates = [preferred] if preferred else []
+    candidates += [name for name in ("orjson", "msgspec", "json") if name != preferred]
+    for name in candidates:
+        try:
+            return (name,) + _load_backend(name)
+        except ImportError:
+            if name == preferred:
+                logger.warning(f"JSON实现 {name} 不可用，自动选择其他实现")
+    raise RuntimeError("没有可用的JSON实现")  # 标准库总是可用，不会到这里
+
+
+BACKEND, _dumpb, _loads = _select_backend()
+
+try:
+    import msgspec as _msgspec
+except ImportError:
+    _msgspec = None
+
+
+def dumpb(obj: Any) -> bytes:
+    """编码为UTF-8 JSON字节"""
+    return _dumpb(obj)
+
+
+def dumps(obj: Any) -> str:
+    """编码为JSON字符串（非ASCII字符不转义）"""
+    return _dumpb(obj).decode("utf-8")
+
+
+def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+    """解码JSON字符串或字节，格式错误时抛出 json.JSONDecodeError"""
+    return _loads(data)
+
+
+def _convert_value(value: Any, annotation: Any, path: str) -> Any:
+    origin = typing.get_origin(annotation)
+    if annotation is Any:
+        return value
+    if origin is Union:
+        options = typing.get_args(annotation)
+        if value is None and type(None) in options:
+            return None
+        for option in options:
+            if option is type(None):
+                continue
+            try:
+                return _convert_value(value, option, path)
+            except ValueError:
+                continue
+        raise ValueError(f"{path}: 类型不匹配 {value!r}")
+    if dataclasses.is_dataclass(annotation):
+        return _convert_dataclass(value, annotation, path)
+    if origin is list or annotation is list:
+        if not isinstance(value, list):
+            raise ValueError(f"{path}: 应为数组")
+        item_type = (typing.get_args(annotation) or (Any,))[0]
+        return [_convert_value(item, item_type, f"{path}[{i}]") for i, item in enumerate(value)]
+    if origin is dict or annotation is dict:
+        if not isinstance(value, dict):
+            raise ValueError(f"{path}: 应为对象")
+        return value
+    if annotation is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(annotation, type):
+        if not isinstance(value, annotation) or (annotation is int and isinstance(value, bool)):
+            raise ValueError(f"{path}: 应为 {annotation.__name__}，实际为 {type(value).__name__}")
+    return value
+
+
+def _convert_dataclass(value: Any, cls: Type[T], path: str) -> T:
+    if not isinstance(value, dict):
+        raise ValueError(f"{path or cls.__name__}: 应为对象")
+    hints = typing.get_type_hints(cls)
+    kwargs = {}
+    for f in dataclasses.fields(cls):
+        if f.name not in value:
+            if f.default is dataclasses.MISSING and f.default_factory is dataclasses.MISSING:
+                raise ValueError(f"{path}.{f.name}: 缺少必填字段" if path else f"缺少必填字段 {f.name}")
+            continue
+        kwargs[f.name] = _convert_value(value[f.name], hints[f.name], f"{path}.{f.name}" if path else f.name)
+    return cls(**kwargs)
+
+
+def convert(obj: Any, cls: Type[T]) -> T:
+    """
+    把解码后的JSON对象转换为dataclass结构，并校验字段类型（忽略未声明的字段）
+
+    安装了 msgspec 时由 msgspec.convert 完成（与编码实现无关），否则使用纯Python实现。
+
+    Raises:
+        ValueError: 缺少必填字段或字段类型不匹配
+    """
+    if _msgspec is not None:
+        try:
+            return _msgspec.convert(obj, cls)
+        except _msgspec.ValidationError as e:
+            raise ValueError(str(e)) from e
+    return _convert_dataclass(obj, cls, "")
+
+
+def available_backends() -> Dict[str, Tuple[Callable[[Any], bytes], Callable[[Any], Any]]]:
+    """当前环境中可用的全部JSON实现 {名称: (dumpb, loads)}（用于基准测试）"""
+    available = {}
+    for name in ("orjson", "msgspec", "json"):
+        try:
+            available[name] = _load_backend(name)
+        except ImportError:
+            continue
+    return available
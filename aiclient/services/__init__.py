@@ -9,10 +9,12 @@ from .email_notification import (
     ContactInfoExtractor
 )
 from .email_sender_adapter import EmailSenderAdapter
+from .container import ServiceContainer
 
 __all__ = [
     'EmailNotificationService',
     'EmailTemplateManager',
     'ContactInfoExtractor',
-    'EmailSenderAdapter'
+    'EmailSenderAdapter',
+    'ServiceContainer'
 ] 
\ No newline at end of file
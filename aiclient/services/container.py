@@ -0,0 +1,75 @@
+"""
+服务容器
+集中创建并持有进程内共享的业务服务实例（数据库API、邮件通知、智能预约），
+由AIClient注入到各个适配器，避免每次函数调用都重新建立HTTP会话或读取配置文件
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """业务服务容器"""
+
+    def __init__(self, database_service=None, email_service=None,
+                 smart_appointment_service=None, api_base_url: str = "http://localhost:3001"):
+        """
+        初始化服务容器（未提供的服务在首次使用时懒加载创建）
+
+        Args:
+            database_service: 数据库API服务实例
+            email_service: 邮件通知服务实例
+            smart_appointment_service: 智能预约服务实例
+            api_base_url: 数据库API服务器地址
+        """
+        self.api_base_url = api_base_url
+        self._database_service = database_service
+        self._email_service = email_service
+        self._smart_appointment_service = smart_appointment_service
+        self.logger = logger.getChild(self.__class__.__name__)
+
+    @property
+    def database_service(self):
+        """共享的数据库API服务"""
+        if self._database_service is None:
+            from ..database_service import DatabaseAPIService
+            self._database_service = DatabaseAPIService(self.api_base_url)
+            self.logger.info(f"创建共享数据库API服务: {self.api_base_url}")
+        return self._database_service
+
+    @property
+    def email_service(self):
+        """共享的邮件通知服务（邮件配置只读取一次）"""
+        if self._email_service is None:
+            from .email_notification import EmailNotificationService
+            from .email_sender_adapter import EmailSenderAdapter
+            self._email_service = EmailNotificationService(
+                email_sender=EmailSenderAdapter(),
+                database_service=self.database_service
+            )
+            self.logger.info("创建共享邮件通知服务")
+        return self._email_service
+
+    @property
+    def smart_appointment_service(self):
+        """共享的智能预约服务"""
+        if self._smart_appointment_service is None:
+            from .smart_appointment import SmartAppointmentService
+            self._smart_appointment_service = SmartAppointmentService(
+                database_service=self.database_service,
+                email_service=self.email_service
+            )
+            self.logger.info("创建共享智能预约服务")
+        return self._smart_appointment_service
+
+    async def start(self):
+        """启动服务：预先建立数据库API的HTTP会话"""
+        await self.database_service._ensure_session()
+        self.logger.info("服务容器已启动")
+
+    async def close(self):
+        """关闭服务：释放数据库API的HTTP会话"""
+        if self._database_service is not None:
+            await self._database_service.close()
+        self.logger.info("服务容器已关闭")
@@ -0,0 +1,380 @@
+"""
+工具调用分发器
+用装饰器把函数调用名称注册到处理函数，所有适配器共用同一张分发表：
+- 按名称O(1)查找处理函数
+- 按处理函数的类型注解转换参数（如模型给出的 "3" -> 3）
+- 每个工具独立的超时和并发上限
+- 每个工具的调用次数、错误、超时和耗时统计
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+import typing
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from . import serialization
+from .tool_scheduler import DEFAULT_TIMEOUT, DEFAULT_TOOL_TIMEOUTS
+
+logger = logging.getLogger(__name__)
+
+# 分发器的超时略短于调度器的外层超时，使超时在这里被记录并返回明确的错误
+TIMEOUT_MARGIN = 0.5
+
+
+class ArgumentError(ValueError):
+    """函数调用参数无法转换为声明的类型"""
+
+
+_TRUE_STRINGS = {"true", "1", "yes", "是"}
+_FALSE_STRINGS = {"false", "0", "no", "否"}
+
+
+def _unwrap_optional(annotation: Any) -> Any:
+    if typing.get_origin(annotation) is typing.Union:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+def coerce_argument(name: str, value: Any, annotation: Any) -> Any:
+    """按类型注解转换单个参数，无法转换时抛出ArgumentError"""
+    target = _unwrap_optional(annotation)
+    if value is None or target is inspect.Parameter.empty or target is Any:
+        return value
+    origin = typing.get_origin(target) or target
+
+    if origin is bool:
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.strip().lower() in _TRUE_STRINGS | _FALSE_STRINGS:
+            return value.strip().lower() in _TRUE_STRINGS
+    elif origin is int:
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, str):
+            try:
+                return int(value.strip())
+            except ValueError:
+                pass
+    elif origin is float:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+        if isinstance(value, str):
+            try:
+                return float(value.strip())
+            except ValueError:
+                pass
+    elif origin is str:
+        if isinstance(value, str):
+            return value.strip()
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+    elif origin in (dict, list):
+        if isinstance(value, origin):
+            return value
+        if isinstance(value, str):
+            try:
+                parsed = serialization.loads(value)
+            except ValueError:
+                parsed = None
+            if isinstance(parsed, origin):
+                return parsed
+    else:
+        return value
+
+    raise ArgumentError(f"参数 {name} 应为 {getattr(origin, '__name__', origin)} 类型，实际为 {value!r}")
+
+
+@dataclass
+class ToolMetrics:
+    """单个工具的调用统计"""
+    calls: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    rejected: int = 0  # 参数错误，未执行
+    in_flight: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        completed = self.calls - self.rejected
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "in_flight": self.in_flight,
+            "avg_ms": round(self.total_ms / completed, 1) if completed else None,
+            "max_ms": round(self.max_ms, 1),
+        }
+
+
+@dataclass
+class ToolSpec:
+    """已注册的工具"""
+    name: str
+    handler: Callable[..., Awaitable[Dict[str, Any]]]
+    timeout: float
+    max_concurrency: Optional[int] = None
+    pass_arguments: bool = False  # True 时把完整参数字典原样传给处理函数
+    parameters: Dict[str, inspect.Parameter] = field(default_factory=dict)
+    hints: Dict[str, Any] = field(default_factory=dict)
+    metrics: ToolMetrics = field(default_factory=ToolMetrics)
+    _semaphore: Optional[asyncio.Semaphore] = field(default=None, init=False)
+
+    @property
+    def semaphore(self) -> Optional[asyncio.Semaphore]:
+        if self.max_concurrency and self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def bind(self, function_args: Dict[str, Any]) -> Dict[str, Any]:
+        """把模型给出的参数转换为处理函数的关键字参数（忽略未声明的参数）"""
+        if self.pass_arguments:
+            return {"arguments": function_args}
+        kwargs = {}
+        for name, parameter in self.parameters.items():
+            if name in function_args and function_args[name] not in (None, ""):
+                kwargs[name] = coerce_argument(name, function_args[name], self.hints.get(name, parameter.annotation))
+            elif parameter.default is inspect.Parameter.empty:
+                raise ArgumentError(f"缺少必填参数 {name}")
+        ignored = set(function_args) - set(self.parameters)
+        if ignored:
+            logger.debug(f"函数 {self.name} 忽略未声明的参数: {sorted(ignored)}")
+        return kwargs
+
+
+class ToolDispatcher:
+    """工具调用分发器"""
+
+    def __init__(self):
+        self._tools: Dict[str, ToolSpec] = {}
+
+    def tool(self, name: str, timeout: Optional[float] = None, max_concurrency: Optional[int] = None,
+             pass_arguments: bool = False):
+        """
+        注册工具处理函数的装饰器
+
+        处理函数的第一个参数为服务容器，其余参数按名称从函数调用参数中取出并按注解转换类型；
+        pass_arguments=True 时处理函数签名为 (services, arguments)。
+
+        Args:
+            name: 函数调用名称
+            timeout: 执行超时（秒），默认取 DEFAULT_TOOL_TIMEOUTS 减去 TIMEOUT_MARGIN
+            max_concurrency: 同时执行的最大数量，None表示不限制
+            pass_arguments: 是否原样传递完整参数字典
+        """
+        def decorator(handler):
+            signature = inspect.signature(handler)
+            parameters = dict(list(signature.parameters.items())[1:])  # 跳过 services
+            self._tools[name] = ToolSpec(
+                name=name,
+                handler=handler,
+                timeout=timeout if timeout is not None else DEFAULT_TOOL_TIMEOUTS.get(name, DEFAULT_TIMEOUT) - TIMEOUT_MARGIN,
+                max_concurrency=max_concurrency,
+                pass_arguments=pass_arguments,
+                parameters=parameters,
+                hints=typing.get_type_hints(handler)
+            )
+            return handler
+        return decorator
+
+    @property
+    def names(self):
+        return list(self._tools)
+
+    def get(self, name: str) -> Optional[ToolSpec]:
+        return self._tools.get(name)
+
+    async def dispatch(self, name: str, function_args: Dict[str, Any], services) -> Dict[str, Any]:
+        """
+        执行函数调用
+
+        Args:
+            name: 函数调用名称
+            function_args: 模型给出的参数
+            services: 服务容器（ServiceContainer）
+
+        Returns:
+            函数执行结果
+        """
+        spec = self._tools.get(name)
+        if spec is None:
+            return {
+                "success": False,
+                "error": f"未知的函数: {name}",
+                "message": "不支持的函数调用"
+            }
+
+        metrics = spec.metrics
+        metrics.calls += 1
+        try:
+            kwargs = spec.bind(function_args or {})
+        except ArgumentError as e:
+            metrics.rejected += 1
+            logger.warning(f"函数 {name} 参数错误: {e}")
+            return {
+                "success": False,
+                "error": f"参数错误: {e}",
+                "message": f"函数 {name} 参数格式错误"
+            }
+
+        semaphore = spec.semaphore
+        start = time.perf_counter()
+        metrics.in_flight += 1
+        try:
+            if semaphore is not None:
+                async with semaphore:
+                    result = await asyncio.wait_for(spec.handler(services, **kwargs), timeout=spec.timeout)
+            else:
+                result = await asyncio.wait_for(spec.handler(services, **kwargs), timeout=spec.timeout)
+            if isinstance(result, dict) and result.get("success") is False:
+                metrics.errors += 1
+            return result
+        except asyncio.TimeoutError:
+            metrics.timeouts += 1
+            metrics.errors += 1
+            logger.error(f"函数 {name} 执行超时 ({spec.timeout}s)")
+            return {
+                "success": False,
+                "error": f"执行超时 ({spec.timeout}s)",
+                "message": f"函数 {name} 执行超时"
+            }
+        except Exception as e:
+            metrics.errors += 1
+            logger.error(f"执行函数调用失败 ({name}): {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "message": f"函数 {name} 执行失败"
+            }
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            metrics.in_flight -= 1
+            metrics.total_ms += elapsed_ms
+            metrics.max_ms = max(metrics.max_ms, elapsed_ms)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各工具的调用统计（只包含被调用过的工具）"""
+        return {name: spec.metrics.to_dict() for name, spec in self._tools.items() if spec.metrics.calls}
+
+
+TOOL_DISPATCHER = ToolDispatcher()
+
+
+@TOOL_DISPATCHER.tool("create_appointment", max_concurrency=2)
+async def create_appointment(services, therapist_id: int, user_name: str, user_phone: str,
+                             appointment_date: str, appointment_time: str, notes: str = "") -> Dict[str, Any]:
+    """处理标准预约创建"""
+    return await services.database_service.create_appointment({
+        'therapist_id': therapist_id,
+        'user_name': user_name,
+        'user_phone': user_phone,
+        'appointment_date': appointment_date,
+        'appointment_time': appointment_time,
+        'notes': notes
+    })
+
+
+@TOOL_DISPATCHER.tool("get_user_appointments")
+async def get_user_appointments(services, phone: str) -> Dict[str, Any]:
+    results = await services.database_service.get_user_appointments(phone)
+    return {
+        "success": True,
+        "data": results,
+        "message": f"查询到 {len(results)} 个预约记录"
+    }
+
+
+@TOOL_DISPATCHER.tool("cancel_appointment", max_concurrency=2)
+async def cancel_appointment(services, appointment_id: int, phone: str) -> Dict[str, Any]:
+    return await services.database_service.cancel_appointment(appointment_id, phone)
+
+
+@TOOL_DISPATCHER.tool("get_therapist_schedule")
+async def get_therapist_schedule(services, therapist_id: int, date: str) -> Dict[str, Any]:
+    result = await services.database_service.get_therapist_schedule(therapist_id, date)
+    return {
+        "success": True,
+        "data": result,
+        "message": "技师排班查询成功"
+    }
+
+
+@TOOL_DISPATCHER.tool("search_therapists")
+async def search_therapists(services, store_id: Optional[int] = None, specialty: Optional[str] = None,
+                            min_experience: Optional[int] = None, page: Optional[int] = None,
+                            limit: Optional[int] = None) -> Dict[str, Any]:
+    """搜索技师（专长、经验、分页条件下推到API服务器，不再取回全部技师后本地过滤）"""
+    results = await services.database_service.search_therapists(
+        store_id=store_id,
+        specialty=specialty,
+        min_experience=min_experience,
+        page=page,
+        limit=limit
+    )
+    return {
+        "success": True,
+        "data": results,
+        "message": f"查询到 {len(results)} 个技师"
+    }
+
+
+@TOOL_DISPATCHER.tool("query_technician_schedule")
+async def query_technician_schedule(services, technician_id: int, start_date: str,
+                                    end_date: Optional[str] = None) -> Dict[str, Any]:
+    results = await services.database_service.query_technician_schedule(technician_id, start_date, end_date)
+    return {
+        "success": True,
+        "data": results,
+        "message": f"查询到 {len(results)} 个排班记录"
+    }
+
+
+@TOOL_DISPATCHER.tool("get_appointment_details")
+async def get_appointment_details(services, appointment_id: int) -> Dict[str, Any]:
+    result = await services.database_service.get_appointment_details(appointment_id)
+    return {
+        "success": True,
+        "data": result,
+        "message": "预约详情查询成功"
+    }
+
+
+@TOOL_DISPATCHER.tool("get_stores")
+async def get_stores(services) -> Dict[str, Any]:
+    results = await services.database_service.get_stores()
+    return {
+        "success": True,
+        "data": results,
+        "message": f"查询到 {len(results)} 个门店"
+    }
+
+
+@TOOL_DISPATCHER.tool("send_appointment_emails", max_concurrency=2, pass_arguments=True)
+async def send_appointment_emails(services, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """发送预约邮件通知"""
+    return await services.email_service.send_appointment_notification_emails(arguments)
+
+
+@TOOL_DISPATCHER.tool("create_smart_appointment", max_concurrency=2, pass_arguments=True)
+async def create_smart_appointment(services, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """智能预约：已解析出技师/时间时直接调用智能预约API，否则由智能预约服务解析自然语言"""
+    if "therapist_name" in arguments or "appointment_time" in arguments:
+        logger.info("使用直接智能预约API模式")
+        return await services.database_service.create_smart_appointment(arguments)
+
+    logger.info("使用智能预约服务解析模式")
+    context_info = arguments.get("context_info") or {}
+    if isinstance(context_info, str):
+        context_info = coerce_argument("context_info", context_info, dict)
+    return await services.smart_appointment_service.create_smart_appointment(
+        customer_message=arguments.get("customer_message", ""),
+        context_info=context_info
+    )
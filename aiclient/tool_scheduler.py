@@ -0,0 +1,161 @@
+"""
+工具调用调度器
+并发执行相互独立的函数调用，按声明的依赖关系排序，并为每个工具设置超时
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from . import serialization
+
+logger = logging.getLogger(__name__)
+
+
+# 工具依赖关系：key 需要等待同一轮中 value 里的工具执行完成后才能执行
+DEFAULT_TOOL_DEPENDENCIES: Dict[str, Set[str]] = {
+    "send_appointment_emails": {"create_smart_appointment", "create_appointment"},
+}
+
+# 有副作用的工具（写入预约、发送邮件）：开始执行后不能再被取消或重试
+SIDE_EFFECT_TOOLS: Set[str] = {
+    "create_smart_appointment", "create_appointment", "cancel_appointment", "send_appointment_emails",
+}
+
+# 单个工具的执行超时（秒）
+DEFAULT_TOOL_TIMEOUTS: Dict[str, float] = {
+    "create_smart_appointment": 20.0,
+    "create_appointment": 20.0,
+    "send_appointment_emails": 40.0,  # 客户和技师两封邮件，SMTP单次超时15秒
+}
+
+DEFAULT_TIMEOUT = 15.0
+
+
+@dataclass
+class ToolCallResult:
+    """单个工具调用的执行结果"""
+    tool_call_id: str
+    name: str
+    arguments: Dict[str, Any]
+    result: Dict[str, Any]
+    elapsed: float = 0.0
+
+    @property
+    def success(self) -> bool:
+        return bool(self.result.get("success", False))
+
+    def to_content(self) -> str:
+        """序列化为发送给模型的结果文本"""
+        return serialization.dumps(self.result)
+
+
+@dataclass
+class ToolScheduler:
+    """工具调用调度器
+
+    同一轮中的工具调用默认并发执行；存在依赖关系的调用会等待其依赖完成，
+    若依赖执行失败则跳过。返回结果的顺序与模型给出的 tool_calls 顺序一致。
+    """
+    dependencies: Dict[str, Set[str]] = field(default_factory=lambda: dict(DEFAULT_TOOL_DEPENDENCIES))
+    timeouts: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_TOOL_TIMEOUTS))
+    default_timeout: float = DEFAULT_TIMEOUT
+    validator: Optional[Callable[[str, Dict[str, Any]], List[str]]] = None  # 执行前的参数校验，返回错误列表
+
+    def get_timeout(self, function_name: str) -> float:
+        """获取工具的执行超时"""
+        return self.timeouts.get(function_name, self.default_timeout)
+
+    async def run(self, tool_calls: List[Dict[str, Any]],
+                  executor: Callable[[str, Dict[str, Any]], Awaitable[Dict[str, Any]]]) -> List[ToolCallResult]:
+        """
+        执行一轮工具调用
+
+        Args:
+            tool_calls: 模型返回的工具调用列表
+            executor: 实际执行函数调用的协程，如 adapter.execute_function_call
+
+        Returns:
+            与 tool_calls 顺序一致的执行结果列表
+        """
+        names = [tool_call.get("function", {}).get("name", "unknown") for tool_call in tool_calls]
+        tasks: List[asyncio.Task] = []
+
+        for index, tool_call in enumerate(tool_calls):
+            depends_on = [
+                i for i, name in enumerate(names)
+                if i != index and name in self.dependencies.get(names[index], ())
+            ]
+            tasks.append(asyncio.ensure_future(
+                self._run_one(tool_call, names[index], depends_on, tasks, executor)
+            ))
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*tasks)
+        logger.info(f"执行 {len(results)} 个工具调用，总耗时 {(time.perf_counter() - start) * 1000:.0f}ms")
+        return list(results)
+
+    async def _run_one(self, tool_call: Dict[str, Any], function_name: str, depends_on: List[int],
+                       tasks: List[asyncio.Task],
+                       executor: Callable[[str, Dict[str, Any]], Awaitable[Dict[str, Any]]]) -> ToolCallResult:
+        """执行单个工具调用（等待依赖、解析参数、超时控制）"""
+        tool_call_id = tool_call.get("id", "unknown")
+        start = time.perf_counter()
+
+        try:
+            function_args = serialization.loads(tool_call.get("function", {}).get("arguments") or "{}")
+        except (TypeError, serialization.JSONDecodeError) as e:
+            logger.error(f"工具参数解析失败 ({function_name}): {e}")
+            return ToolCallResult(tool_call_id, function_name, {}, {
+                "success": False,
+                "error": f"参数解析失败: {e}",
+                "message": f"函数 {function_name} 参数格式错误"
+            })
+
+        if depends_on:
+            dependency_results: List[ToolCallResult] = await asyncio.gather(*(tasks[i] for i in depends_on))
+            failed = [r.name for r in dependency_results if not r.success]
+            if failed:
+                logger.warning(f"跳过函数 {function_name}: 依赖的函数 {failed} 执行失败")
+                return ToolCallResult(tool_call_id, function_name, function_args, {
+                    "success": False,
+                    "error": f"依赖的函数 {', '.join(failed)} 执行失败",
+                    "message": f"函数 {function_name} 已跳过"
+                })
+
+        if self.validator is not None:
+            errors = self.validator(function_name, function_args)
+            if errors:
+                logger.warning(f"函数 {function_name} 参数校验失败: {errors}")
+                return ToolCallResult(tool_call_id, function_name, function_args, {
+                    "success": False,
+                    "error": f"参数校验失败: {'; '.join(errors)}",
+                    "message": f"函数 {function_name} 参数不符合定义，请修正后重试"
+                })
+        
+        timeout = self.get_timeout(function_name)
+        logger.info(f"执行函数: {function_name} 参数: {function_args}")
+        try:
+            result = await asyncio.wait_for(executor(function_name, function_args), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"函数 {function_name} 执行超时 ({timeout}s)")
+            result = {
+                "success": False,
+                "error": f"执行超时 ({timeout}s)",
+                "message": f"函数 {function_name} 执行超时"
+            }
+        except Exception as e:
+            logger.error(f"执行函数调用失败 ({function_name}): {e}")
+            result = {
+                "success": False,
+                "error": str(e),
+                "message": f"函数 {function_name} 执行失败"
+            }
+
+        if not isinstance(result, dict):
+            result = {"success": True, "data": result}
+
+        return ToolCallResult(tool_call_id, function_name, function_args, result,
+                              elapsed=time.perf_counter() - start)
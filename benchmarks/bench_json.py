@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+JSON编解码基准测试
+回放扩展发往WebSocket服务器的消息，按服务器的实际处理路径对比各JSON实现的耗时：
+- 解码收到的消息（handle_message）
+- 每条记忆消息编码为 raw_data 入库（add_message）
+- 读取历史时逐行解码 raw_data（get_chat_history）
+- 编码回复消息（websocket.send / 广播）
+
+消息来源（按优先级）：
+- 录制的WebSocket消息文件（.jsonl，每行一条扩展发送的原始消息）
+- 聊天数据库（.db，按聊天把 raw_data 组装成扩展发送的 memory_update 消息）
+- 内置的示例消息（模拟扩展每收到一条消息就发送一次最近20条记忆）
+
+用法:
+    python benchmarks/bench_json.py [recorded.jsonl | dianping_history.db] [--rounds 20]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'dianping-scraper', 'backend'))
+
+from aiclient import serialization
+from schemas import MemoryPayload
+
+SAMPLE_LINES = [
+    ("user", "你好，请问今天还能约吗"),
+    ("assistant", "您好，宜山路店今天下午还有王师傅和李师傅可以预约，请问您想约哪位技师？"),
+    ("user", "王师傅几点有空"),
+    ("assistant", "王师傅今天15:00和17:00有空，请问您选哪个时间？"),
+    ("user", "15点吧"),
+    ("assistant", "好的，请问您贵姓，方便留个联系电话吗？"),
+    ("user", "姓张，13800001234"),
+    ("assistant", "张先生，已为您预约今天15:00王师傅的颈肩调理，到店报姓名即可。"),
+]
+CONTACT_NAME = "名医堂·颈肩腰腿特色调理（宜山路店） - 张先生"
+
+
+def _memory_frame(chat_id: str, contact_name: str, memory: List[Dict[str, Any]],
+                  context_info: Dict[str, Any] = None) -> str:
+    payload = {
+        "action": "add_message",
+        "chatId": chat_id,
+        "contactName": contact_name,
+        "message": memory[-1],
+        "conversationMemory": memory[-20:],  # 扩展只保留最近20条记忆
+        "timestamp": memory[-1].get("timestamp"),
+    }
+    if context_info:
+        payload["contextInfo"] = context_info
+    return json.dumps({"type": "memory_update", "payload": payload}, ensure_ascii=False)
+
+
+def sample_frames(chats: int = 20) -> List[str]:
+    """模拟扩展的消息：每条新消息都会附带最近20条记忆重新发送"""
+    frames = []
+    for c in range(chats):
+        memory = []
+        for i in range(30):
+            role, content = SAMPLE_LINES[i % len(SAMPLE_LINES)]
+            memory.append({
+                "role": role, "content": content, "chatId": f"chat_{c}", "contactName": CONTACT_NAME,
+                "timestamp": f"2025-06-18T{10 + i // 60:02d}:{i % 60:02d}:00.000Z"
+            })
+            frames.append(_memory_frame(f"chat_{c}", CONTACT_NAME, memory, {"combinedName": CONTACT_NAME}))
+    return frames
+
+
+def load_frames(path: str) -> List[str]:
+    """读取录制的消息文件，或从聊天数据库重建 memory_update 消息"""
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+
+    conn = sqlite3.connect(path)
+    frames = []
+    memories: Dict[str, List[Dict[str, Any]]] = {}
+    for chat_id, raw in conn.execute("SELECT chat_id, raw_data FROM messages ORDER BY chat_id, timestamp ASC"):
+        message = json.loads(raw)
+        memory = memories.setdefault(chat_id, [])
+        memory.append(message)
+        frames.append(_memory_frame(chat_id, message.get("contactName", ""), memory, message.get("contextInfo")))
+    conn.close()
+    return frames
+
+
+def run(dumpb, loads, frames: List[str], rounds: int) -> Dict[str, float]:
+    """按服务器处理路径回放全部消息，返回各阶段的总耗时（毫秒）"""
+    timings = {"decode": 0.0, "raw_data": 0.0, "history": 0.0, "reply": 0.0}
+    for _ in range(rounds):
+        for frame in frames:
+            start = time.perf_counter()
+            data = loads(frame)
+            timings["decode"] += time.perf_counter() - start
+
+            memory = data.get("payload", {}).get("conversationMemory", [])
+            start = time.perf_counter()
+            rows = [dumpb(message) for message in memory]
+            timings["raw_data"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            for row in rows:
+                loads(row)
+            timings["history"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            dumpb({"type": "memory_updated", "new_messages_count": 1, "timestamp": "2025-06-18T10:00:00"})
+            timings["reply"] += time.perf_counter() - start
+    return {key: value * 1000 for key, value in timings.items()}
+
+
+def bench_convert(frames: List[str], rounds: int) -> float:
+    """memory_update payload 类型化解码的平均耗时（微秒）"""
+    payloads = [serialization.loads(frame).get("payload", {}) for frame in frames]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for payload in payloads:
+            serialization.convert(payload, MemoryPayload)
+    return (time.perf_counter() - start) * 1e6 / (rounds * len(payloads))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON编解码基准测试")
+    parser.add_argument("source", nargs="?", help="录制的消息文件(.jsonl)或聊天数据库(.db)")
+    parser.add_argument("--rounds", type=int, default=20, help="回放轮数")
+    args = parser.parse_args()
+
+    if args.source and not os.path.exists(args.source):
+        print(f"文件不存在: {args.source}")
+        return
+    if args.source:
+        frames = load_frames(args.source)
+        source = args.source
+    else:
+        frames = sample_frames()
+        source = "内置示例消息"
+    if not frames:
+        print("没有可回放的消息")
+        return
+
+    total_bytes = sum(len(frame.encode("utf-8")) for frame in frames)
+    print(f"📊 JSON编解码基准测试（{source}，{len(frames)} 条消息，共 {total_bytes / 1024:.0f} KB，"
+          f"回放 {args.rounds} 轮，当前默认实现: {serialization.BACKEND}）")
+
+    results = {name: run(dumpb, loads, frames, args.rounds)
+               for name, (dumpb, loads) in serialization.available_backends().items()}
+    baseline = sum(results["json"].values())
+    for name, timings in results.items():
+        total = sum(timings.values())
+        per_frame = total * 1000 / (len(frames) * args.rounds)
+        detail = "，".join(f"{key} {value:.0f}ms" for key, value in timings.items())
+        print(f"  {name:8s}: 总计 {total:.0f}ms（{per_frame:.1f}µs/消息；{detail}）"
+              f"{'' if name == 'json' else f'  🚀 {baseline / total:.1f}x'}")
+
+    print(f"  memory_update 类型化解码: {bench_convert(frames, args.rounds):.1f}µs/消息"
+          f"（{'msgspec' if serialization._msgspec else '纯Python'}）")
+
+
+if __name__ == "__main__":
+    main()
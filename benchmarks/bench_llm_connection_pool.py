@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+LLM适配器连接池基准测试
+对比「每次请求新建ClientSession」与「适配器长连接池」在本地模拟LLM服务器上的单次调用延迟
+
+用法:
+    python benchmarks/bench_llm_connection_pool.py [调用次数]
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from aiclient.adapters.openai_adapter import OpenAIAdapter
+from aiclient.config import ModelConfig, AIProvider
+from aiclient.models import AIRequest, AIMessage, MessageRole
+
+
+STUB_RESPONSE = {
+    "model": "stub-model",
+    "choices": [{
+        "message": {"role": "assistant", "content": "您好，请问需要预约哪位技师？"},
+        "finish_reason": "stop"
+    }],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20}
+}
+
+
+async def start_stub_server():
+    """启动本地模拟LLM服务器"""
+    async def chat_completions(request):
+        await request.read()
+        return web.json_response(STUB_RESPONSE)
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1"
+
+
+async def bench_session_per_call(url: str, payload: dict, calls: int) -> list:
+    """旧实现：每次调用都新建ClientSession"""
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+            async with session.post(url, json=payload) as response:
+                await response.json()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+async def bench_pooled_adapter(base_url: str, request: AIRequest, calls: int) -> list:
+    """新实现：适配器复用长连接池"""
+    adapter = OpenAIAdapter(ModelConfig(
+        provider=AIProvider.OPENAI,
+        model_name="stub-model",
+        api_key="bench-key",
+        base_url=base_url
+    ))
+    latencies = []
+    try:
+        for _ in range(calls):
+            start = time.perf_counter()
+            await adapter.chat_completion(request)
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        await adapter.close()
+    return latencies
+
+
+def report(name: str, latencies: list):
+    """打印延迟统计"""
+    ordered = sorted(latencies)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    print(f"  {name:<24} 平均 {statistics.mean(latencies):7.3f} ms | "
+          f"中位数 {statistics.median(latencies):7.3f} ms | p95 {p95:7.3f} ms")
+
+
+async def main(calls: int):
+    runner, base_url = await start_stub_server()
+    request = AIRequest(messages=[AIMessage(role=MessageRole.USER, content="我想预约明天下午的推拿")])
+    payload = request.to_openai_format()
+    payload["model"] = "stub-model"
+
+    try:
+        print(f"📊 LLM连接池基准测试 (本地模拟服务器, {calls} 次调用)")
+        before = await bench_session_per_call(f"{base_url}/chat/completions", payload, calls)
+        after = await bench_pooled_adapter(base_url, request, calls)
+        report("每次新建会话 (优化前)", before)
+        report("长连接池 (优化后)", after)
+        print(f"  加速比: {statistics.mean(before) / statistics.mean(after):.2f}x")
+        print("  注: 本地HTTP无TLS握手和DNS查询，真实环境下差距更大")
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
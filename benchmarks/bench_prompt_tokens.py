@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+客服提示词token基准测试
+按对话逐轮回放客户消息，对比两种提示词构建方式每次请求的估算输入token数，
+以及相邻两轮请求之间可被模型服务端前缀缓存复用的token比例：
+- 旧实现：对话历史以Python repr写入系统提示词，同时又作为消息重复发送
+- 新实现：固定前缀 + 上下文块 + 去重后的消息尾部
+
+默认使用内置的示例对话；指定聊天数据库时回放其中记录的真实对话。
+
+用法:
+    python benchmarks/bench_prompt_tokens.py [dianping_history.db]
+"""
+
+import json
+import os
+import sqlite3
+import sys
+from typing import Any, Dict, List
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from aiclient.models import AIMessage, MessageRole
+from aiclient.prompts import (
+    CUSTOMER_SERVICE_INSTRUCTIONS, build_context_block, build_customer_service_messages,
+    estimate_request_tokens, shared_prefix_tokens
+)
+
+
+SAMPLE_CONVERSATIONS = [
+    {
+        "context": {"combinedName": "名医堂·颈肩腰腿特色调理（宜山路店） - 张先生"},
+        "messages": [
+            ("user", "你好，请问今天还能约吗"),
+            ("assistant", "您好，宜山路店今天下午还有王师傅和李师傅可以预约，请问您想约哪位技师？"),
+            ("user", "王师傅几点有空"),
+            ("assistant", "王师傅今天15:00和17:00有空，请问您选哪个时间？"),
+            ("user", "15点吧"),
+            ("assistant", "好的，请问您贵姓，方便留个联系电话吗？"),
+            ("user", "姓张，13800001234"),
+            ("assistant", "张先生，已为您预约今天15:00王师傅的颈肩调理，到店报姓名即可。"),
+            ("user", "好的谢谢"),
+        ],
+    },
+    {
+        "context": {"shopName": "名医堂静安店", "contactName": "李女士"},
+        "messages": [
+            ("user", "生理期可以做吗"),
+            ("assistant", "量少时可以做艾灸，需要提前预约哦。"),
+            ("user", "有女技师吗"),
+            ("assistant", "静安店有两位女技师，陈师傅和周师傅，都有8年以上经验。"),
+            ("user", "周六上午呢"),
+            ("assistant", "周六上午陈师傅10:00有空，需要帮您预约吗？"),
+            ("user", "可以，帮我约一下"),
+        ],
+    },
+]
+
+
+def load_conversations(db_path: str) -> List[Dict[str, Any]]:
+    """从聊天数据库读取记录的对话"""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conversations: Dict[str, Dict[str, Any]] = {}
+    for row in conn.execute("SELECT chat_id, raw_data FROM messages ORDER BY chat_id, timestamp ASC"):
+        raw = json.loads(row["raw_data"])
+        conversation = conversations.setdefault(row["chat_id"], {"context": raw.get("contextInfo"), "raw": []})
+        conversation["raw"].append(raw)
+    conn.close()
+    return list(conversations.values())
+
+
+def legacy_messages(customer_message: str, history: List[Dict[str, Any]],
+                    context_info: Dict[str, Any]) -> List[AIMessage]:
+    """旧实现的消息结构：历史repr写入系统提示词，并再次作为消息追加"""
+    context_block = build_context_block(context_info)
+    context_text = f"\n{context_block}" if context_block else ""
+    system_prompt = f"\n你是名医堂的智能客服助理，现在有一个人和你对话{context_text}\n\n\n" \
+                    f"你们的对话聊天历史：{history}\n\n\n{CUSTOMER_SERVICE_INSTRUCTIONS}"
+    messages = [AIMessage(role=MessageRole.SYSTEM, content=system_prompt)]
+    for item in history[-30:]:
+        role = MessageRole.USER if item.get("role") == "user" else MessageRole.ASSISTANT
+        content = item.get("content", "")
+        if content.strip():
+            messages.append(AIMessage(role=role, content=content))
+    messages.append(AIMessage(role=MessageRole.USER, content=customer_message))
+    return messages
+
+
+def replay(conversation: Dict[str, Any]):
+    """逐轮回放对话，返回每个客户回合的 (旧token, 新token, 旧可缓存token, 新可缓存token)"""
+    raw_messages = conversation.get("raw") or [
+        {"role": role, "content": content, "chatId": "sample", "contactName": "sample",
+         "timestamp": f"2025-06-18 10:{i:02d}:00", "messageId": f"msg_{i}"}
+        for i, (role, content) in enumerate(conversation["messages"])
+    ]
+    context_info = conversation.get("context") or {}
+    rows = []
+    previous_legacy = previous_new = None
+    for index, message in enumerate(raw_messages):
+        if message.get("role") != "user":
+            continue
+        history = raw_messages[:index + 1]  # 服务器先入库当前消息，再加载历史
+        legacy = legacy_messages(message.get("content", ""), history, context_info)
+        new = build_customer_service_messages(message.get("content", ""), history, context_info)
+        rows.append((
+            estimate_request_tokens(legacy),
+            estimate_request_tokens(new),
+            shared_prefix_tokens(previous_legacy, legacy) if previous_legacy else 0,
+            shared_prefix_tokens(previous_new, new) if previous_new else 0,
+        ))
+        previous_legacy, previous_new = legacy, new
+    return rows
+
+
+def main():
+    if len(sys.argv) > 1:
+        conversations = load_conversations(sys.argv[1])
+        source = sys.argv[1]
+    else:
+        conversations = SAMPLE_CONVERSATIONS
+        source = "内置示例对话"
+
+    rows = [row for conversation in conversations for row in replay(conversation)]
+    if not rows:
+        print("没有可回放的客户消息")
+        return
+
+    legacy_total = sum(r[0] for r in rows)
+    new_total = sum(r[1] for r in rows)
+    legacy_cached = sum(r[2] for r in rows)
+    new_cached = sum(r[3] for r in rows)
+
+    print(f"📊 提示词token基准测试（{source}，{len(conversations)} 个对话，{len(rows)} 次请求，不含工具定义）")
+    print(f"  旧实现: 平均 {legacy_total / len(rows):.0f} tokens/请求，"
+          f"前缀缓存可复用 {legacy_cached / legacy_total:.1%}")
+    print(f"  新实现: 平均 {new_total / len(rows):.0f} tokens/请求，"
+          f"前缀缓存可复用 {new_cached / new_total:.1%}")
+    print(f"  🚀 输入token减少 {1 - new_total / legacy_total:.1%}，"
+          f"未命中缓存的token从 {(legacy_total - legacy_cached) / len(rows):.0f} "
+          f"降到 {(new_total - new_cached) / len(rows):.0f} /请求")
+
+
+if __name__ == "__main__":
+    main()
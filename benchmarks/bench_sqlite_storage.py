@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+聊天数据库写入基准测试
+在有并发读者（viewdb.py 式的全表查询和模糊搜索）的情况下，对比不同存储配置的写入吞吐和延迟：
+- 默认配置：DELETE日志 + synchronous=FULL，每条消息提交一次（原 add_message 路径）
+- WAL + synchronous=NORMAL + mmap/页缓存，每条消息提交一次
+- WAL + 成组提交：多个聊天并发写入，写线程按 N 条消息 / M 毫秒合并提交（服务器实际路径）
+fsync 越慢（机械硬盘、网络盘）减少提交次数的收益越大；在 tmpfs 上主要体现 WAL 读写不互斥的收益。
+N / M 通过 DB_GROUP_COMMIT_MESSAGES / DB_GROUP_COMMIT_INTERVAL_MS 调整。
+
+用法:
+    python benchmarks/bench_sqlite_storage.py [--messages 2000] [--readers 2] [--producers 32]
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'dianping-scraper', 'backend'))
+os.environ.setdefault("DIANPING_DB_PATH", ":memory:")
+
+from database import DatabaseManager
+from async_database import AsyncDatabase
+from storage_config import StorageConfig
+
+# viewdb.py 中的查询
+VIEWDB_QUERIES = [
+    ("SELECT id, chat_id, role, content, timestamp, raw_data FROM messages ORDER BY timestamp DESC", ()),
+    ("""SELECT id, chat_id, role, content, timestamp, raw_data FROM messages
+        WHERE LOWER(content) LIKE ? OR LOWER(role) LIKE ? OR LOWER(chat_id) LIKE ? OR LOWER(id) LIKE ?
+        ORDER BY timestamp DESC""", ("%预约%",) * 4),
+]
+
+
+def make_messages(count: int, chats: int = 50) -> List[Dict[str, Any]]:
+    return [{
+        "chatId": f"chat_{i % chats}",
+        "contactName": f"客户{i % chats}",
+        "role": "user" if i % 2 == 0 else "assistant",
+        "content": f"第{i}条消息：请问今天下午还能预约颈肩调理吗",
+        "timestamp": f"2025-06-18T{10 + i // 3600 % 10:02d}:{i // 60 % 60:02d}:{i % 60:02d}.000Z",
+    } for i in range(count)]
+
+
+class Readers:
+    """在独立线程中循环执行 viewdb.py 式查询"""
+
+    def __init__(self, db_path: str, count: int):
+        self.db_path = db_path
+        self.count = count
+        self.queries = 0
+        self.errors = 0
+        self._stop = threading.Event()
+        self._threads = [threading.Thread(target=self._run, daemon=True) for _ in range(count)]
+
+    def _run(self):
+        # 与 viewdb.py 相同，使用默认参数打开连接
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        while not self._stop.is_set():
+            for query, params in VIEWDB_QUERIES:
+                try:
+                    conn.execute(query, params).fetchall()
+                    self.queries += 1
+                except sqlite3.OperationalError:
+                    self.errors += 1
+        conn.close()
+
+    def __enter__(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+
+def open_manager(db_path: str, storage: StorageConfig) -> DatabaseManager:
+    DatabaseManager._instance = None
+    return DatabaseManager(db_path, storage=storage)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def bench_per_message(db_path: str, storage: StorageConfig, messages, readers: int) -> Dict[str, Any]:
+    manager = open_manager(db_path, storage)
+    latencies = []
+    with Readers(db_path, readers) as reader:
+        start = time.perf_counter()
+        for message in messages:
+            began = time.perf_counter()
+            manager.add_message(message)
+            latencies.append(time.perf_counter() - began)
+        elapsed = time.perf_counter() - start
+    manager.close()
+    return {"elapsed": elapsed, "latencies": latencies, "commits": len(messages),
+            "reader_queries": reader.queries, "reader_errors": reader.errors}
+
+
+def bench_group_commit(db_path: str, storage: StorageConfig, messages, readers: int, producers: int) -> Dict[str, Any]:
+    manager = open_manager(db_path, storage)
+    latencies = []
+
+    async def produce(db: AsyncDatabase, chunk):
+        for message in chunk:
+            began = time.perf_counter()
+            await db.add_message(message)
+            latencies.append(time.perf_counter() - began)
+
+    async def run():
+        db = AsyncDatabase(manager)
+        start = time.perf_counter()
+        await asyncio.gather(*(produce(db, messages[i::producers]) for i in range(producers)))
+        elapsed = time.perf_counter() - start
+        stats = db.get_stats()
+        await db.close()
+        return elapsed, stats
+
+    with Readers(db_path, readers) as reader:
+        elapsed, stats = asyncio.run(run())
+    manager.close()
+    return {"elapsed": elapsed, "latencies": latencies, "commits": stats["commits"],
+            "reader_queries": reader.queries, "reader_errors": reader.errors}
+
+
+def report(name: str, result: Dict[str, Any], count: int, baseline: float = None):
+    rate = count / result["elapsed"]
+    latencies = result["latencies"]
+    speedup = f"  🚀 {rate / baseline:.1f}x" if baseline else ""
+    print(f"  {name:28s}: {rate:8.0f} 条/秒，p50 {percentile(latencies, 50) * 1000:6.2f}ms，"
+          f"p99 {percentile(latencies, 99) * 1000:6.2f}ms，提交 {result['commits']} 次，"
+          f"读者查询 {result['reader_queries']} 次（失败 {result['reader_errors']}）{speedup}")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="聊天数据库写入基准测试")
+    parser.add_argument("--messages", type=int, default=2000, help="写入的消息条数")
+    parser.add_argument("--readers", type=int, default=2, help="并发读者线程数")
+    parser.add_argument("--producers", type=int, default=32, help="成组提交场景的并发写入协程数")
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages)
+    tuned = StorageConfig.from_env()
+    scenarios = [
+        ("默认配置（逐条提交）", StorageConfig(journal_mode="DELETE", synchronous="FULL", mmap_size=0, cache_size_kb=2000), False),
+        ("WAL+NORMAL（逐条提交）", tuned, False),
+        (f"WAL+成组提交（{tuned.group_commit_messages}条/{tuned.group_commit_interval_ms:g}ms）", tuned, True),
+    ]
+
+    print(f"📊 聊天数据库写入基准测试（{args.messages} 条消息，{args.readers} 个并发读者，"
+          f"成组提交场景 {args.producers} 个并发写入）")
+    baseline = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for index, (name, storage, grouped) in enumerate(scenarios):
+            db_path = os.path.join(tmp, f"history_{index}.db")
+            if grouped:
+                result = bench_group_commit(db_path, storage, messages, args.readers, args.producers)
+            else:
+                result = bench_per_message(db_path, storage, messages, args.readers)
+            rate = report(name, result, args.messages, baseline)
+            baseline = baseline or rate
+
+
+if __name__ == "__main__":
+    main()
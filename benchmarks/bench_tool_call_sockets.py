@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+函数调用连接数基准测试
+统计100次工具调用过程中向数据库API（本地模拟Node服务）建立的TCP连接数：
+对比「每次调用新建DatabaseAPIService」与「服务容器共享DatabaseAPIService」
+
+用法:
+    python benchmarks/bench_tool_call_sockets.py [调用次数]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+from aiohttp import web
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from aiclient.adapters.openai_adapter import OpenAIAdapter
+from aiclient.config import ModelConfig, AIProvider
+from aiclient.database_service import DatabaseAPIService
+from aiclient.services import ServiceContainer
+
+
+async def start_stub_api():
+    """启动本地模拟数据库API，记录每个请求的客户端连接"""
+    peers = set()
+
+    async def stores(request):
+        peers.add(request.transport.get_extra_info("peername"))
+        return web.json_response({"success": True, "data": {"stores": [{"id": 1, "name": "名医堂"}]}})
+
+    app = web.Application()
+    app.router.add_get("/api/v1/client/stores", stores)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}", peers
+
+
+async def bench_service_per_call(base_url: str, calls: int):
+    """旧实现：每次函数调用新建并关闭DatabaseAPIService"""
+    for _ in range(calls):
+        db_service = DatabaseAPIService(base_url)
+        try:
+            await db_service.get_stores()
+        finally:
+            await db_service.close()
+
+
+async def bench_shared_container(base_url: str, calls: int):
+    """新实现：适配器通过服务容器复用同一个DatabaseAPIService"""
+    services = ServiceContainer(api_base_url=base_url)
+    adapter = OpenAIAdapter(ModelConfig(
+        provider=AIProvider.OPENAI, model_name="bench", api_key="bench-key", base_url="http://127.0.0.1:1"
+    ), services)
+    try:
+        for _ in range(calls):
+            await adapter.execute_function_call("get_stores", {})
+    finally:
+        await services.close()
+
+
+async def main(calls: int):
+    print(f"📊 工具调用连接数基准测试 ({calls} 次 get_stores 调用)")
+    for name, bench in (("每次新建服务 (优化前)", bench_service_per_call),
+                        ("共享服务容器 (优化后)", bench_shared_container)):
+        runner, base_url, peers = await start_stub_api()
+        try:
+            start = time.perf_counter()
+            await bench(base_url, calls)
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"  {name:<20} 建立连接数 {len(peers):4d} | 总耗时 {elapsed:8.1f} ms")
+        finally:
+            await runner.cleanup()
+
+
+if __name__ == "__main__":
+    import logging
+    logging.disable(logging.INFO)
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100))
@@ -0,0 +1,217 @@
+"""
+异步数据库门面
+sqlite3 的调用是阻塞的，直接在事件循环里执行会拖慢所有WebSocket连接。这里把数据库操作移出事件循环：
+- 写操作进入队列，由专用写线程按批取出，在一个事务中执行后统一提交（成组提交）：
+  累计到 N 条消息或第一条写入已等待 M 毫秒即提交，参数来自 StorageConfig
+- 读操作在线程池中执行，使用 DatabaseManager 的只读连接池
+同步代码仍可直接使用 db_manager。
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from database import DatabaseManager, HistoryCursor, HistoryPage, READ_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class _WriteJob:
+    """一次待执行的批量写入"""
+
+    __slots__ = ("messages", "future", "loop")
+
+    def __init__(self, messages: List[Dict[str, Any]], future: asyncio.Future, loop: asyncio.AbstractEventLoop):
+        self.messages = messages
+        self.future = future
+        self.loop = loop
+
+
+def _resolve(future: asyncio.Future, result: Any = None, error: Optional[BaseException] = None):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class AsyncDatabase:
+    """DatabaseManager 的异步封装"""
+
+    def __init__(self, manager: DatabaseManager, read_pool_size: int = READ_POOL_SIZE,
+                 flush_messages: Optional[int] = None, flush_interval_ms: Optional[float] = None):
+        """
+        Args:
+            manager: 同步数据库管理器
+            read_pool_size: 读线程数
+            flush_messages: 一次提交累计的消息条数上限，默认取 manager.storage.group_commit_messages
+            flush_interval_ms: 第一条写入到达后最多等待多久提交，默认取 manager.storage.group_commit_interval_ms
+        """
+        self.manager = manager
+        storage = manager.storage
+        self.flush_messages = max(1, flush_messages if flush_messages is not None else storage.group_commit_messages)
+        self.flush_interval = max(0.0, (flush_interval_ms if flush_interval_ms is not None
+                                        else storage.group_commit_interval_ms) / 1000)
+        self.logger = logger.getChild(self.__class__.__name__)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._readers = ThreadPoolExecutor(max_workers=max(1, read_pool_size), thread_name_prefix="db-reader")
+        self._writer = threading.Thread(target=self._write_loop, name="db-writer", daemon=True)
+        self._closed = False
+        self.stats = {"write_jobs": 0, "write_messages": 0, "batches": 0, "commits": 0,
+                      "failed_batches": 0, "failed_jobs": 0, "reads": 0, "max_commit_ms": 0.0}
+        self._writer.start()
+
+    # ---------- 写 ----------
+
+    async def add_messages_bulk(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量添加消息，返回新增的消息（与 DatabaseManager.add_messages_bulk 相同）"""
+        if self._closed:
+            raise RuntimeError("AsyncDatabase 已关闭")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put(_WriteJob(list(messages), future, loop))
+        return await future
+
+    async def add_message(self, message: Dict[str, Any]) -> bool:
+        """添加一条消息，返回是否为新消息"""
+        return bool(await self.add_messages_bulk([message]))
+
+    def _write_loop(self):
+        while True:
+            job = self._queue.get()
+            if job is _STOP:
+                return
+            batch = [job]
+            size = len(job.messages)
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            # 累计到 flush_messages 条消息或等到 deadline 后提交
+            while size < self.flush_messages:
+                remaining = deadline - time.monotonic()
+                try:
+                    job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is _STOP:
+                    stop = True
+                    break
+                batch.append(job)
+                size += len(job.messages)
+            try:
+                self._commit_batch(batch)
+            except Exception as e:
+                # 任何异常都不能让写线程退出，否则之后的写入会永远等待
+                self.logger.error(f"[数据库] 写线程处理批次出错: {e}", exc_info=True)
+                self._fail_batch(batch, e)
+            if stop:
+                return
+
+    def _commit_batch(self, batch: List[_WriteJob]):
+        """
+        在一个事务中执行一批写入，只提交一次
+        每个写入请求在自己的 SAVEPOINT 中执行：单个请求失败只回滚并返回它自己的错误，
+        同批其他请求照常提交；提交失败时整批回滚并逐个返回错误
+        """
+        manager = self.manager
+        conn = manager.conn
+        self.stats["batches"] += 1
+        self.stats["write_jobs"] += len(batch)
+        self.stats["write_messages"] += sum(len(job.messages) for job in batch)
+        results: List[Any] = []
+        errors: List[Optional[BaseException]] = []
+        with manager._write_lock:
+            started = time.perf_counter()
+            try:
+                # SAVEPOINT 在事务外会自己开启事务，释放时即提交，这里先显式开启事务
+                if not conn.in_transaction:
+                    conn.execute("BEGIN")
+                for job in batch:
+                    conn.execute("SAVEPOINT write_job")
+                    try:
+                        results.append(manager._stage_messages(job.messages))
+                        errors.append(None)
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO write_job")
+                        results.append(None)
+                        errors.append(e)
+                        self.stats["failed_jobs"] += 1
+                        self.logger.error(f"[数据库] 写入请求失败，已单独回滚 ({len(job.messages)} 条消息): {e}")
+                    conn.execute("RELEASE write_job")
+                conn.commit()
+                self.stats["commits"] += 1
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self.stats["max_commit_ms"] = max(self.stats["max_commit_ms"], round(elapsed_ms, 3))
+            except Exception as e:
+                manager._rollback()
+                self.stats["failed_batches"] += 1
+                self.logger.error(f"[数据库] 成组提交失败 ({len(batch)} 个写入请求): {e}")
+                self._fail_batch(batch, e)
+                return
+            if any(error is not None for error in errors):
+                # 失败的请求可能已把未提交的ID记入过滤器，按已提交的数据重建
+                manager.seen_filter.clear()
+                manager._rebuild_seen_filter()
+        for job, result, error in zip(batch, results, errors):
+            self._notify(job, result, error)
+
+    def _fail_batch(self, batch: List[_WriteJob], error: BaseException):
+        for job in batch:
+            self._notify(job, None, error)
+
+    def _notify(self, job: _WriteJob, result: Any = None, error: Optional[BaseException] = None):
+        try:
+            job.loop.call_soon_threadsafe(_resolve, job.future, result, error)
+        except RuntimeError:
+            # 发起写入的事件循环已关闭，没有人等待结果
+            pass
+
+    # ---------- 读 ----------
+
+    async def _read(self, func, *args):
+        self.stats["reads"] += 1
+        return await asyncio.get_running_loop().run_in_executor(self._readers, func, *args)
+
+    async def get_chat_history(self, chat_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        return await self._read(self.manager.get_chat_history, chat_id, limit)
+
+    async def get_history_page(self, chat_id: str, limit: int = 50, before: Optional[HistoryCursor] = None,
+                               since_id: Optional[str] = None, include_raw: bool = False) -> HistoryPage:
+        return await self._read(self.manager.get_history_page, chat_id, limit, before, since_id, include_raw)
+
+    async def should_reply_to_chat(self, chat_id: str, contact_name: str = None) -> bool:
+        return await self._read(self.manager.should_reply_to_chat, chat_id, contact_name)
+
+    async def is_message_processed(self, message_id: str) -> bool:
+        return await self._read(self.manager.is_message_processed, message_id)
+
+    async def get_active_chats(self, hours: int = 24) -> List[Dict[str, Any]]:
+        return await self._read(self.manager.get_active_chats, hours)
+
+    # ---------- 生命周期 ----------
+
+    async def close(self):
+        """等待已排队的写入完成后停止写线程和读线程池"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._writer.join)
+        await loop.run_in_executor(None, self._readers.shutdown)
+        self.logger.info("[数据库] 异步数据库已关闭")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息（avg_batch 为平均每次提交合并的写入请求数）"""
+        batches = self.stats["batches"]
+        return {
+            **self.stats,
+            "avg_batch": round(self.stats["write_jobs"] / batches, 2) if batches else None,
+            "queued": self._queue.qsize(),
+        }
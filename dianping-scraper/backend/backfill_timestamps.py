@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+聊天数据库时间戳回填工具
+为已有的 dianping_history.db 回填 messages.ts_epoch（UTC毫秒）并重建 chat_state。
+服务器启动时会自动回填 ts_epoch 为空的行；--recompute 会清空后按当前规则重新计算全部行，
+用于修正旧版本按字符串或UTC+8硬编码解析写入的结果。
+
+用法:
+    python backfill_timestamps.py [dianping_history.db] [--recompute]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="聊天数据库时间戳回填工具")
+    parser.add_argument("path", nargs="?", default="dianping_history.db", help="聊天数据库文件")
+    parser.add_argument("--recompute", action="store_true", help="重新计算所有消息的 ts_epoch")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        print(f"文件不存在: {args.path}")
+        return 1
+
+    if args.recompute:
+        conn = sqlite3.connect(args.path)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+        if "ts_epoch" in columns:
+            conn.execute("UPDATE messages SET ts_epoch = NULL")
+            conn.commit()
+        conn.close()
+
+    # 数据库管理器在导入时按 DIANPING_DB_PATH 打开数据库，打开时完成迁移和回填
+    os.environ["DIANPING_DB_PATH"] = args.path
+    started = time.perf_counter()
+    from database import db_manager
+    elapsed = time.perf_counter() - started
+
+    stats = db_manager.backfill_stats
+    total = sum(stats.values())
+    remaining = db_manager.conn.execute("SELECT COUNT(*) FROM messages WHERE ts_epoch IS NULL").fetchone()[0]
+    chats = db_manager.conn.execute("SELECT COUNT(*) FROM chat_state").fetchone()[0]
+    db_manager.close()
+
+    print(f"📊 {args.path}: 回填 {total} 条消息，耗时 {elapsed:.2f}s"
+          f"（SQL批量 {stats['sql']}，Python逐行 {stats['python']}，使用入库时间 {stats['processed_at']}）")
+    print(f"  chat_state: {chats} 个聊天，仍无时间戳的消息: {remaining}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
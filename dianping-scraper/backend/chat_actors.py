@@ -0,0 +1,153 @@
+"""
+按聊天划分的消息处理队列
+每个 chatId 对应一个独立的工作协程（actor），同一聊天的消息按到达顺序串行处理，
+不同聊天之间并行处理；WebSocket 接收循环只负责投递，不再等待AI回复完成。
+所有聊天共享一个全局AI调用并发上限。
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class _ChatActor:
+    """单个聊天的消息队列和工作协程"""
+
+    def __init__(self, chat_id: str):
+        self.chat_id = chat_id
+        self.queue: "asyncio.Queue[tuple]" = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+        self.processed = 0
+
+
+class ChatActorPool:
+    """按聊天划分的消息处理池"""
+
+    def __init__(self, max_concurrent_ai: int = 4, idle_timeout: float = 60.0):
+        """
+        Args:
+            max_concurrent_ai: 全局同时进行的AI调用上限
+            idle_timeout: 聊天队列空闲多久后回收其工作协程（秒）
+        """
+        self.max_concurrent_ai = max_concurrent_ai
+        self.idle_timeout = idle_timeout
+        self._actors: Dict[str, _ChatActor] = {}
+        self._ai_semaphore = asyncio.Semaphore(max_concurrent_ai)
+        self.logger = logger.getChild(self.__class__.__name__)
+        self.stats = {
+            "submitted": 0, "processed": 0, "failed": 0,
+            "ai_calls": 0, "ai_in_flight": 0, "ai_waiting": 0, "ai_peak": 0, "max_queue_depth": 0,
+        }
+
+    def submit(self, chat_id: str, job: Job) -> "asyncio.Future":
+        """
+        把任务投递到聊天的队列，立即返回
+
+        Args:
+            chat_id: 聊天ID
+            job: 无参数的协程函数，由该聊天的工作协程按顺序执行
+
+        Returns:
+            任务结果的Future（任务异常时设置为异常）
+        """
+        actor = self._actors.get(chat_id)
+        if actor is None:
+            actor = self._actors[chat_id] = _ChatActor(chat_id)
+        future = asyncio.get_running_loop().create_future()
+        actor.queue.put_nowait((job, future))
+        if actor.task is None or actor.task.done():
+            actor.task = asyncio.create_task(self._run(actor), name=f"chat-actor-{chat_id}")
+        self.stats["submitted"] += 1
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], actor.queue.qsize())
+        return future
+
+    async def _run(self, actor: _ChatActor):
+        """聊天的工作协程：按顺序处理队列中的任务，空闲超时后退出"""
+        while True:
+            try:
+                job, future = await asyncio.wait_for(actor.queue.get(), timeout=self.idle_timeout)
+            except asyncio.TimeoutError:
+                # 空闲回收；wait_for 超时与投递之间没有 await，不会丢任务
+                if actor.queue.empty() and self._actors.get(actor.chat_id) is actor:
+                    del self._actors[actor.chat_id]
+                    self.logger.debug(f"[聊天队列] {actor.chat_id} 空闲，回收工作协程")
+                    return
+                continue
+
+            try:
+                result = await job()
+                if not future.done():
+                    future.set_result(result)
+                self.stats["processed"] += 1
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.cancel()
+                raise
+            except Exception as e:
+                self.stats["failed"] += 1
+                self.logger.error(f"[聊天队列] {actor.chat_id} 处理消息失败: {e}", exc_info=True)
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                actor.processed += 1
+                actor.queue.task_done()
+
+    def ai_slot(self) -> "_AISlot":
+        """
+        获取一个全局AI调用名额（异步上下文管理器）
+
+        用法:
+            async with pool.ai_slot():
+                await ai_client.generate_customer_service_reply(...)
+        """
+        return _AISlot(self)
+
+    async def join(self):
+        """等待当前所有队列处理完毕"""
+        for actor in list(self._actors.values()):
+            await actor.queue.join()
+
+    async def close(self):
+        """取消所有工作协程"""
+        tasks = [actor.task for actor in self._actors.values() if actor.task and not actor.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._actors.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            **self.stats,
+            "active_chats": len(self._actors),
+            "queued": sum(actor.queue.qsize() for actor in self._actors.values()),
+            "max_concurrent_ai": self.max_concurrent_ai,
+        }
+
+
+class _AISlot:
+    """全局AI调用名额"""
+
+    def __init__(self, pool: ChatActorPool):
+        self.pool = pool
+
+    async def __aenter__(self):
+        stats = self.pool.stats
+        stats["ai_waiting"] += 1
+        try:
+            await self.pool._ai_semaphore.acquire()
+        finally:
+            stats["ai_waiting"] -= 1
+        stats["ai_calls"] += 1
+        stats["ai_in_flight"] += 1
+        stats["ai_peak"] = max(stats["ai_peak"], stats["ai_in_flight"])
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.pool.stats["ai_in_flight"] -= 1
+        self.pool._ai_semaphore.release()
+        return False
@@ -18,13 +18,30 @@ class Config:
     
     # 数据存储配置
     DATA_STORE_PATH = os.getenv("DATA_STORE_PATH", "./data")
-    MAX_DATA_ENTRIES = int(os.getenv("MAX_DATA_ENTRIES", 1000))
+    MAX_DATA_ENTRIES = int(os.getenv("MAX_DATA_ENTRIES", 1000))  # 内存中保留的上报数据条数
+    DATA_STORE_MAX_BYTES = int(os.getenv("DATA_STORE_MAX_BYTES", 32 * 1024 * 1024))  # 内存中上报数据的总字节数上限
+    DATA_STORE_TTL_SECONDS = float(os.getenv("DATA_STORE_TTL_SECONDS", 3600))  # 上报数据在内存中保留的时间，0 表示不限
+    DATA_STORE_SPILL = os.getenv("DATA_STORE_SPILL", "false").lower() == "true"  # 淘汰的数据是否写入 DATA_STORE_PATH
+    DATA_STORE_SEGMENT_BYTES = int(os.getenv("DATA_STORE_SEGMENT_BYTES", 4 * 1024 * 1024))  # 单个磁盘分段文件大小
+    DATA_STORE_MAX_SEGMENTS = int(os.getenv("DATA_STORE_MAX_SEGMENTS", 8))  # 保留的磁盘分段文件数
+    DB_READ_THREADS = int(os.getenv("DB_READ_THREADS", 4))  # 执行历史查询等读操作的线程数
     
     # WebSocket连接配置
     PING_INTERVAL = int(os.getenv("PING_INTERVAL", 20))
     PING_TIMEOUT = int(os.getenv("PING_TIMEOUT", 10))
     MAX_CONNECTIONS = int(os.getenv("MAX_CONNECTIONS", 10))
     
+    # AI回复配置
+    AI_STREAMING = os.getenv("AI_STREAMING", "true").lower() == "true"  # 是否流式推送回复预览
+    STREAM_DELTA_INTERVAL = float(os.getenv("STREAM_DELTA_INTERVAL", 0.3))  # 预览推送最小间隔（秒）
+    MAX_CONCURRENT_AI_CALLS = int(os.getenv("MAX_CONCURRENT_AI_CALLS", 4))  # 所有聊天同时进行的AI调用上限
+    CHAT_QUEUE_IDLE_SECONDS = float(os.getenv("CHAT_QUEUE_IDLE_SECONDS", 60))  # 聊天队列空闲回收时间（秒）
+    AI_REPLY_DEBOUNCE_SECONDS = float(os.getenv("AI_REPLY_DEBOUNCE_SECONDS", 1.5))  # 最后一条客户消息后等待多久再回复
+    AI_REPLY_DEBOUNCE_MAX_WAIT = float(os.getenv("AI_REPLY_DEBOUNCE_MAX_WAIT", 6))  # 连续来消息时最长等待（秒）
+    AI_HISTORY_LIMIT = int(os.getenv("AI_HISTORY_LIMIT", 50))  # 生成回复时读取的最近历史条数
+    CONVERSATION_CACHE_MAX_BYTES = int(os.getenv("CONVERSATION_CACHE_MAX_BYTES", 8 * 1024 * 1024))  # 对话缓存总大小上限
+    CONVERSATION_CACHE_IDLE_SECONDS = float(os.getenv("CONVERSATION_CACHE_IDLE_SECONDS", 1800))  # 聊天空闲多久后移出缓存
+    
     # 大众点评特定配置
     DIANPING_DOMAIN = "dianping.com"
     ALLOWED_ORIGINS = [
@@ -48,9 +65,26 @@ class Config:
                 "level": cls.LOG_LEVEL,
                 "file": cls.LOG_FILE
             },
+            "ai": {
+                "streaming": cls.AI_STREAMING,
+                "stream_delta_interval": cls.STREAM_DELTA_INTERVAL,
+                "max_concurrent_calls": cls.MAX_CONCURRENT_AI_CALLS,
+                "chat_queue_idle_seconds": cls.CHAT_QUEUE_IDLE_SECONDS,
+                "reply_debounce_seconds": cls.AI_REPLY_DEBOUNCE_SECONDS,
+                "reply_debounce_max_wait": cls.AI_REPLY_DEBOUNCE_MAX_WAIT,
+                "history_limit": cls.AI_HISTORY_LIMIT,
+                "conversation_cache_max_bytes": cls.CONVERSATION_CACHE_MAX_BYTES,
+                "conversation_cache_idle_seconds": cls.CONVERSATION_CACHE_IDLE_SECONDS
+            },
             "data": {
                 "store_path": cls.DATA_STORE_PATH,
-                "max_entries": cls.MAX_DATA_ENTRIES
+                "max_entries": cls.MAX_DATA_ENTRIES,
+                "max_bytes": cls.DATA_STORE_MAX_BYTES,
+                "ttl_seconds": cls.DATA_STORE_TTL_SECONDS,
+                "spill": cls.DATA_STORE_SPILL,
+                "segment_bytes": cls.DATA_STORE_SEGMENT_BYTES,
+                "max_segments": cls.DATA_STORE_MAX_SEGMENTS,
+                "db_read_threads": cls.DB_READ_THREADS
             },
             "dianping": {
                 "domain": cls.DIANPING_DOMAIN,
@@ -0,0 +1,216 @@
+"""
+按聊天缓存最近的对话
+AI回复需要聊天最近的历史，而这些消息大多是服务器刚刚写入数据库的。缓存每个聊天最近 N 条消息
+（角色、内容、UTC毫秒时间），写入数据库成功后同步追加（write-through），命中时不再查询SQLite。
+- 按聊天LRU，总大小按估算字节数限制
+- 长时间没有访问的聊天被回收
+- 从数据库加载期间该聊天有新写入时放弃本次缓存，避免缓存缺少这条消息
+- 写入结果无法确定（写入失败或被取消）时丢弃该聊天的缓存，下次读取重新加载
+"""
+
+import bisect
+import logging
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+from timestamps import normalize_timestamp
+
+logger = logging.getLogger(__name__)
+
+# 每条消息除内容外的估算开销（字典、角色字符串、时间戳整数）
+MESSAGE_OVERHEAD_BYTES = sys.getsizeof({}) + 100
+
+
+def estimate_message_bytes(message: Dict[str, Any]) -> int:
+    return len(str(message.get("content") or "").encode("utf-8")) + MESSAGE_OVERHEAD_BYTES
+
+
+class _ChatHistory:
+    """一个聊天缓存的最近消息（按时间正序）"""
+
+    __slots__ = ("messages", "keys", "bytes", "complete", "last_access")
+
+    def __init__(self, complete: bool, now: float):
+        self.messages: List[Dict[str, Any]] = []
+        self.keys: List[int] = []  # 与 messages 对应的时间，用于有序插入
+        self.bytes = 0
+        self.complete = complete  # 是否包含该聊天的全部消息
+        self.last_access = now
+
+
+class _Load:
+    """一个聊天正在进行的数据库加载"""
+
+    __slots__ = ("loaders", "dirty")
+
+    def __init__(self):
+        self.loaders = 0  # 尚未 put 或 cancel_load 的加载数
+        self.dirty = False  # 加载期间是否有新写入
+
+
+class ConversationCache:
+    """按聊天LRU的对话缓存"""
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024, max_messages: int = 50, idle_seconds: float = 1800):
+        """
+        Args:
+            max_bytes: 所有聊天缓存的估算总字节数上限
+            max_messages: 每个聊天缓存的最近消息条数（与AI读取的历史条数一致）
+            idle_seconds: 聊天多久没有访问后回收
+        """
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+        self.idle_seconds = idle_seconds
+        self._chats: "OrderedDict[str, _ChatHistory]" = OrderedDict()
+        self._loading: Dict[str, _Load] = {}  # 正在从数据库加载的聊天
+        self.bytes = 0
+        self.logger = logger.getChild(self.__class__.__name__)
+        self.stats = {"hits": 0, "misses": 0, "appends": 0, "evicted_lru": 0,
+                      "evicted_idle": 0, "load_races": 0, "invalidated": 0}
+
+    def get(self, chat_id: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        读取聊天最近的消息
+
+        Returns:
+            消息列表的副本（按时间正序）；未缓存时返回 None，并开始记录该聊天的写入，
+            调用方从数据库加载后必须调用 put，加载失败或被取消时必须调用 cancel_load
+        """
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            self.stats["misses"] += 1
+            self._loading.setdefault(chat_id, _Load()).loaders += 1
+            return None
+        self.stats["hits"] += 1
+        entry.last_access = time.monotonic()
+        self._chats.move_to_end(chat_id)
+        return list(entry.messages)
+
+    def put(self, chat_id: str, messages: List[Dict[str, Any]], complete: bool = False) -> bool:
+        """
+        缓存从数据库加载的消息
+
+        Args:
+            chat_id: 聊天ID
+            messages: 按时间正序的最近消息（role、content、timestamp 为UTC毫秒）
+            complete: 是否为该聊天的全部消息
+
+        Returns:
+            是否已缓存（加载期间该聊天有新写入时不缓存）
+        """
+        if self._finish_load(chat_id):
+            self.stats["load_races"] += 1
+            return False
+        if not messages:
+            # 空结果可能来自读取失败，不缓存
+            return False
+        self._discard(chat_id)
+        entry = _ChatHistory(complete, time.monotonic())
+        for message in messages[-self.max_messages:]:
+            self._insert(entry, message, int(message.get("timestamp") or 0))
+        if len(messages) > self.max_messages:
+            entry.complete = False
+        self._chats[chat_id] = entry
+        self.bytes += entry.bytes
+        self._evict_lru()
+        return chat_id in self._chats
+
+    def cancel_load(self, chat_id: str):
+        """get 未命中后的加载失败或被取消，不再记录该次加载"""
+        self._finish_load(chat_id)
+
+    def _finish_load(self, chat_id: str) -> bool:
+        """结束一次加载，返回加载期间是否有新写入"""
+        load = self._loading.get(chat_id)
+        if load is None:
+            return False
+        load.loaders -= 1
+        if load.loaders <= 0:
+            del self._loading[chat_id]
+        return load.dirty
+
+    def append(self, chat_id: str, messages: Iterable[Dict[str, Any]]):
+        """
+        数据库写入成功后追加新消息（未缓存的聊天只记录有写入，下次读取时从数据库加载）
+
+        Args:
+            chat_id: 聊天ID
+            messages: 新写入数据库的原始消息
+        """
+        messages = list(messages)
+        if not messages:
+            return
+        self._mark_dirty(chat_id)
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            return
+        before = entry.bytes
+        for message in messages:
+            ts = normalize_timestamp(message.get("timestamp")).epoch_ms
+            # 窗口已满时早于窗口的消息不属于最近 N 条
+            if not entry.complete and len(entry.messages) >= self.max_messages and entry.keys and ts < entry.keys[0]:
+                continue
+            self._insert(entry, {"role": message.get("role", "unknown"),
+                                 "content": message.get("content", ""), "timestamp": ts}, ts)
+            self.stats["appends"] += 1
+        while len(entry.messages) > self.max_messages:
+            entry.bytes -= estimate_message_bytes(entry.messages.pop(0))
+            entry.keys.pop(0)
+            entry.complete = False
+        self.bytes += entry.bytes - before
+        self._evict_lru()
+
+    def invalidate(self, chat_id: str):
+        """丢弃聊天的缓存（例如写入失败、无法确定数据库状态时）"""
+        self._mark_dirty(chat_id)
+        self._discard(chat_id)
+        self.stats["invalidated"] += 1
+
+    def _mark_dirty(self, chat_id: str):
+        load = self._loading.get(chat_id)
+        if load is not None:
+            load.dirty = True
+
+    def evict_idle(self) -> int:
+        """回收长时间没有访问的聊天，返回回收的聊天数"""
+        deadline = time.monotonic() - self.idle_seconds
+        idle = [chat_id for chat_id, entry in self._chats.items() if entry.last_access < deadline]
+        for chat_id in idle:
+            self._discard(chat_id)
+        self.stats["evicted_idle"] += len(idle)
+        if idle:
+            self.logger.info(f"[对话缓存] 回收 {len(idle)} 个空闲聊天")
+        return len(idle)
+
+    def _insert(self, entry: _ChatHistory, message: Dict[str, Any], ts: int):
+        # 时间相同的消息保持写入顺序
+        position = bisect.bisect_right(entry.keys, ts)
+        entry.keys.insert(position, ts)
+        entry.messages.insert(position, message)
+        entry.bytes += estimate_message_bytes(message)
+
+    def _discard(self, chat_id: str):
+        entry = self._chats.pop(chat_id, None)
+        if entry is not None:
+            self.bytes -= entry.bytes
+
+    def _evict_lru(self):
+        while self.bytes > self.max_bytes and self._chats:
+            chat_id, entry = self._chats.popitem(last=False)
+            self.bytes -= entry.bytes
+            self.stats["evicted_lru"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息（hit_rate 为命中缓存的读取比例，bytes 为估算内存占用）"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else None,
+            "chats": len(self._chats),
+            "loading": len(self._loading),
+            "messages": sum(len(entry.messages) for entry in self._chats.values()),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+        }
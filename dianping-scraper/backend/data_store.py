@@ -0,0 +1,304 @@
+"""
+扩展上报数据（dianping_data 对象和数据列表）的有界存储
+服务器长期运行时每条上报都会保留，原来的字典只增不减。这里按接收顺序保存最近的数据：
+- 条数和字节数都有上限，超过时淘汰最早的数据
+- 超过保留时间（TTL）的数据被淘汰
+- 可选：被淘汰的数据追加写入磁盘上的 JSONL 分段文件（只追加，分段数有上限，超过时删除最早的分段）
+- 按 data_id 或接收时间范围查询，内存和磁盘分段统一查询
+内存中每条数据只保存序列化后的字节串，字节数即占用，写入磁盘时无需再次序列化。
+"""
+
+import logging
+import os
+import re
+import sys
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from aiclient import serialization
+from timestamps import now_ms, parse_epoch_ms
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PATTERN = re.compile(r"^data-(\d{6,})\.jsonl$")
+
+
+class _Entry:
+    """内存中的一条数据"""
+
+    __slots__ = ("received_ms", "entry_type", "line")
+
+    def __init__(self, received_ms: int, entry_type: str, line: bytes):
+        self.received_ms = received_ms
+        self.entry_type = entry_type
+        self.line = line  # 序列化后的完整记录（不含换行）
+
+
+class _Segment:
+    """磁盘上的一个分段文件及其索引"""
+
+    __slots__ = ("path", "records", "bytes")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records: List[Tuple[int, int, str, str]] = []  # (received_ms, 偏移, data_id, 类型)，按写入顺序
+        self.bytes = 0
+
+
+class DataStore:
+    """按条数、字节数和保留时间限制的数据存储"""
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 32 * 1024 * 1024, ttl_seconds: float = 3600,
+                 spill_dir: Optional[str] = None, segment_bytes: int = 4 * 1024 * 1024, max_segments: int = 8):
+        """
+        Args:
+            max_entries: 内存中保留的最多条数
+            max_bytes: 内存中保留数据的序列化总字节数上限
+            ttl_seconds: 数据在内存中保留的时间，0 表示不按时间淘汰
+            spill_dir: 淘汰数据写入的目录，None 表示直接丢弃
+            segment_bytes: 单个分段文件达到该大小后写入新分段
+            max_segments: 保留的分段文件数，超过时删除最早的分段
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.spill_dir = spill_dir
+        self.segment_bytes = segment_bytes
+        self.max_segments = max(1, max_segments)
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.bytes = 0
+        self._segments: "OrderedDict[int, _Segment]" = OrderedDict()
+        self._spilled: Dict[str, Tuple[int, int]] = {}  # data_id -> (分段序号, 偏移)，同一 data_id 以最后写入为准
+        self._writer = None
+        self._writer_seq: Optional[int] = None
+        self.logger = logger.getChild(self.__class__.__name__)
+        self.stats = {"added": 0, "replaced": 0, "evicted_size": 0, "evicted_ttl": 0,
+                      "spilled": 0, "spill_errors": 0, "dropped_segments": 0}
+        if spill_dir:
+            self._load_segments()
+
+    def add(self, data_id: str, entry_type: str, content: Any, timestamp: Optional[str] = None) -> Dict[str, Any]:
+        """
+        保存一条数据，已有相同 data_id 时替换
+
+        Args:
+            data_id: 数据ID
+            entry_type: 数据类型（如 dianping_data_object、dianping_data_list）
+            content: 数据内容（可JSON序列化）
+            timestamp: 接收时间字符串，原样保存
+
+        Returns:
+            保存的记录（不含 content）
+        """
+        received_ms = now_ms()
+        record = {"data_id": data_id, "type": entry_type, "timestamp": timestamp,
+                  "received_ms": received_ms, "content": content}
+        line = serialization.dumpb(record)
+        old = self._entries.pop(data_id, None)
+        if old is not None:
+            self.bytes -= len(old.line)
+            self.stats["replaced"] += 1
+        self._entries[data_id] = _Entry(received_ms, entry_type, line)
+        self.bytes += len(line)
+        self.stats["added"] += 1
+        self._evict(received_ms)
+        return {key: value for key, value in record.items() if key != "content"}
+
+    def get(self, data_id: str) -> Optional[Dict[str, Any]]:
+        """按 data_id 读取数据（先查内存，再查磁盘分段），不存在时返回 None"""
+        entry = self._entries.get(data_id)
+        if entry is not None:
+            return serialization.loads(entry.line)
+        location = self._spilled.get(data_id)
+        if location is None:
+            return None
+        records = self._read_records(location[0], [location[1]])
+        return records[0] if records else None
+
+    def query(self, since: Any = None, until: Any = None, entry_type: Optional[str] = None,
+              limit: int = 100, include_spilled: bool = True) -> List[Dict[str, Any]]:
+        """
+        按接收时间范围查询数据
+
+        Args:
+            since: 起始时间（含），UTC毫秒或ISO字符串，None 表示不限
+            until: 结束时间（含），格式同 since
+            entry_type: 只返回该类型的数据
+            limit: 最多返回条数，超过时保留最近的数据
+            include_spilled: 是否包含已写入磁盘的数据
+
+        Returns:
+            按接收时间正序的记录列表
+        """
+        since_ms = parse_epoch_ms(since) if since is not None else None
+        until_ms = parse_epoch_ms(until) if until is not None else None
+        if limit <= 0:
+            return []
+
+        def matches(received_ms: int, record_type: str) -> bool:
+            return ((since_ms is None or received_ms >= since_ms)
+                    and (until_ms is None or received_ms <= until_ms)
+                    and (entry_type is None or record_type == entry_type))
+
+        # 从最新的数据往前找，找满 limit 条即停止
+        results = []
+        for data_id in reversed(self._entries):
+            entry = self._entries[data_id]
+            if since_ms is not None and entry.received_ms < since_ms:
+                break
+            if matches(entry.received_ms, entry.entry_type):
+                results.append(serialization.loads(entry.line))
+                if len(results) >= limit:
+                    return results[::-1]
+
+        if include_spilled:
+            for seq in reversed(self._segments):
+                segment = self._segments[seq]
+                if not segment.records:
+                    continue
+                if since_ms is not None and segment.records[-1][0] < since_ms:
+                    break
+                if until_ms is not None and segment.records[0][0] > until_ms:
+                    continue
+                # 同一 data_id 只返回最后写入（或仍在内存中）的版本
+                offsets = [offset for received_ms, offset, data_id, record_type in reversed(segment.records)
+                           if matches(received_ms, record_type) and data_id not in self._entries
+                           and self._spilled.get(data_id) == (seq, offset)]
+                results.extend(self._read_records(seq, offsets[:limit - len(results)]))
+                if len(results) >= limit:
+                    break
+        return results[::-1]
+
+    def evict_expired(self) -> int:
+        """淘汰超过保留时间的数据，返回淘汰的条数"""
+        before = self.stats["evicted_ttl"]
+        self._evict(now_ms())
+        return self.stats["evicted_ttl"] - before
+
+    def _evict(self, now: int):
+        deadline = now - self.ttl_seconds * 1000 if self.ttl_seconds > 0 else None
+        evicted: List[Tuple[str, _Entry]] = []
+        while self._entries:
+            data_id, entry = next(iter(self._entries.items()))
+            if deadline is not None and entry.received_ms < deadline:
+                self.stats["evicted_ttl"] += 1
+            elif len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self.stats["evicted_size"] += 1
+            else:
+                break
+            self._entries.popitem(last=False)
+            self.bytes -= len(entry.line)
+            evicted.append((data_id, entry))
+        if evicted and self.spill_dir:
+            self._spill(evicted)
+
+    def _spill(self, evicted: List[Tuple[str, _Entry]]):
+        """把淘汰的数据追加写入当前分段"""
+        try:
+            for data_id, entry in evicted:
+                segment = self._current_segment()
+                offset = segment.bytes
+                self._writer.write(entry.line + b"\n")
+                segment.bytes += len(entry.line) + 1
+                segment.records.append((entry.received_ms, offset, data_id, entry.entry_type))
+                self._spilled[data_id] = (self._writer_seq, offset)
+                self.stats["spilled"] += 1
+            self._writer.flush()
+        except OSError as e:
+            self.stats["spill_errors"] += 1
+            self.logger.error(f"[数据存储] 写入磁盘分段失败: {e}")
+            self._close_writer()
+
+    def _current_segment(self) -> _Segment:
+        segment = self._segments.get(self._writer_seq) if self._writer is not None else None
+        if segment is not None and segment.bytes < self.segment_bytes:
+            return segment
+        self._close_writer()
+        seq = max(self._segments, default=0) + 1
+        segment = _Segment(os.path.join(self.spill_dir, f"data-{seq:06d}.jsonl"))
+        self._writer = open(segment.path, "ab")
+        self._writer_seq = seq
+        self._segments[seq] = segment
+        while len(self._segments) > self.max_segments:
+            self._drop_segment(next(iter(self._segments)))
+        return segment
+
+    def _drop_segment(self, seq: int):
+        segment = self._segments.pop(seq)
+        for _, offset, data_id, _ in segment.records:
+            if self._spilled.get(data_id) == (seq, offset):
+                del self._spilled[data_id]
+        try:
+            os.remove(segment.path)
+        except OSError as e:
+            self.logger.warning(f"[数据存储] 删除分段失败 {segment.path}: {e}")
+        self.stats["dropped_segments"] += 1
+
+    def _read_records(self, seq: int, offsets: List[int]) -> List[Dict[str, Any]]:
+        if not offsets:
+            return []
+        segment = self._segments[seq]
+        records = []
+        try:
+            with open(segment.path, "rb") as f:
+                for offset in offsets:
+                    f.seek(offset)
+                    records.append(serialization.loads(f.readline()))
+        except (OSError, serialization.JSONDecodeError) as e:
+            self.logger.error(f"[数据存储] 读取分段失败 {segment.path}: {e}")
+        return records
+
+    def _load_segments(self):
+        """启动时索引目录中已有的分段（末尾不完整的一行会被截掉）"""
+        os.makedirs(self.spill_dir, exist_ok=True)
+        found = sorted((int(match.group(1)), name) for name in os.listdir(self.spill_dir)
+                       if (match := SEGMENT_PATTERN.match(name)))
+        for seq, name in found:
+            segment = _Segment(os.path.join(self.spill_dir, name))
+            with open(segment.path, "rb+") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise serialization.JSONDecodeError("缺少换行", "", 0)
+                        record = serialization.loads(line)
+                    except serialization.JSONDecodeError:
+                        f.truncate(segment.bytes)
+                        self.logger.warning(f"[数据存储] 截掉分段末尾不完整的记录: {name}")
+                        break
+                    segment.records.append((int(record.get("received_ms") or 0), segment.bytes,
+                                            str(record.get("data_id")), str(record.get("type"))))
+                    self._spilled[str(record.get("data_id"))] = (seq, segment.bytes)
+                    segment.bytes += len(line)
+            self._segments[seq] = segment
+        while len(self._segments) > self.max_segments:
+            self._drop_segment(next(iter(self._segments)))
+        if found:
+            self.logger.info(f"[数据存储] 已索引 {len(self._segments)} 个磁盘分段，共 {len(self._spilled)} 条数据")
+
+    def _close_writer(self):
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except OSError:
+                pass
+        self._writer = None
+
+    def close(self):
+        """关闭当前分段文件（内存中的数据不写入磁盘）"""
+        self._close_writer()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息（bytes 为内存中数据的序列化总字节数）"""
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "spill_dir": self.spill_dir,
+            "spill_segments": len(self._segments),
+            "spill_entries": len(self._spilled),
+            "spill_bytes": sum(segment.bytes for segment in self._segments.values()),
+        }
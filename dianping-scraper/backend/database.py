@@ -1,33 +1,84 @@
 import sqlite3
 import hashlib
-import json
 import logging
 import threading
 import os
-from typing import Dict, Any, List, Optional
-from datetime import datetime, timedelta, timezone
+import queue
+import sys
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from aiclient import serialization
+from seen_filter import SeenIdFilter
+from storage_config import StorageConfig
+from timestamps import backfill_epochs, epoch_ms_to_iso, normalize_timestamp, now_ms
 
 logger = logging.getLogger(__name__)
 
+# 单条 IN 查询的最大参数个数（SQLite 旧版本默认上限为999）
+ID_QUERY_CHUNK = 500
+
+# 已处理消息ID过滤器配置
+SEEN_ID_LRU_SIZE = int(os.getenv("SEEN_ID_LRU_SIZE", 50000))
+SEEN_ID_BLOOM = os.getenv("SEEN_ID_BLOOM", "true").lower() == "true"
+SEEN_ID_BLOOM_ERROR_RATE = float(os.getenv("SEEN_ID_BLOOM_ERROR_RATE", 0.001))
+
+# 超过当前时间这么多的时间戳视为无效，不参与回复判断
+FUTURE_TOLERANCE_MS = 60 * 1000
+# 回填 ts_epoch 时每条 UPDATE 覆盖的 rowid 范围
+BACKFILL_CHUNK = 50000
+
+# 只读连接池大小（历史查询等读操作不占用写连接）
+READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", 4))
+
+# 历史分页游标：一条消息的 (ts_epoch, rowid)
+HistoryCursor = Tuple[int, int]
+
+
+class HistoryEntry(NamedTuple):
+    """一条历史消息"""
+    role: str
+    content: str
+    ts: int  # UTC毫秒
+
+
+@dataclass
+class HistoryPage:
+    """一页聊天历史（按时间正序）"""
+    entries: List[HistoryEntry]
+    before: Optional[HistoryCursor] = None  # 更早一页的游标，没有更早的消息时为 None
+    latest_id: Optional[str] = None  # 本页最新一条消息的ID，用作下次增量读取的 since_id
+    raw: Optional[List[Dict[str, Any]]] = None  # include_raw=True 时为与 entries 对应的原始消息
+
+    def as_messages(self) -> List[Dict[str, Any]]:
+        """转换为AI客户端使用的历史格式"""
+        return [{"role": e.role, "content": e.content, "timestamp": e.ts} for e in self.entries]
+
+
 class DatabaseManager:
     _instance = None
     _lock = threading.Lock()
 
-    def __new__(cls, db_path='dianping_history.db'):
+    def __new__(cls, db_path=None, storage: Optional[StorageConfig] = None):
         if cls._instance is None:
             with cls._lock:
                 if cls._instance is None:
                     cls._instance = super(DatabaseManager, cls).__new__(cls)
-                    cls._instance.db_path = db_path
+                    cls._instance.db_path = db_path or os.getenv("DIANPING_DB_PATH", "dianping_history.db")
+                    cls._instance.storage = storage or StorageConfig.from_env()
                     cls._instance.conn = None
+                    cls._instance._write_lock = threading.RLock()
+                    cls._instance._read_pool = None
                     cls._instance._init_db()
         return cls._instance
 
     def _init_db(self):
         """初始化数据库和表"""
         try:
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            self.conn.row_factory = sqlite3.Row
+            self.conn = self.storage.connect(self.db_path)
+            self.journal_mode = self.conn.execute("PRAGMA journal_mode").fetchone()[0]
             cursor = self.conn.cursor()
             
             # 原有消息表
@@ -44,14 +95,101 @@ class DatabaseManager:
             ''')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_id ON messages (chat_id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_timestamp ON messages (timestamp)')
-            
+
+            # 每个聊天最后一条有效消息，回复判断只需按主键读取一行
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS chat_state (
+                    chat_id TEXT PRIMARY KEY,
+                    last_role TEXT NOT NULL,
+                    last_ts_epoch INTEGER NOT NULL,
+                    last_customer_ts_epoch INTEGER
+                )
+            ''')
+            self._migrate_ts_epoch(cursor)
 
             self.conn.commit()
-            logger.info(f"[数据库] 数据库 '{self.db_path}' 初始化成功")
+            logger.info(f"[数据库] 数据库 '{self.db_path}' 初始化成功 (journal_mode={self.journal_mode})")
+
+            self.seen_filter = SeenIdFilter(
+                lru_size=SEEN_ID_LRU_SIZE,
+                use_bloom=SEEN_ID_BLOOM,
+                bloom_error_rate=SEEN_ID_BLOOM_ERROR_RATE
+            )
+            self._rebuild_seen_filter()
+            self._open_read_pool()
         except sqlite3.Error as e:
             logger.error(f"[数据库] 数据库初始化失败: {e}")
             raise
 
+    def _migrate_ts_epoch(self, cursor):
+        """
+        迁移：增加毫秒级UTC时间戳列 ts_epoch，回填已有消息，并由此重建 chat_state
+
+        ts_epoch 在写入时由 normalize_timestamp 计算，查询不再需要逐行解析时间字符串。
+        (chat_id, ts_epoch) 索引反向扫描即为 ts_epoch DESC, rowid DESC 的顺序，按时间倒序读取不需要额外排序；
+        早期版本建立的 DESC 索引无法按 rowid 倒序，迁移时替换。
+        """
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(messages)")}
+        if "ts_epoch" not in columns:
+            cursor.execute("ALTER TABLE messages ADD COLUMN ts_epoch INTEGER")
+        cursor.execute('DROP INDEX IF EXISTS idx_chat_ts_epoch')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_ts ON messages (chat_id, ts_epoch)')
+
+        backfilled = backfill_epochs(self.conn, chunk=BACKFILL_CHUNK)
+        self.backfill_stats = backfilled
+        updated = sum(backfilled.values())
+
+        state_rows = cursor.execute("SELECT COUNT(*) FROM chat_state").fetchone()[0]
+        if updated or (state_rows == 0 and cursor.execute("SELECT 1 FROM messages LIMIT 1").fetchone()):
+            self._rebuild_chat_state(cursor)
+        self.conn.commit()
+        if updated:
+            logger.info(f"[数据库] 已为 {updated} 条历史消息回填 ts_epoch {backfilled}")
+
+    def _rebuild_chat_state(self, cursor):
+        """由 messages 重建 chat_state（每个聊天取时间最新的有效消息，时间相同取后写入的）"""
+        limit = now_ms() + FUTURE_TOLERANCE_MS
+        cursor.execute("DELETE FROM chat_state")
+        cursor.execute('''
+            INSERT INTO chat_state (chat_id, last_role, last_ts_epoch, last_customer_ts_epoch)
+            SELECT chat_id, role, ts_epoch, customer_ts FROM (
+                SELECT chat_id, role, ts_epoch,
+                       MAX(CASE WHEN role = 'user' THEN ts_epoch END) OVER (PARTITION BY chat_id) AS customer_ts,
+                       ROW_NUMBER() OVER (PARTITION BY chat_id ORDER BY ts_epoch DESC, rowid DESC) AS position
+                FROM messages
+                WHERE ts_epoch IS NOT NULL AND ts_epoch <= ?
+            ) WHERE position = 1
+        ''', (limit,))
+
+    def _open_read_pool(self):
+        """创建只读连接池（内存数据库无法共享，读操作使用写连接）"""
+        if self.db_path == ":memory:" or self.db_path.startswith("file::memory:") or READ_POOL_SIZE <= 0:
+            return
+        self._read_pool = queue.Queue()
+        for _ in range(READ_POOL_SIZE):
+            self._read_pool.put(self.storage.connect(self.db_path))
+
+    @contextmanager
+    def _read_connection(self):
+        """借用一个只读连接，没有连接池时在写锁内使用写连接"""
+        if self._read_pool is None:
+            with self._write_lock:
+                yield self.conn
+            return
+        conn = self._read_pool.get()
+        try:
+            yield conn
+        finally:
+            self._read_pool.put(conn)
+
+    def _rebuild_seen_filter(self):
+        """由 messages.id 重建布隆过滤器（启动时以及过滤器超出容量时）"""
+        if not self.seen_filter.use_bloom:
+            return
+        count = self.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        self.seen_filter.rebuild((row[0] for row in self.conn.execute("SELECT id FROM messages")), count)
+        logger.info(f"[数据库] 已处理消息过滤器已重建: {count} 条消息ID")
+
     def _generate_message_id(self, message: Dict[str, Any]) -> str:
         """
         为消息生成一个确定性的唯一ID。
@@ -68,59 +206,159 @@ class DatabaseManager:
         return hashlib.md5(message_string.encode('utf-8')).hexdigest()
 
     def is_message_processed(self, message_id: str) -> bool:
-        """检查消息ID是否已在数据库中"""
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT 1 FROM messages WHERE id = ?", (message_id,))
-            return cursor.fetchone() is not None
-        except sqlite3.Error as e:
-            logger.error(f"[数据库] 查询消息失败 (ID: {message_id}): {e}")
-            return False # 出错时保守地认为未处理
-
-    def add_message(self, message: Dict[str, Any]):
-        """将一条消息添加到数据库"""
-        message_id = self._generate_message_id(message)
-        
-        # 添加调试日志
-        logger.debug(f"[数据库调试] 准备添加消息，ID: {message_id}")
-        
-        if self.is_message_processed(message_id):
-            logger.debug(f"[数据库调试] 消息已存在，跳过: {message_id}")
-            return
+        """检查消息ID是否已在数据库中（过滤器能确定时不查询数据库）"""
+        with self._write_lock:
+            known = self.seen_filter.check(message_id)
+            if known is not None:
+                return known
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute("SELECT 1 FROM messages WHERE id = ?", (message_id,))
+                found = cursor.fetchone() is not None
+            except sqlite3.Error as e:
+                logger.error(f"[数据库] 查询消息失败 (ID: {message_id}): {e}")
+                return False # 出错时保守地认为未处理
+            self.seen_filter.record_fallback(found)
+            if found:
+                self.seen_filter.add(message_id)
+            return found
 
+    def _prepare_row(self, message: Dict[str, Any], message_id: str) -> tuple:
+        """把消息转换为 messages 表的一行 (id, chat_id, role, content, timestamp, raw_data, ts_epoch)"""
         chat_id = message.get('chatId', 'unknown_chat')
         role = message.get('role', 'unknown')
         content = message.get('content', '')
         
-        # 统一时间戳格式
-        timestamp = message.get('timestamp')
-        if isinstance(timestamp, (int, float)):
-            # 如果是时间戳数字，转换为ISO格式
-            timestamp = datetime.fromtimestamp(timestamp / 1000 if timestamp > 1e10 else timestamp).isoformat()
-        elif timestamp is None:
-            timestamp = datetime.now().isoformat()
-        
-        logger.debug(f"[数据库调试] 添加消息: Role={role}, ChatID={chat_id}, Timestamp={timestamp}")
-        
-        raw_data = json.dumps({
+        # 时间戳统一为UTC毫秒（ts_epoch），timestamp 列和 raw_data 保留原始字符串
+        normalized = normalize_timestamp(message.get('timestamp'))
+        if normalized.fallback:
+            logger.debug(f"[数据库调试] 时间戳缺失或无法解析，使用接收时间: {normalized.original!r}")
+        timestamp = normalized.text
+
+        raw_data = serialization.dumps({
             **message,
-            'timestamp': timestamp  # 确保raw_data中也是标准格式
-        }, ensure_ascii=False)
+            'timestamp': timestamp
+        })
+        return (message_id, chat_id, role, content, timestamp, raw_data, normalized.epoch_ms)
+
+    def _existing_ids(self, message_ids: List[str]) -> set:
+        """一次查询返回已在数据库中的消息ID（按SQLite参数上限分块）"""
+        existing = set()
+        cursor = self.conn.cursor()
+        for start in range(0, len(message_ids), ID_QUERY_CHUNK):
+            chunk = message_ids[start:start + ID_QUERY_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(f"SELECT id FROM messages WHERE id IN ({placeholders})", chunk)
+            existing.update(row[0] for row in cursor.fetchall())
+        return existing
+
+    def add_messages_bulk(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        批量添加消息：每条消息只计算一次ID，一次查询过滤已存在的消息，在同一个事务中插入
+
+        扩展每次都会重发完整的会话记忆，绝大多数消息已经入库，这里只返回真正新增的消息。
+        同一批中ID相同的消息只保留第一条。
+
+        Args:
+            messages: 消息列表
+
+        Returns:
+            新增的消息（保持原顺序）
+        """
+        with self._write_lock:
+            try:
+                new_messages = self._stage_messages(messages)
+                self.conn.commit()
+                return new_messages
+            except Exception as e:
+                # 不只是 sqlite3.Error：无法绑定的参数（如超大整数）或无法序列化的字段也不能留下未提交的事务
+                self._rollback()
+                logger.error(f"[数据库] 批量添加消息失败 ({len(messages)} 条): {e}")
+                return []
+
+    def _stage_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        在当前事务中写入新消息但不提交（调用方持有写锁并负责提交，供成组提交使用）
+
+        Raises:
+            sqlite3.Error: 写入失败
+        """
+        candidates: Dict[str, Dict[str, Any]] = {}
+        for message in messages:
+            candidates.setdefault(self._generate_message_id(message), message)
+        if not candidates:
+            return []
+
+        # 过滤器能确定的ID不再查询数据库，只回查无法确定的部分
+        unknown = []
+        existing = set()
+        for message_id in candidates:
+            known = self.seen_filter.check(message_id)
+            if known is None:
+                unknown.append(message_id)
+            elif known:
+                existing.add(message_id)
+        if unknown:
+            found = self._existing_ids(unknown)
+            for message_id in unknown:
+                self.seen_filter.record_fallback(message_id in found)
+            for message_id in found:
+                self.seen_filter.add(message_id)
+            existing |= found
 
+        new_items = [(message_id, message) for message_id, message in candidates.items()
+                     if message_id not in existing]
+        if not new_items:
+            return []
+
+        rows = [self._prepare_row(message, message_id) for message_id, message in new_items]
+        # 并发情况下可能已被插入，OR IGNORE 可以安全忽略
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO messages (id, chat_id, role, content, timestamp, raw_data, ts_epoch) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        self._update_chat_state(rows)
+        for message_id, _ in new_items:
+            self.seen_filter.add(message_id, inserted=True)
+        if self.seen_filter.needs_rebuild:
+            self._rebuild_seen_filter()
+        logger.debug(f"[数据库调试] 写入 {len(rows)} 条新消息（共 {len(messages)} 条）")
+        return [message for _, message in new_items]
+
+    def _update_chat_state(self, rows: List[tuple]):
+        """按新写入的行更新 chat_state（行按写入顺序，时间相同时后写入的为最后一条）"""
+        limit = now_ms() + FUTURE_TOLERANCE_MS
+        states = [(chat_id, role, ts_epoch, ts_epoch if role == 'user' else None)
+                  for _, chat_id, role, _, _, _, ts_epoch in rows
+                  if ts_epoch is not None and ts_epoch <= limit]
+        if not states:
+            return
+        self.conn.executemany('''
+            INSERT INTO chat_state (chat_id, last_role, last_ts_epoch, last_customer_ts_epoch)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(chat_id) DO UPDATE SET
+                last_role = CASE WHEN excluded.last_ts_epoch >= chat_state.last_ts_epoch
+                                 THEN excluded.last_role ELSE chat_state.last_role END,
+                last_ts_epoch = MAX(excluded.last_ts_epoch, chat_state.last_ts_epoch),
+                last_customer_ts_epoch = CASE
+                    WHEN excluded.last_customer_ts_epoch IS NULL THEN chat_state.last_customer_ts_epoch
+                    WHEN chat_state.last_customer_ts_epoch IS NULL THEN excluded.last_customer_ts_epoch
+                    ELSE MAX(excluded.last_customer_ts_epoch, chat_state.last_customer_ts_epoch) END
+        ''', states)
+
+    def _rollback(self):
+        """回滚未提交的写入，并重建可能已记录了未提交ID的过滤器"""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(
-                "INSERT INTO messages (id, chat_id, role, content, timestamp, raw_data) VALUES (?, ?, ?, ?, ?, ?)",
-                (message_id, chat_id, role, content, timestamp, raw_data)
-            )
-            self.conn.commit()
-            logger.debug(f"[数据库调试] 消息添加成功: {message_id}")
-        except sqlite3.IntegrityError:
-             # 并发情况下可能重复插入，可以安全忽略
-            logger.debug(f"[数据库调试] 消息重复，忽略: {message_id}")
-            pass
+            self.conn.rollback()
         except sqlite3.Error as e:
-            logger.error(f"[数据库] 添加消息失败 (ID: {message_id}): {e}")
+            logger.error(f"[数据库] 回滚失败: {e}")
+        self.seen_filter.clear()
+        self._rebuild_seen_filter()
+
+    def add_message(self, message: Dict[str, Any]) -> bool:
+        """将一条消息添加到数据库，返回是否为新消息"""
+        return bool(self.add_messages_bulk([message]))
 
     def should_reply_to_chat(self, chat_id: str, contact_name: str = None) -> bool:
         """
@@ -131,129 +369,134 @@ class DatabaseManager:
         3. 如果距离最后一条客户消息时间 <= 5分钟且最后一条是客户消息，回复
         """
         try:
-            cursor = self.conn.cursor()
-            
-            # 修复时间戳混乱问题：只考虑有效的时间戳（不能是未来时间）
-            current_time = datetime.now()
-            future_threshold = current_time + timedelta(minutes=1)  # 允许1分钟的时间偏差
-            
-            cursor.execute("""
-                SELECT role, timestamp, content FROM messages 
-                WHERE chat_id = ? 
-                AND (
-                    -- 过滤掉未来时间戳，只取有效的时间戳
-                    (timestamp LIKE '%Z' AND datetime(substr(timestamp, 1, 19)) <= datetime('now', '+1 minutes')) OR
-                    (timestamp NOT LIKE '%Z' AND datetime(substr(timestamp, 1, 19)) <= datetime('now', '+1 minutes'))
-                )
-                ORDER BY 
-                    CASE 
-                        WHEN timestamp LIKE '%Z' THEN 
-                            datetime(substr(timestamp, 1, 19))  -- UTC时间
-                        ELSE 
-                            datetime(substr(timestamp, 1, 19))  -- 本地时间  
-                    END DESC,
-                    rowid DESC  -- 使用rowid作为额外排序条件
-                LIMIT 1
-            """, (chat_id,))
-            
-            last_message = cursor.fetchone()
-            
-            if not last_message:
-                logger.debug(f"[回复控制调试] {contact_name}: 没有找到有效的消息历史")
-                return False
-            
-            role, timestamp, content = last_message
-            logger.debug(f"[回复控制调试] {contact_name}: 最后一条有效消息 Role={role}, Time={timestamp}, Content={content[:50]}...")
-            
-            # 如果最后一条是商家发送的消息，不回复
-            if role == 'assistant':
-                logger.info(f"[回复控制] {contact_name}: 最后一条消息是商家发送，不回复")
-                return False
-            
-            # 检查最后一条客户消息的时间
-            # 转换时间戳为datetime对象 - 修复时区处理
-            try:
-                current_time = datetime.now()
-                
-                if timestamp.endswith('Z'):
-                    # UTC时间戳，需要转换为本地时间
-                    msg_time_utc = datetime.fromisoformat(timestamp[:-1]).replace(tzinfo=timezone.utc)
-                    # 转换为北京时间（UTC+8）
-                    beijing_tz = timezone(timedelta(hours=8))
-                    msg_time = msg_time_utc.astimezone(beijing_tz)
-                    
-                    # 为了计算时间差，将当前时间也转换为北京时间
-                    current_time_beijing = current_time.replace(tzinfo=beijing_tz)
-                    time_diff = current_time_beijing - msg_time
-                    
-                    logger.debug(f"[时区调试] {contact_name}: UTC时间 {timestamp} -> 北京时间 {msg_time.isoformat()}")
-                else:
-                    # 本地时间戳，直接使用
-                    msg_time = datetime.fromisoformat(timestamp[:19])
-                    time_diff = current_time - msg_time
-                    
-                    logger.debug(f"[时区调试] {contact_name}: 本地时间 {timestamp}")
-                
-                minutes_passed = time_diff.total_seconds() / 60
-                
-                logger.debug(f"[回复控制调试] {contact_name}: 消息时间 {msg_time.strftime('%H:%M:%S')}, 当前时间 {current_time.strftime('%H:%M:%S')}, 距离最后消息 {minutes_passed:.1f} 分钟")
-                
-                if minutes_passed > 5:
-                    logger.info(f"[回复控制] {contact_name}: 距离最后消息超过5分钟({minutes_passed:.1f}分钟)，不回复")
-                    return False
-                else:
-                    logger.info(f"[回复控制] {contact_name}: 最后消息是客户发送且在5分钟内({minutes_passed:.1f}分钟)，需要回复")
-                    return True
-                
-            except Exception as e:
-                logger.error(f"[回复控制] {contact_name}: 时间戳解析错误: {e}, timestamp: {timestamp}")
-                return False
-            
+            with self._read_connection() as conn:
+                return self._should_reply(conn.cursor(), chat_id, contact_name)
         except Exception as e:
             logger.error(f"[回复控制] {contact_name}: 检查回复条件时出错: {e}")
             return False
 
+    def _should_reply(self, cursor, chat_id: str, contact_name: str = None) -> bool:
+        """should_reply_to_chat 的实现：按主键读取 chat_state 中该聊天最后一条有效消息"""
+        state = cursor.execute(
+            "SELECT last_role, last_ts_epoch FROM chat_state WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+
+        if not state:
+            logger.debug(f"[回复控制调试] {contact_name}: 没有找到有效的消息历史")
+            return False
+
+        role, last_ts_epoch = state
+        # 如果最后一条是商家发送的消息，不回复
+        if role == 'assistant':
+            logger.info(f"[回复控制] {contact_name}: 最后一条消息是商家发送，不回复")
+            return False
+
+        # 检查最后一条客户消息的时间（均为UTC毫秒，与服务器所在时区无关）
+        minutes_passed = (now_ms() - last_ts_epoch) / 60000
+        logger.debug(f"[回复控制调试] {contact_name}: 距离最后消息 {minutes_passed:.1f} 分钟")
+
+        if minutes_passed > 5:
+            logger.info(f"[回复控制] {contact_name}: 距离最后消息超过5分钟({minutes_passed:.1f}分钟)，不回复")
+            return False
+        logger.info(f"[回复控制] {contact_name}: 最后消息是客户发送且在5分钟内({minutes_passed:.1f}分钟)，需要回复")
+        return True
+
     def get_chat_history(self, chat_id: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """获取指定聊天的历史记录"""
-        history = []
+        """获取指定聊天最近 limit 条历史记录（解码后的原始消息，按时间正序）"""
+        return self.get_history_page(chat_id, limit=limit, include_raw=True).raw or []
+
+    def get_history_page(self, chat_id: str, limit: int = 50, before: Optional[HistoryCursor] = None,
+                         since_id: Optional[str] = None, include_raw: bool = False) -> HistoryPage:
+        """
+        按时间倒序分页读取聊天历史（最新的消息优先）
+
+        沿 (chat_id, ts_epoch) 索引反向扫描，只读取需要的行，默认不解码 raw_data。
+
+        Args:
+            chat_id: 聊天ID
+            limit: 最多返回的消息条数
+            before: 只返回该游标之前的消息（上一页的 HistoryPage.before）
+            since_id: 只返回该消息之后的消息（增量读取）；消息不存在时返回最新的一页
+            include_raw: 是否同时返回解码后的原始消息
+
+        Returns:
+            HistoryPage，entries 按时间正序
+        """
+        conditions = ["chat_id = ?"]
+        params: List[Any] = [chat_id]
+        if before is not None:
+            conditions.append("(ts_epoch, rowid) < (?, ?)")
+            params.extend(before)
+        columns = "rowid, id, role, content, ts_epoch" + (", raw_data" if include_raw else "")
         try:
-            cursor = self.conn.cursor()
-            # 按时间戳排序，确保顺序
-            cursor.execute(
-                "SELECT raw_data FROM messages WHERE chat_id = ? ORDER BY timestamp ASC LIMIT ?",
-                (chat_id, limit)
-            )
-            rows = cursor.fetchall()
-            for row in rows:
-                history.append(json.loads(row['raw_data']))
+            with self._read_connection() as conn:
+                if since_id is not None:
+                    anchor = conn.execute(
+                        "SELECT ts_epoch, rowid FROM messages WHERE id = ? AND chat_id = ?", (since_id, chat_id)
+                    ).fetchone()
+                    if anchor is not None:
+                        conditions.append("(ts_epoch, rowid) > (?, ?)")
+                        params.extend(anchor)
+                # 多取一条判断是否还有更早的消息
+                rows = conn.execute(
+                    f"SELECT {columns} FROM messages WHERE {' AND '.join(conditions)} "
+                    f"ORDER BY ts_epoch DESC, rowid DESC LIMIT ?",
+                    (*params, limit + 1)
+                ).fetchall()
         except sqlite3.Error as e:
             logger.error(f"[数据库] 获取聊天历史失败 (ChatID: {chat_id}): {e}")
-        return history
-    
+            return HistoryPage(entries=[])
+
+        has_more = len(rows) > limit
+        rows = rows[:limit][::-1]
+        page = HistoryPage(
+            entries=[HistoryEntry(row["role"], row["content"], row["ts_epoch"]) for row in rows],
+            before=(rows[0]["ts_epoch"], rows[0]["rowid"]) if has_more else None,
+            latest_id=rows[-1]["id"] if rows else since_id,
+        )
+        if include_raw:
+            page.raw = [serialization.loads(row["raw_data"]) for row in rows]
+        return page
+
     def get_active_chats(self, hours: int = 24) -> List[Dict[str, Any]]:
         """获取指定小时内的活跃聊天"""
         try:
-            cursor = self.conn.cursor()
-            since_time = (datetime.now() - timedelta(hours=hours)).isoformat()
-            
-            cursor.execute("""
-                SELECT DISTINCT chat_id, 
-                       MAX(timestamp) as last_activity,
-                       COUNT(*) as message_count
-                FROM messages 
-                WHERE timestamp > ?
-                GROUP BY chat_id
-                ORDER BY last_activity DESC
-            """, (since_time,))
-            
-            return [dict(row) for row in cursor.fetchall()]
-            
+            since_ms = now_ms() - hours * 3600 * 1000
+            with self._read_connection() as conn:
+                cursor = conn.execute("""
+                    SELECT chat_id, 
+                           MAX(ts_epoch) as last_activity_ms,
+                           COUNT(*) as message_count
+                    FROM messages 
+                    WHERE ts_epoch > ?
+                    GROUP BY chat_id
+                    ORDER BY last_activity_ms DESC
+                """, (since_ms,))
+                rows = cursor.fetchall()
+            return [{
+                "chat_id": row["chat_id"],
+                "last_activity": epoch_ms_to_iso(row["last_activity_ms"]),
+                "message_count": row["message_count"],
+            } for row in rows]
+
         except sqlite3.Error as e:
             logger.error(f"[数据库] 获取活跃聊天失败: {e}")
             return []
 
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            "journal_mode": self.journal_mode,
+            "storage": self.storage.to_dict(),
+            "seen_filter": self.seen_filter.get_stats(),
+        }
+
     def close(self):
         """关闭数据库连接"""
+        if self._read_pool is not None:
+            while not self._read_pool.empty():
+                self._read_pool.get_nowait().close()
+            self._read_pool = None
         if self.conn:
             self.conn.close()
             self.conn = None
@@ -0,0 +1,142 @@
+"""
+AI回复防抖
+客户经常连续发送多条短消息。每条新消息只重置该聊天的等待窗口，窗口内没有新消息时才调用一次AI，
+回复基于调用时数据库中的完整历史，因此一次调用覆盖窗口内的全部消息；
+正在生成的回复在新消息到达时被取消，由新的调用取代。
+已开始执行有副作用工具（预约、邮件）或开始发送的回复不再取消：新的调用等它完成后再读取历史生成回复，
+避免新回复不知道已经预约过而重复预约，或读不到刚发送的回复而重复、矛盾。
+"""
+
+import asyncio
+import contextvars
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class _PendingReply:
+    """一个聊天待执行或执行中的回复"""
+
+    def __init__(self, first_trigger_at: float, blocker: Optional[asyncio.Task] = None):
+        self.first_trigger_at = first_trigger_at
+        self.task: Optional[asyncio.Task] = None
+        self.running = False  # 已开始调用AI
+        self.protected = False  # 已开始执行有副作用的工具或开始发送，不能再取消
+        self.blocker = blocker  # 需要等待完成的、受保护的上一次回复
+
+
+_CURRENT: "contextvars.ContextVar[Optional[_PendingReply]]" = contextvars.ContextVar("reply_debouncer_current",
+                                                                                     default=None)
+
+
+class ReplyDebouncer:
+    """按聊天合并AI回复触发"""
+
+    def __init__(self, window: float = 1.5, max_wait: float = 6.0):
+        """
+        Args:
+            window: 最后一条消息之后的等待时间（秒），0表示不等待
+            max_wait: 从第一次触发起最长等待时间（秒），避免持续来消息时一直不回复
+        """
+        self.window = window
+        self.max_wait = max_wait
+        self._pending: Dict[str, _PendingReply] = {}
+        self.logger = logger.getChild(self.__class__.__name__)
+        self.stats = {"triggers": 0, "invocations": 0, "coalesced": 0, "superseded": 0, "deferred": 0,
+                      "completed": 0, "failed": 0}
+
+    def schedule(self, chat_id: str, job: Job) -> asyncio.Task:
+        """
+        触发一次回复：取消该聊天尚未开始或正在进行的回复（已执行有副作用工具的除外），重新开始等待窗口
+
+        Args:
+            chat_id: 聊天ID
+            job: 生成并发送回复的协程函数，执行时应读取最新的聊天历史
+
+        Returns:
+            新的回复任务
+        """
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        self.stats["triggers"] += 1
+
+        previous = self._pending.get(chat_id)
+        first_trigger_at = now
+        blocker = None
+        if previous is not None and previous.task is not None and not previous.task.done():
+            if previous.protected:
+                # 正在执行预约等有副作用的工具或正在发送：不取消，新回复等它完成后再生成
+                blocker = previous.task
+                self.stats["deferred"] += 1
+                self.logger.info(f"[回复防抖] {chat_id}: 正在进行的回复已不可取消（副作用工具或发送中），新回复等待其完成")
+            else:
+                previous.task.cancel()
+                blocker = previous.blocker
+                if previous.running:
+                    self.stats["superseded"] += 1
+                    self.logger.info(f"[回复防抖] {chat_id}: 新消息到达，取消正在生成的回复")
+                else:
+                    self.stats["coalesced"] += 1
+                    first_trigger_at = previous.first_trigger_at
+                    self.logger.info(f"[回复防抖] {chat_id}: 合并连续消息，重新等待")
+
+        delay = max(0.0, min(self.window, first_trigger_at + self.max_wait - now))
+        pending = _PendingReply(first_trigger_at, blocker)
+        pending.task = asyncio.create_task(self._run(chat_id, pending, job, delay), name=f"reply-{chat_id}")
+        self._pending[chat_id] = pending
+        return pending.task
+
+    def protect_current(self, reason: str = ""):
+        """
+        当前回复即将执行有副作用的工具或开始发送，此后新消息不再取消它（在回复任务内调用，其他地方调用无效）
+
+        Args:
+            reason: 日志中说明的原因（如工具名）
+        """
+        pending = _CURRENT.get()
+        if pending is None or pending.protected:
+            return
+        pending.protected = True
+        self.logger.info(f"[回复防抖] 回复进入不可取消阶段: {reason}")
+
+    async def _run(self, chat_id: str, pending: _PendingReply, job: Job, delay: float):
+        _CURRENT.set(pending)
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+            if pending.blocker is not None:
+                # asyncio.wait 不会因上一次回复失败而抛出，本任务被取消时也不会取消上一次回复
+                await asyncio.wait({pending.blocker})
+            pending.running = True
+            self.stats["invocations"] += 1
+            result = await job()
+            self.stats["completed"] += 1
+            return result
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats["failed"] += 1
+            self.logger.error(f"[回复防抖] {chat_id}: 生成回复失败: {e}", exc_info=True)
+        finally:
+            if self._pending.get(chat_id) is pending:
+                del self._pending[chat_id]
+
+    async def close(self):
+        """取消所有待执行和执行中的回复"""
+        tasks = [p.task for p in self._pending.values() if p.task and not p.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._pending.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息（saved_calls 为相比每次触发都调用AI节省的调用次数）"""
+        return {
+            **self.stats,
+            "pending": len(self._pending),
+            "saved_calls": self.stats["triggers"] - self.stats["invocations"]
+                           - sum(1 for p in self._pending.values() if not p.running),
+        }
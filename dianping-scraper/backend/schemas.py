@@ -0,0 +1,22 @@
+"""
+WebSocket消息结构
+对扩展发送的记忆消息做类型化解码：由 aiclient.serialization.convert 校验字段类型，
+处理函数直接使用属性访问，不再到处 payload.get(...)。
+会话记忆中的每条消息仍保留为字典，原样写入数据库的 raw_data。
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Union
+
+
+@dataclass
+class MemoryPayload:
+    """memory_update / memory_save 消息的 payload"""
+    chatId: Optional[str] = None
+    contactName: Optional[str] = None
+    conversationMemory: List[Dict[str, Any]] = field(default_factory=list)
+    contextInfo: Optional[Dict[str, Any]] = None
+    action: Optional[str] = None
+    # memory_save 发送 Date.now()（毫秒数字），memory_update 发送 toISOString()
+    timestamp: Optional[Union[int, float, str]] = None
+
@@ -0,0 +1,136 @@
+"""
+已处理消息ID过滤器
+扩展会不断重发完整的会话记忆，绝大多数消息ID都已经入库。过滤器放在SQLite前面：
+- LRU集合：最近见过的ID，命中即可确定已入库
+- 布隆过滤器（可选，启动时由 messages.id 重建）：判定不存在即可确定是新消息
+两者都无法确定时（布隆过滤器可能误判为存在）才查询数据库。
+"""
+
+import hashlib
+import math
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+
+class BloomFilter:
+    """定长布隆过滤器"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        """
+        Args:
+            capacity: 预计元素个数
+            error_rate: 元素个数达到 capacity 时的误判率
+        """
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        # 双重哈希：由一个128位摘要派生 num_hashes 个位置
+        digest = hashlib.md5(key.encode("utf-8")).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    @property
+    def is_full(self) -> bool:
+        """元素个数超过设计容量，误判率开始升高"""
+        return self.count > self.capacity
+
+
+class SeenIdFilter:
+    """LRU + 布隆过滤器组成的已处理ID过滤器"""
+
+    def __init__(self, lru_size: int = 50000, use_bloom: bool = True, bloom_error_rate: float = 0.001):
+        self.lru_size = lru_size
+        self.use_bloom = use_bloom
+        self.bloom_error_rate = bloom_error_rate
+        self.bloom: Optional[BloomFilter] = None
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        self.stats = {"lookups": 0, "lru_hits": 0, "bloom_negatives": 0,
+                      "db_fallbacks": 0, "bloom_false_positives": 0, "bloom_rebuilds": 0}
+
+    def rebuild(self, ids: Iterable[str], count: int):
+        """
+        用数据库中全部已有ID重建布隆过滤器
+
+        Args:
+            ids: 已入库的消息ID
+            count: ID总数，用于确定过滤器容量（预留一倍增长空间）
+        """
+        if not self.use_bloom:
+            return
+        bloom = BloomFilter(max(10000, count * 2), self.bloom_error_rate)
+        for message_id in ids:
+            bloom.add(message_id)
+        self.bloom = bloom
+        self.stats["bloom_rebuilds"] += 1
+
+    @property
+    def needs_rebuild(self) -> bool:
+        return self.bloom is not None and self.bloom.is_full
+
+    def check(self, message_id: str) -> Optional[bool]:
+        """
+        判断ID是否已入库
+
+        Returns:
+            True 确定已入库；False 确定未入库；None 无法确定，需要查询数据库
+        """
+        self.stats["lookups"] += 1
+        if message_id in self._recent:
+            self._recent.move_to_end(message_id)
+            self.stats["lru_hits"] += 1
+            return True
+        if self.bloom is not None and message_id not in self.bloom:
+            self.stats["bloom_negatives"] += 1
+            return False
+        self.stats["db_fallbacks"] += 1
+        return None
+
+    def record_fallback(self, found: bool):
+        """记录一次数据库回查的结果（布隆过滤器判定存在但实际不存在即为误判）"""
+        if not found and self.bloom is not None:
+            self.stats["bloom_false_positives"] += 1
+
+    def add(self, message_id: str, inserted: bool = False):
+        """
+        记录已入库的ID
+
+        Args:
+            message_id: 消息ID
+            inserted: 是否为本进程新插入（需要同时加入布隆过滤器）
+        """
+        self._recent[message_id] = None
+        self._recent.move_to_end(message_id)
+        while len(self._recent) > self.lru_size:
+            self._recent.popitem(last=False)
+        if inserted and self.bloom is not None:
+            self.bloom.add(message_id)
+
+    def clear(self):
+        self._recent.clear()
+        self.bloom = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息（hit_rate 为不需要查询数据库的比例）"""
+        lookups = self.stats["lookups"]
+        resolved = self.stats["lru_hits"] + self.stats["bloom_negatives"]
+        return {
+            **self.stats,
+            "hit_rate": round(resolved / lookups, 3) if lookups else None,
+            "lru_entries": len(self._recent),
+            "bloom_entries": self.bloom.count if self.bloom is not None else None,
+            "bloom_bytes": len(self.bloom.bits) if self.bloom is not None else 0,
+        }
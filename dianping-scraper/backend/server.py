@@ -7,10 +7,9 @@
 
 import asyncio
 import websockets
-import json
 import logging
 from datetime import datetime
-from typing import Set, Dict, Any, List
+from typing import Set, Dict, Any, List, Optional
 import signal
 import sys
 import os
@@ -18,10 +17,18 @@ import traceback
 
 # 导入新的数据库管理器
 from database import db_manager
+from async_database import AsyncDatabase
+from config import Config
 
 # 添加AI客户端路径
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 from aiclient import AIClient
+from aiclient import serialization
+from schemas import MemoryPayload
+from chat_actors import ChatActorPool
+from reply_debouncer import ReplyDebouncer
+from conversation_cache import ConversationCache
+from data_store import DataStore
 
 # 配置详细日志
 logging.basicConfig(
@@ -41,6 +48,9 @@ if sys.platform.startswith('win'):
         pass
 logger = logging.getLogger(__name__)
 
+# 按聊天排队处理的消息类型（可能触发AI调用）
+CHAT_QUEUED_TYPES = {"memory_update", "memory_save"}
+
 class DianpingWebSocketServer:
     """大众点评WebSocket服务器 - 精简版"""
     
@@ -48,11 +58,36 @@ class DianpingWebSocketServer:
         self.host = host
         self.port = port
         self.clients: Set[websockets.WebSocketServerProtocol] = set()
-        self.data_store: Dict[str, Any] = {}
+        # 扩展上报的数据对象和数据列表：按条数、字节数和保留时间淘汰，可选写入磁盘分段
+        self.data_store = DataStore(
+            max_entries=Config.MAX_DATA_ENTRIES,
+            max_bytes=Config.DATA_STORE_MAX_BYTES,
+            ttl_seconds=Config.DATA_STORE_TTL_SECONDS,
+            spill_dir=Config.DATA_STORE_PATH if Config.DATA_STORE_SPILL else None,
+            segment_bytes=Config.DATA_STORE_SEGMENT_BYTES,
+            max_segments=Config.DATA_STORE_MAX_SEGMENTS
+        )
         self.ai_client = AIClient()
         self.server = None
         self.is_stopping = False
         self.polling_task = None
+        # 记忆消息按聊天排队处理：同一聊天保持顺序，不同聊天并行，AI调用全局限流
+        self.chat_actors = ChatActorPool(
+            max_concurrent_ai=Config.MAX_CONCURRENT_AI_CALLS,
+            idle_timeout=Config.CHAT_QUEUE_IDLE_SECONDS
+        )
+        # 数据库读写移出事件循环：写入由写线程成组提交，读取走只读连接池
+        self.db = AsyncDatabase(db_manager, read_pool_size=Config.DB_READ_THREADS)
+        # 每个聊天最近的对话，写入数据库后同步追加，生成回复时优先读取
+        self.conversation_cache = ConversationCache(
+            max_bytes=Config.CONVERSATION_CACHE_MAX_BYTES,
+            max_messages=Config.AI_HISTORY_LIMIT,
+            idle_seconds=Config.CONVERSATION_CACHE_IDLE_SECONDS
+        )
+        self.reply_debouncer = ReplyDebouncer(
+            window=Config.AI_REPLY_DEBOUNCE_SECONDS,
+            max_wait=Config.AI_REPLY_DEBOUNCE_MAX_WAIT
+        )
         
         logger.info(f"[AI] AI客户端初始化成功，可用提供商: {len(self.ai_client.adapters)}")
         logger.info(f"[数据库] 数据库管理器已初始化")
@@ -73,7 +108,7 @@ class DianpingWebSocketServer:
             "message": "连接成功! 大众点评数据提取服务已就绪",
             "timestamp": datetime.now().isoformat()
         }
-        await websocket.send(json.dumps(welcome_msg, ensure_ascii=False))
+        await websocket.send(serialization.dumps(welcome_msg))
 
     async def unregister_client(self, websocket):
         """注销客户端连接"""
@@ -85,7 +120,7 @@ class DianpingWebSocketServer:
     async def handle_message(self, websocket, message: str):
         """处理来自客户端的消息"""
         try:
-            data = json.loads(message)
+            data = serialization.loads(message)
             timestamp = datetime.now().isoformat()
             
             response = None
@@ -95,21 +130,43 @@ class DianpingWebSocketServer:
             elif isinstance(data, dict):
                 msg_type = data.get("type", "unknown")
                 logger.info(f"[消息] 类型: {msg_type}")
+                if msg_type in CHAT_QUEUED_TYPES:
+                    # 投递到该聊天的队列后立即返回，接收循环不等待AI回复
+                    chat_id = str(self._safe_get_value((data.get("payload") or {}).get("chatId"), "default_chat"))
+                    self.chat_actors.submit(chat_id, lambda: self._process_queued_message(websocket, data, timestamp))
+                    return
                 response = await self.process_message_by_type(data, timestamp)
             else:
                 logger.warning(f"⚠️ 未知数据类型: {type(data)}")
                 response = {"type": "error", "message": "不支持的数据类型"}
             
             if response:
-                response["timestamp"] = datetime.now().isoformat()
-                await websocket.send(json.dumps(response, ensure_ascii=False))
+                await self._send_response(websocket, response)
                 
-        except json.JSONDecodeError as e:
+        except serialization.JSONDecodeError as e:
             logger.error(f"[错误] JSON解析错误: {e}")
-            await websocket.send(json.dumps({"type": "error", "message": "JSON格式错误"}, ensure_ascii=False))
+            await websocket.send(serialization.dumps({"type": "error", "message": "JSON格式错误"}))
+        except Exception as e:
+            logger.error(f"[错误] 消息处理错误: {e}", exc_info=True)
+            await websocket.send(serialization.dumps({"type": "error", "message": "服务器内部错误"}))
+
+    async def _send_response(self, websocket, response: Dict[str, Any]):
+        """向发送方回复处理结果"""
+        response["timestamp"] = datetime.now().isoformat()
+        try:
+            await websocket.send(serialization.dumps(response))
+        except websockets.exceptions.ConnectionClosed:
+            logger.warning(f"[回复] 连接已关闭，丢弃响应: {response.get('type')}")
+
+    async def _process_queued_message(self, websocket, data: Dict[str, Any], timestamp: str):
+        """在聊天队列中处理记忆消息，完成后回复发送方"""
+        try:
+            response = await self.process_message_by_type(data, timestamp)
         except Exception as e:
             logger.error(f"[错误] 消息处理错误: {e}", exc_info=True)
-            await websocket.send(json.dumps({"type": "error", "message": "服务器内部错误"}, ensure_ascii=False))
+            response = {"type": "error", "message": "服务器内部错误"}
+        if response:
+            await self._send_response(websocket, response)
 
     async def process_message_by_type(self, data: Dict[str, Any], timestamp: str) -> Dict[str, Any]:
         """根据消息类型处理数据"""
@@ -117,6 +174,10 @@ class DianpingWebSocketServer:
         
         if msg_type == "ping":
             return {"type": "pong", "message": "服务器正常运行"}
+        elif msg_type == "stats":
+            return self.handle_stats()
+        elif msg_type == "data_query":
+            return self.handle_data_query(data)
         elif msg_type == "dianping_data":
             return await self.handle_dianping_data(data, timestamp)
         elif msg_type == "chat_context_switch":
@@ -133,16 +194,14 @@ class DianpingWebSocketServer:
         """处理数据列表 (通常是历史消息)，现在主要用于记录"""
         logger.info(f"[数据] 提取到 {len(data_list)} 条数据 (此路径不再触发AI)")
         data_id = f"dianping_list_{timestamp}"
-        self.data_store[data_id] = {
-            "content": data_list, "timestamp": timestamp, "type": "dianping_data_list"
-        }
+        self.data_store.add(data_id, "dianping_data_list", data_list, timestamp)
         return {"type": "data_received", "message": f"数据列表已接收 ({len(data_list)}条)", "data_id": data_id}
 
     async def handle_dianping_data(self, data: Dict[str, Any], timestamp: str) -> Dict[str, Any]:
         """处理通用的大众点评数据对象"""
         content = data.get("payload", {})
         data_id = f"dianping_{timestamp}"
-        self.data_store[data_id] = {"content": content, "timestamp": timestamp, "type": "dianping_data_object"}
+        self.data_store.add(data_id, "dianping_data_object", content, timestamp)
         logger.info(f"[数据] 存储数据对象: {data_id}")
         return {"type": "data_received", "message": "大众点评数据已接收", "data_id": data_id}
 
@@ -154,38 +213,107 @@ class DianpingWebSocketServer:
         logger.info(f"[上下文切换] 切换到: {new_contact_name} ({new_chat_id})")
         return {"type": "chat_context_switched", "message": f"聊天对象已切换: {new_contact_name}", "new_chat_id": new_chat_id}
 
+    def handle_data_query(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """按 dataId 或接收时间范围（since/until，UTC毫秒或ISO字符串）查询已接收的数据"""
+        payload = data.get("payload") or {}
+        data_id = payload.get("dataId")
+        if data_id is not None:
+            record = self.data_store.get(str(data_id))
+            entries = [record] if record is not None else []
+        else:
+            try:
+                limit = min(int(payload.get("limit", 100)), Config.MAX_DATA_ENTRIES)
+            except (TypeError, ValueError):
+                return {"type": "error", "message": "limit 必须是整数"}
+            entries = self.data_store.query(
+                since=payload.get("since"), until=payload.get("until"),
+                entry_type=payload.get("dataType"), limit=limit
+            )
+        return {"type": "data_query_result", "count": len(entries), "entries": entries}
+
+    def handle_stats(self) -> Dict[str, Any]:
+        """返回服务器运行统计（对话缓存命中率与内存占用、上报数据存储、数据库、队列、回复防抖）"""
+        return {
+            "type": "stats",
+            "conversationCache": self.conversation_cache.get_stats(),
+            "dataStore": self.data_store.get_stats(),
+            "database": {**db_manager.get_stats(), "async": self.db.get_stats()},
+            "chatQueues": self.chat_actors.get_stats(),
+            "replyDebouncer": self.reply_debouncer.get_stats(),
+        }
+
+    async def _load_history(self, chat_id: str) -> List[Dict[str, Any]]:
+        """读取聊天最近的历史：优先使用对话缓存，未命中时从数据库加载并缓存"""
+        cached = self.conversation_cache.get(chat_id)
+        if cached is not None:
+            return cached
+        try:
+            page = await self.db.get_history_page(chat_id, limit=Config.AI_HISTORY_LIMIT)
+        except BaseException:
+            # 包括被新消息取消的回复：不结束这次加载会让缓存一直认为该聊天在加载中
+            self.conversation_cache.cancel_load(chat_id)
+            raise
+        history = page.as_messages()
+        self.conversation_cache.put(chat_id, history, complete=page.before is None)
+        return history
+
+    async def _store_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """写入数据库并追加到对话缓存，返回新增的消息；写入失败或被取消时丢弃相关聊天的缓存"""
+        try:
+            new_messages = await self.db.add_messages_bulk(messages)
+        except BaseException:
+            for chat_id in {message.get('chatId', 'unknown_chat') for message in messages}:
+                self.conversation_cache.invalidate(chat_id)
+            raise
+        self._cache_new_messages(new_messages)
+        return new_messages
+
+    def _cache_new_messages(self, messages: List[Dict[str, Any]]):
+        """把新写入数据库的消息追加到对应聊天的对话缓存"""
+        by_chat: Dict[str, List[Dict[str, Any]]] = {}
+        for message in messages:
+            by_chat.setdefault(message.get('chatId', 'unknown_chat'), []).append(message)
+        for chat_id, chat_messages in by_chat.items():
+            self.conversation_cache.append(chat_id, chat_messages)
+
+    def _decode_memory_payload(self, data: Dict[str, Any]):
+        """把记忆消息的payload解码为 MemoryPayload，字段类型不符时返回None"""
+        try:
+            return serialization.convert(data.get("payload") or {}, MemoryPayload)
+        except ValueError as e:
+            logger.warning(f"[记忆处理] payload格式错误: {e}")
+            return None
+
     async def handle_memory_update(self, data: Dict[str, Any], timestamp: str) -> Dict[str, Any]:
         """
         使用数据库处理记忆更新，识别新消息并根据5分钟规则触发AI。
         改进版本：加入时间控制，避免频繁回复。
         """
-        payload = data.get("payload", {})
-        chat_id = self._safe_get_value(payload.get("chatId"), "default_chat")
-        contact_name = self._safe_get_value(payload.get("contactName"), "未知用户")
-        conversation_memory = payload.get("conversationMemory", [])
+        payload = self._decode_memory_payload(data)
+        if payload is None:
+            return { "type": "error", "message": "记忆消息格式错误" }
+        chat_id = self._safe_get_value(payload.chatId, "default_chat")
+        contact_name = self._safe_get_value(payload.contactName, "未知用户")
+        conversation_memory = payload.conversationMemory
 
         if not conversation_memory:
             return { "type": "memory_ack", "message": "空记忆，无需更新" }
 
         logger.info(f"[记忆处理] 收到 {contact_name} ({chat_id}) 的 {len(conversation_memory)} 条记忆")
 
-        new_messages = []
         for message in conversation_memory:
             message['chatId'] = message.get('chatId', chat_id)
             message['contactName'] = message.get('contactName', contact_name)
-            
-            message_id = db_manager._generate_message_id(message)
-            
-            if not db_manager.is_message_processed(message_id):
-                new_messages.append(message)
+
+        # 一次查询过滤已入库的消息，新消息在同一个事务中写入
+        new_messages = await self._store_messages(conversation_memory)
 
         if not new_messages:
             logger.info(f"[记忆处理] {contact_name}: 无新消息")
             return { "type": "memory_updated", "new_messages_count": len(new_messages) }
 
-        logger.info(f"[记忆处理] {contact_name}: 检测到 {len(new_messages)} 条新消息，将存入数据库")
+        logger.info(f"[记忆处理] {contact_name}: 检测到 {len(new_messages)} 条新消息，已存入数据库")
         for msg in new_messages:
-            db_manager.add_message(msg)
             logger.info(f"  -> [新消息] Role: {msg.get('role', 'N/A')}, Content: '{str(msg.get('content', ''))[:50]}...'")
 
         new_customer_messages = [m for m in new_messages if m.get("role") == "user"]
@@ -195,64 +323,96 @@ class DianpingWebSocketServer:
             return { "type": "memory_updated", "new_messages_count": len(new_messages) }
 
         # 检查是否应该回复（5分钟规则：只在客户消息发送后5分钟内回复）
-        if not db_manager.should_reply_to_chat(chat_id, contact_name):
+        if not await self.db.should_reply_to_chat(chat_id, contact_name):
             logger.info(f"[AI触发] {contact_name}: 根据5分钟规则，暂不回复")
             return { "type": "memory_updated_no_reply", "new_messages_count": len(new_messages) }
 
         latest_customer_message = new_customer_messages[-1]
         message_content = latest_customer_message.get("content", "")
-        
-        logger.info(f"[AI触发] {contact_name}: 基于新消息 '{message_content[:50]}...' 触发AI")
-
-        full_history = db_manager.get_chat_history(chat_id, limit=50)
-        logger.info(f"[AI触发] 为AI加载了 {len(full_history)} 条来自数据库的历史记录")
 
         # 提取上下文信息
-        context_info = payload.get("contextInfo")
+        context_info = payload.contextInfo
         if context_info:
             logger.info(f"[AI触发] 检测到上下文信息: {context_info}")
         else:
-            logger.warning(f"[AI触发] 未检测到上下文信息，payload keys: {list(payload.keys())}")
-        
+            logger.warning("[AI触发] 未检测到上下文信息")
+
+        # 连续消息合并为一次AI调用：等待窗口内没有新消息才生成回复，新消息会取消正在生成的回复
+        logger.info(f"[AI触发] {contact_name}: 基于新消息 '{message_content[:50]}...' 触发AI"
+                    f"（等待 {Config.AI_REPLY_DEBOUNCE_SECONDS}s 合并后续消息）")
+        self.reply_debouncer.schedule(
+            chat_id, lambda: self._generate_ai_reply(chat_id, contact_name, message_content, context_info)
+        )
+
+        return { "type": "memory_updated_and_ai_triggered", "new_messages_count": len(new_messages) }
+
+    async def _generate_ai_reply(self, chat_id: str, contact_name: str, message_content: str,
+                                 context_info: Optional[Dict[str, Any]]):
+        """基于数据库中的最新历史生成AI回复并发送（由防抖器在等待窗口结束后调用）"""
+        # 只读取最近的角色、内容和时间，不解码 raw_data
+        full_history = await self._load_history(chat_id)
+        logger.info(f"[AI触发] 为AI加载了 {len(full_history)} 条历史记录")
+
         try:
-            ai_response = await self.ai_client.generate_customer_service_reply(
-                customer_message=message_content,
-                conversation_history=full_history,
-                context_info=context_info
-            )
+            on_delta, on_round_start = (self._create_delta_forwarder(chat_id, contact_name)
+                                        if Config.AI_STREAMING else (None, None))
+            async with self.chat_actors.ai_slot():
+                ai_response = await self.ai_client.generate_customer_service_reply(
+                    customer_message=message_content,
+                    conversation_history=full_history,
+                    context_info=context_info,
+                    on_delta=on_delta,
+                    chat_id=chat_id,
+                    on_side_effect=lambda tools: self.reply_debouncer.protect_current(f"{chat_id} {tools}"),
+                    on_round_start=on_round_start
+                )
 
             if ai_response and ai_response.content:
-                ai_response_text = ai_response.content
-                logger.info(f"[AI回复] {contact_name}: {ai_response_text[:100]}...")
-                ai_reply_message = {
-                    "type": "ai_reply", "chatId": chat_id, "contactName": contact_name,
-                    "reply": ai_response_text, "timestamp": datetime.now().isoformat()
-                }
-                await self._broadcast_ai_reply(ai_reply_message)
-                
-                db_message = {
-                    "chatId": chat_id, "contactName": contact_name, "role": "assistant",
-                    "content": ai_response_text, "timestamp": ai_reply_message["timestamp"]
-                }
-                db_manager.add_message(db_message)
-                
-                logger.info(f"[数据库] 已存储AI对 {contact_name} 的回复")
+                # 开始发送后不再被新消息取消，保证广播和入库一致；
+                # 新消息触发的下一次回复等发送完成、本条回复入库后才读取历史，避免重复或矛盾的回复
+                self.reply_debouncer.protect_current(f"{chat_id} 发送回复")
+                await asyncio.shield(self._deliver_ai_reply(chat_id, contact_name, ai_response))
             else:
                 logger.warning(f"[AI回复] {contact_name}: AI未返回有效回复")
 
         except Exception as e:
             logger.error(f"[AI触发] 调用AI时发生错误 for {contact_name}: {e}", exc_info=True)
 
-        return { "type": "memory_updated_and_ai_triggered", "new_messages_count": len(new_messages) }
+        saved = self.reply_debouncer.get_stats()["saved_calls"]
+        if saved:
+            logger.info(f"[回复防抖] 累计合并消息节省 {saved} 次AI调用")
+
+    async def _deliver_ai_reply(self, chat_id: str, contact_name: str, ai_response):
+        """广播AI回复并存入数据库"""
+        ai_response_text = ai_response.content
+        logger.info(f"[AI回复] {contact_name}: {ai_response_text[:100]}...")
+        if ai_response.time_to_first_token is not None:
+            logger.info(f"[AI回复] {contact_name}: 首字延迟 {ai_response.time_to_first_token:.0f}ms")
+        ai_reply_message = {
+            "type": "ai_reply", "chatId": chat_id, "contactName": contact_name,
+            "reply": ai_response_text, "timestamp": datetime.now().isoformat(),
+            "ttftMs": ai_response.time_to_first_token
+        }
+        await self._broadcast_ai_reply(ai_reply_message)
+
+        db_message = {
+            "chatId": chat_id, "contactName": contact_name, "role": "assistant",
+            "content": ai_response_text, "timestamp": ai_reply_message["timestamp"]
+        }
+        await self._store_messages([db_message])
+
+        logger.info(f"[数据库] 已存储AI对 {contact_name} 的回复")
 
     async def handle_memory_save(self, data: Dict[str, Any], timestamp: str) -> Dict[str, Any]:
         """
         处理记忆保存请求 - 用于手动保存当前对话记忆
         """
-        payload = data.get("payload", {})
-        chat_id = self._safe_get_value(payload.get("chatId"), "default_chat")
-        contact_name = self._safe_get_value(payload.get("contactName"), "未知用户")
-        conversation_memory = payload.get("conversationMemory", [])
+        payload = self._decode_memory_payload(data)
+        if payload is None:
+            return { "type": "error", "message": "记忆消息格式错误" }
+        chat_id = self._safe_get_value(payload.chatId, "default_chat")
+        contact_name = self._safe_get_value(payload.contactName, "未知用户")
+        conversation_memory = payload.conversationMemory
         
         if not conversation_memory:
             logger.info(f"[记忆保存] {contact_name}: 空记忆，无需保存")
@@ -261,12 +421,11 @@ class DianpingWebSocketServer:
         logger.info(f"[记忆保存] {contact_name} ({chat_id}): 保存 {len(conversation_memory)} 条记忆")
         
         # 提取上下文信息（如果有）
-        context_info = payload.get("contextInfo")
+        context_info = payload.contextInfo
         if context_info:
             logger.info(f"[记忆保存] 上下文信息: {context_info}")
         
         # 保存所有记忆到数据库（不重复保存已存在的消息）
-        saved_count = 0
         for message in conversation_memory:
             message['chatId'] = message.get('chatId', chat_id)
             message['contactName'] = message.get('contactName', contact_name)
@@ -274,12 +433,9 @@ class DianpingWebSocketServer:
             # 如果有上下文信息，添加到消息中
             if context_info:
                 message['contextInfo'] = context_info
-            
-            message_id = db_manager._generate_message_id(message)
-            
-            if not db_manager.is_message_processed(message_id):
-                db_manager.add_message(message)
-                saved_count += 1
+        
+        saved_messages = await self._store_messages(conversation_memory)
+        saved_count = len(saved_messages)
         
         logger.info(f"[记忆保存] {contact_name}: 成功保存 {saved_count} 条新记忆")
         return { 
@@ -302,6 +458,7 @@ class DianpingWebSocketServer:
 
     async def start_server(self):
         """启动WebSocket服务器"""
+        await self.ai_client.start()
         self.server = await websockets.serve(self.handle_client, self.host, self.port)
         logger.info(f"🚀 服务器已启动，监听于 ws://{self.host}:{self.port}")
         
@@ -310,23 +467,61 @@ class DianpingWebSocketServer:
         
         await self.server.wait_closed()
 
-    async def _broadcast_ai_reply(self, ai_response: Dict[str, Any]):
-        """向所有客户端广播AI回复"""
-        message_to_send = {
-            "type": "sendAIReply",
-            "text": ai_response.get("reply", "")
-        }
-        logger.info(f"[广播] AI回复指令已发送: {message_to_send['text'][:50]}...")
-        
+    def _create_delta_forwarder(self, chat_id: str, contact_name: str):
+        """
+        创建流式回复的增量转发回调
+        累积模型输出的文本片段，按 STREAM_DELTA_INTERVAL 节流后向扩展推送完整的预览文本。
+        工具调用后开始新一轮请求时清空累积的文本，预览只显示当前一轮的输出。
+
+        Returns:
+            (on_delta, on_round_start) 两个回调
+        """
+        state = {"text": "", "seq": 0, "last_sent": 0.0}
+        loop = asyncio.get_running_loop()
+
+        async def on_delta(delta: str):
+            state["text"] += delta
+            now = loop.time()
+            if now - state["last_sent"] < Config.STREAM_DELTA_INTERVAL:
+                return
+            state["last_sent"] = now
+            state["seq"] += 1
+            await self._broadcast({
+                "type": "aiReplyDelta",
+                "chatId": chat_id,
+                "contactName": contact_name,
+                "text": state["text"],
+                "seq": state["seq"]
+            })
+
+        async def on_round_start(round_number: int):
+            state["text"] = ""
+            state["last_sent"] = 0.0  # 新一轮的第一段文本立即推送，替换上一轮的预览
+
+        return on_delta, on_round_start
+
+    async def _broadcast(self, message: Dict[str, Any]):
+        """向所有客户端广播消息"""
+        payload = serialization.dumps(message)
         disconnected_clients = []
-        for client in self.clients:
+        for client in list(self.clients):
             try:
-                await client.send(json.dumps(message_to_send, ensure_ascii=False))
+                await client.send(payload)
             except websockets.exceptions.ConnectionClosed:
                 disconnected_clients.append(client)
         
         for client in disconnected_clients:
             await self.unregister_client(client)
+
+    async def _broadcast_ai_reply(self, ai_response: Dict[str, Any]):
+        """向所有客户端广播AI回复"""
+        message_to_send = {
+            "type": "sendAIReply",
+            "text": ai_response.get("reply", ""),
+            "ttftMs": ai_response.get("ttftMs")
+        }
+        logger.info(f"[广播] AI回复指令已发送: {message_to_send['text'][:50]}...")
+        await self._broadcast(message_to_send)
             
     async def stop(self):
         """优雅地停止服务器"""
@@ -346,16 +541,22 @@ class DianpingWebSocketServer:
         if self.server:
             self.server.close()
             await self.server.wait_closed()
+        await self.chat_actors.close()
+        await self.reply_debouncer.close()
+        await self.ai_client.close()
+        await self.db.close()
         db_manager.close()
+        self.data_store.close()
         logger.info("服务器已成功关闭")
 
     async def polling_worker(self):
-        """轮询任务已禁用 - 只使用实时处理避免双重触发"""
+        """轮询任务已禁用 - 只使用实时处理避免双重触发；仅定期回收空闲聊天的对话缓存和过期的上报数据"""
         logger.info("[轮询] 轮询任务已禁用，只使用实时消息处理")
         
-        # 空循环，不执行任何轮询逻辑
         while not self.is_stopping:
             await asyncio.sleep(30)  # 延长睡眠时间
+            self.conversation_cache.evict_idle()
+            self.data_store.evict_expired()
 
 async def main():
     server = DianpingWebSocketServer()
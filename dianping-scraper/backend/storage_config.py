@@ -0,0 +1,77 @@
+"""
+SQLite存储配置
+集中管理聊天数据库的连接参数和PRAGMA：
+- WAL日志：读连接（历史查询、viewdb.py）不阻塞写入，写入也不阻塞读取
+- synchronous=NORMAL：WAL模式下只在检查点时fsync，断电最多丢失最近一次提交，数据库不会损坏
+- 内存映射I/O与页缓存大小
+- 成组提交：写线程累计到N条消息或等待M毫秒后统一提交一次
+所有参数都可以通过环境变量覆盖。
+"""
+
+import os
+import sqlite3
+from dataclasses import asdict, dataclass
+from typing import Any, Dict
+
+JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+SYNCHRONOUS_LEVELS = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+
+@dataclass
+class StorageConfig:
+    """聊天数据库存储参数"""
+
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    mmap_size: int = 64 * 1024 * 1024  # 字节，0表示不使用内存映射
+    cache_size_kb: int = 16 * 1024  # 每个连接的页缓存大小（KB）
+    busy_timeout_ms: int = 10000
+    group_commit_messages: int = 256  # 累计多少条消息提交一次
+    group_commit_interval_ms: float = 1.0  # 第一条写入到达后最多等待多久提交，0表示只合并提交期间排队的写入
+
+    @classmethod
+    def from_env(cls) -> "StorageConfig":
+        """从环境变量读取配置"""
+        default = cls()
+        return cls(
+            journal_mode=os.getenv("DB_JOURNAL_MODE", default.journal_mode),
+            synchronous=os.getenv("DB_SYNCHRONOUS", default.synchronous),
+            mmap_size=int(os.getenv("DB_MMAP_SIZE", default.mmap_size)),
+            cache_size_kb=int(os.getenv("DB_CACHE_SIZE_KB", default.cache_size_kb)),
+            busy_timeout_ms=int(os.getenv("DB_BUSY_TIMEOUT_MS", default.busy_timeout_ms)),
+            group_commit_messages=int(os.getenv("DB_GROUP_COMMIT_MESSAGES", default.group_commit_messages)),
+            group_commit_interval_ms=float(os.getenv("DB_GROUP_COMMIT_INTERVAL_MS", default.group_commit_interval_ms)),
+        )
+
+    def __post_init__(self):
+        self.journal_mode = self.journal_mode.upper()
+        self.synchronous = self.synchronous.upper()
+        if self.journal_mode not in JOURNAL_MODES:
+            raise ValueError(f"不支持的 journal_mode: {self.journal_mode}")
+        if self.synchronous not in SYNCHRONOUS_LEVELS:
+            raise ValueError(f"不支持的 synchronous: {self.synchronous}")
+
+    def connect(self, db_path: str) -> sqlite3.Connection:
+        """按配置打开一个连接（行以 sqlite3.Row 返回，允许跨线程使用）"""
+        conn = sqlite3.connect(db_path, check_same_thread=False, timeout=self.busy_timeout_ms / 1000)
+        conn.row_factory = sqlite3.Row
+        self.apply(conn)
+        return conn
+
+    def apply(self, conn: sqlite3.Connection) -> Dict[str, Any]:
+        """
+        在连接上执行PRAGMA
+
+        Returns:
+            实际生效的设置（内存数据库的 journal_mode 始终为 memory）
+        """
+        journal_mode = conn.execute(f"PRAGMA journal_mode={self.journal_mode}").fetchone()[0]
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        # 负数表示以KB为单位
+        conn.execute(f"PRAGMA cache_size={-int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        return {"journal_mode": journal_mode}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
@@ -0,0 +1,172 @@
+"""
+消息时间戳规范化
+消息时间戳有多种来源和格式：
+- 扩展 timestamp-extractor.js / memory.js 的 Date.toISOString()：UTC，带 Z 和毫秒
+- 扩展的 Date.now()：毫秒数字
+- 秒级数字（以及数字字符串）
+- 服务器写入的 datetime.now().isoformat()：不带时区，按本机时区
+- 带时区偏移的ISO字符串（如 +08:00）
+入库时统一转换为一个整数UTC毫秒时间戳（messages.ts_epoch），同时保留原始字符串（messages.timestamp），
+排序和时间比较只使用 ts_epoch，查询时不再解析字符串。
+已有数据库用 backfill_epochs 回填：主体由一条SQL批量完成，SQL无法解析的少数行再用Python逐行处理。
+"""
+
+import math
+import sqlite3
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, NamedTuple, Optional
+
+# 小于该值的数字按秒处理，否则按毫秒（1e11 秒约为公元5138年，1e11 毫秒约为1973年）
+MS_THRESHOLD = 1e11
+# 可信的时间范围 [2000-01-01, 2100-01-01) UTC，超出范围按无法解析处理（也保证能存入SQLite INTEGER）
+MIN_EPOCH_MS = 946684800000
+MAX_EPOCH_MS = 4102444800000
+
+
+class NormalizedTimestamp(NamedTuple):
+    """规范化后的时间戳"""
+
+    epoch_ms: int  # UTC毫秒时间戳
+    original: Optional[str]  # 原始值（数字转为字符串），没有时间戳时为 None
+    fallback: bool = False  # 原始值缺失或无法解析，使用了接收时间
+
+    @property
+    def text(self) -> str:
+        """用于存储和展示的字符串：有原始值时用原始值，否则用UTC ISO格式"""
+        return self.original if self.original is not None else epoch_ms_to_iso(self.epoch_ms)
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _in_range(epoch_ms: int) -> Optional[int]:
+    return epoch_ms if MIN_EPOCH_MS <= epoch_ms < MAX_EPOCH_MS else None
+
+
+def _number_to_ms(number: float) -> Optional[int]:
+    if not math.isfinite(number):
+        return None
+    return _in_range(round(number if abs(number) >= MS_THRESHOLD else number * 1000))
+
+
+def parse_epoch_ms(value: Any) -> Optional[int]:
+    """
+    把时间戳转换为UTC毫秒，无法解析或不在可信范围内时返回 None
+
+    Args:
+        value: 数字（秒或毫秒）、数字字符串或ISO格式字符串
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return _number_to_ms(value)
+    if not isinstance(value, str):
+        return None
+    text = value.strip()
+    if not text:
+        return None
+    try:
+        return _number_to_ms(float(text))
+    except ValueError:
+        pass
+    if text.endswith(("Z", "z")):
+        text = text[:-1] + "+00:00"
+    try:
+        parsed = datetime.fromisoformat(text)
+        # 不带时区的时间按本机时区解析（datetime.timestamp 的默认行为）
+        return _in_range(round(parsed.timestamp() * 1000))
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+def normalize_timestamp(value: Any, received_ms: Optional[int] = None) -> NormalizedTimestamp:
+    """
+    入库时规范化消息时间戳
+
+    Args:
+        value: 消息中的 timestamp 字段
+        received_ms: 接收时间（UTC毫秒），原始值缺失或无法解析时使用，默认为当前时间
+
+    Returns:
+        NormalizedTimestamp
+    """
+    original = None if value is None else (value if isinstance(value, str) else str(value))
+    epoch_ms = parse_epoch_ms(value)
+    if epoch_ms is not None:
+        return NormalizedTimestamp(epoch_ms, original)
+    return NormalizedTimestamp(received_ms if received_ms is not None else now_ms(), original, fallback=True)
+
+
+def epoch_ms_to_iso(epoch_ms: int) -> str:
+    """UTC毫秒转为与 Date.toISOString() 相同格式的字符串"""
+    moment = datetime.fromtimestamp(epoch_ms / 1000, tz=timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.") + f"{moment.microsecond // 1000:03d}Z"
+
+
+def epoch_ms_sql(column: str = "timestamp") -> str:
+    """
+    与 parse_epoch_ms 等价的SQL表达式（用于批量回填）
+
+    SQLite 的日期函数直接支持 Z 和 ±HH:MM 后缀；不带时区的时间用 'utc' 修饰符按本机时区换算。
+    必须以日期开头（SQLite 会把单独的 "14:30" 当作2000-01-01），无法解析或不在可信范围内时结果为 NULL。
+    """
+    return f"""(SELECT epoch FROM (SELECT {_epoch_ms_sql_unchecked(column)} AS epoch)
+        WHERE epoch >= {MIN_EPOCH_MS} AND epoch < {MAX_EPOCH_MS})"""
+
+
+def _epoch_ms_sql_unchecked(column: str) -> str:
+    return f"""CASE
+        WHEN {column} GLOB '[0-9]*' AND {column} NOT GLOB '*[^0-9.]*' THEN
+            CASE WHEN CAST({column} AS REAL) >= {MS_THRESHOLD:.0f}
+                 THEN CAST(ROUND(CAST({column} AS REAL)) AS INTEGER)
+                 ELSE CAST(ROUND(CAST({column} AS REAL) * 1000) AS INTEGER) END
+        WHEN {column} NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*' THEN NULL
+        WHEN {column} GLOB '*[Zz]' OR {column} GLOB '*[+-][0-9][0-9]:[0-9][0-9]' THEN
+            CAST(ROUND((julianday({column}) - 2440587.5) * 86400000) AS INTEGER)
+        ELSE CAST(ROUND((julianday({column}, 'utc') - 2440587.5) * 86400000) AS INTEGER)
+    END"""
+
+
+def backfill_epochs(conn: sqlite3.Connection, chunk: int = 50000) -> Dict[str, int]:
+    """
+    为 ts_epoch 为空的消息回填UTC毫秒时间戳（不提交，由调用方提交）
+
+    1. 按 rowid 分段执行一条 UPDATE，由SQLite批量换算常见格式
+    2. SQL无法解析的行用 parse_epoch_ms 逐行处理
+    3. 仍无法解析的行（或没有时间戳的行）使用入库时间 processed_at
+
+    Returns:
+        各阶段更新的行数
+    """
+    stats = {"sql": 0, "python": 0, "processed_at": 0}
+    bounds = conn.execute("SELECT MIN(rowid), MAX(rowid) FROM messages WHERE ts_epoch IS NULL").fetchone()
+    if bounds[0] is None:
+        return stats
+
+    expression = epoch_ms_sql("timestamp")
+    for start in range(bounds[0], bounds[1] + 1, chunk):
+        cursor = conn.execute(
+            f"UPDATE messages SET ts_epoch = {expression} "
+            f"WHERE ts_epoch IS NULL AND rowid BETWEEN ? AND ?",
+            (start, start + chunk - 1)
+        )
+        stats["sql"] += cursor.rowcount
+    stats["sql"] -= conn.execute("SELECT COUNT(*) FROM messages WHERE ts_epoch IS NULL").fetchone()[0]
+
+    leftovers = conn.execute(
+        "SELECT rowid, timestamp FROM messages WHERE ts_epoch IS NULL AND timestamp IS NOT NULL"
+    ).fetchall()
+    updates = [(epoch, rowid) for rowid, epoch in
+               ((row[0], parse_epoch_ms(row[1])) for row in leftovers) if epoch is not None]
+    conn.executemany("UPDATE messages SET ts_epoch = ? WHERE rowid = ?", updates)
+    stats["python"] = len(updates)
+
+    # processed_at 由 CURRENT_TIMESTAMP 写入，是UTC时间
+    cursor = conn.execute(
+        "UPDATE messages SET ts_epoch = CAST(ROUND((julianday(processed_at) - 2440587.5) * 86400000) AS INTEGER) "
+        "WHERE ts_epoch IS NULL AND processed_at IS NOT NULL"
+    )
+    stats["processed_at"] = cursor.rowcount
+    return stats
@@ -49,6 +49,21 @@ function connectWebSocket() {
                         console.warn('[Background] 未找到活跃的大众点评Tab来发送AI回复。');
                     }
                 });
+            } else if (command.type === 'aiReplyDelta' && command.text) {
+                // 流式回复预览：只填入输入框，不发送（最终文本由 sendAIReply 发送）
+                chrome.tabs.query({ active: true, url: "*://*.dianping.com/*" }, (tabs) => {
+                    if (tabs.length > 0) {
+                        chrome.tabs.sendMessage(tabs[0].id, {
+                            type: 'previewAIReply',
+                            text: command.text,
+                            seq: command.seq
+                        }, () => {
+                            if (chrome.runtime.lastError) {
+                                console.warn('[Background] 发送AI回复预览失败:', chrome.runtime.lastError.message);
+                            }
+                        });
+                    }
+                });
             }
         } catch (error) {
             console.warn('[Background]收到的服务器消息不是一个有效的JSON指令。', error);
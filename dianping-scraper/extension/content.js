@@ -12,6 +12,8 @@
         constructor() {
             this.isActive = false;
             this.pollingInterval = null;
+            this.pendingPreviewText = null; // 等待填入输入框的最新流式预览文本
+            this.previewPromise = null;
             
             // 初始化各个模块
             this.dataExtractor = new DataExtractor();
@@ -64,6 +66,10 @@
                              .then(result => sendResponse(result))
                              .catch(error => sendResponse({ status: 'failed', message: error.message }));
                         break;
+                    case 'previewAIReply':
+                        this.previewAIReply(request.text);
+                        sendResponse({ status: 'queued' });
+                        break;
                     case 'getShopName':
                         const shopName = window.DianpingUtils.getCurrentShopName();
                         sendResponse({ shopName: shopName });
@@ -134,12 +140,42 @@
             });
         }
 
+        /**
+         * 流式预览AI回复 - 只把当前已生成的文本填入输入框，不点击发送
+         * 预览串行执行，只保留最新一段文本，避免注入脚本互相干扰
+         */
+        previewAIReply(replyText) {
+            this.pendingPreviewText = replyText;
+            if (!this.previewPromise) {
+                this.previewPromise = this._flushPreview().finally(() => {
+                    this.previewPromise = null;
+                });
+            }
+            return this.previewPromise;
+        }
+
+        async _flushPreview() {
+            while (this.pendingPreviewText !== null) {
+                const text = this.pendingPreviewText;
+                this.pendingPreviewText = null;
+                try {
+                    await this._executeInjectedScript({ action: 'previewText', text });
+                } catch (error) {
+                    console.warn('[ContentScript] AI回复预览失败:', error.message);
+                }
+            }
+        }
+
         /**
          * 发送AI回复
          */
         sendAIReply(replyText) {
             console.log(`[ContentScript] Received request to send AI reply: "${replyText}"`);
             
+            // 丢弃尚未显示的预览，并等待正在进行的预览完成后再发送
+            this.pendingPreviewText = null;
+            const previewDone = this.previewPromise || Promise.resolve();
+            
             // 将AI回复添加到记忆中
             const memoryStatus = this.memoryManager.getMemoryStatus();
             const aiReplyData = {
@@ -155,10 +191,10 @@
             
             this.memoryManager.addToMemoryWithoutTrigger(aiReplyData);
             
-            return this._executeInjectedScript({
+            return previewDone.then(() => this._executeInjectedScript({
                 action: 'testAndSend',
                 text: replyText
-            });
+            }));
         }
         
         /**
@@ -22,6 +22,8 @@
         console.log('[Injector] Executing task:', task);
         if (task.action === 'testAndSend') {
             performSend(task.text);
+        } else if (task.action === 'previewText') {
+            performPreview(task.text);
         } else {
             reportResult('failed', `Unknown task action: ${task.action}`);
         }
@@ -87,6 +89,29 @@
         }
     }
 
+    function performPreview(textToShow) {
+        try {
+            const iframes = document.querySelectorAll('iframe');
+            for (let i = 0; i < iframes.length; i++) {
+                try {
+                    const doc = iframes[i].contentDocument;
+                    if (!doc) continue;
+
+                    const inputBox = doc.querySelector('pre[data-placeholder="请输入你要回复顾客的内容"].dzim-chat-input-container');
+                    if (!inputBox) continue;
+
+                    inputBox.textContent = textToShow;
+                    inputBox.dispatchEvent(new Event('input', { bubbles: true }));
+                    reportResult('success', 'Preview updated.');
+                    return;
+                } catch (e) { /* ignore */ }
+            }
+            reportResult('failed', 'Could not find the input box.');
+        } catch (error) {
+            reportResult('failed', `A critical error occurred: ${error.message}`);
+        }
+    }
+
     function findSendButton(doc) {
         const allButtons = doc.querySelectorAll('button.dzim-button.dzim-button-primary');
         for (const btn of allButtons) {
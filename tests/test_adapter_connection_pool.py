@@ -0,0 +1,85 @@
+"""
+AI适配器HTTP连接池测试
+"""
+
+import pytest
+from aiohttp import web
+
+from aiclient.adapters.openai_adapter import OpenAIAdapter
+from aiclient.config import ModelConfig, AIProvider
+from aiclient.models import AIRequest, AIMessage, MessageRole
+
+
+async def _start_stub_llm_server():
+    """启动本地模拟LLM服务器，记录每个请求使用的TCP连接"""
+    peers = []
+
+    async def chat_completions(request):
+        peers.append(request.transport.get_extra_info("peername"))
+        return web.json_response({
+            "model": "stub-model",
+            "choices": [{
+                "message": {"role": "assistant", "content": "您好"},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+        })
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1", peers
+
+
+class TestAdapterConnectionPool:
+    """测试适配器连接池复用"""
+
+    @pytest.mark.asyncio
+    async def test_requests_reuse_connection(self):
+        """测试多次请求复用同一个TCP连接"""
+        runner, base_url, peers = await _start_stub_llm_server()
+        adapter = OpenAIAdapter(ModelConfig(
+            provider=AIProvider.OPENAI,
+            model_name="stub-model",
+            api_key="test-key",
+            base_url=base_url
+        ))
+        request = AIRequest(messages=[AIMessage(role=MessageRole.USER, content="你好")])
+
+        try:
+            for _ in range(5):
+                response = await adapter.chat_completion(request)
+                assert response.content == "您好"
+            session = adapter._session
+            assert session is not None
+            assert len(peers) == 5
+            assert len(set(peers)) == 1
+        finally:
+            await adapter.close()
+            await runner.cleanup()
+
+        assert session.closed
+        assert adapter._session is None
+
+    @pytest.mark.asyncio
+    async def test_pool_settings_applied(self):
+        """测试连接池参数来自模型配置"""
+        adapter = OpenAIAdapter(ModelConfig(
+            provider=AIProvider.OPENAI,
+            model_name="stub-model",
+            api_key="test-key",
+            base_url="http://127.0.0.1:1/v1",
+            pool_limit=7,
+            pool_limit_per_host=3
+        ))
+        try:
+            session = await adapter._get_session()
+            assert session.connector.limit == 7
+            assert session.connector.limit_per_host == 3
+            assert await adapter._get_session() is session
+        finally:
+            await adapter.close()
@@ -3,9 +3,38 @@ AI客户端测试
 """
 
 import asyncio
+import json
 import pytest
 from unittest.mock import Mock, patch
 from aiclient import AIClient, AIProvider, AIResponse
+from aiclient.models import AIRequest, AIMessage, MessageRole
+
+
+class ScriptedAdapter:
+    """按预设脚本返回响应的模拟适配器"""
+    
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+        self.executed = []
+    
+    async def chat_completion(self, request):
+        self.requests.append(request)
+        return self.responses.pop(0)
+    
+    async def execute_function_call(self, function_name, function_args):
+        self.executed.append(function_name)
+        return {"success": True, "data": function_name}
+
+
+def _tool_response(*names):
+    return AIResponse(
+        content="", model="test-model", provider="test",
+        tool_calls=[{
+            "id": f"call_{i}", "type": "function",
+            "function": {"name": name, "arguments": json.dumps({})}
+        } for i, name in enumerate(names)]
+    )
 
 
 class TestAIClient:
@@ -85,6 +114,117 @@ class TestAIClient:
         
         assert response is None
     
+    @pytest.mark.asyncio
+    async def test_tool_loop_chains_rounds(self):
+        """测试多轮工具调用在同一个消息列表上追加"""
+        adapter = ScriptedAdapter([
+            _tool_response("get_stores"),
+            _tool_response("search_therapists"),
+            AIResponse(content="您好，本店有马老师和李老师", model="test-model", provider="test"),
+        ])
+        request = AIRequest(messages=[AIMessage(role=MessageRole.USER, content="有哪些技师")],
+                            tools=[{"type": "function", "function": {"name": "get_stores"}}])
+        
+        response = await self.client._run_tool_loop(adapter, request)
+        
+        assert response.content.startswith("您好")
+        assert adapter.executed == ["get_stores", "search_therapists"]
+        assert [tc["function"]["name"] for tc in response.tool_calls] == ["get_stores", "search_therapists"]
+        assert len(response.round_timings) == 3
+        assert response.round_timings[0]["tools"] == ["get_stores"]
+        assert all(r.messages is request.messages for r in adapter.requests)
+        assert len(request.messages) == 5
+    
+    @pytest.mark.asyncio
+    async def test_tool_loop_stops_at_max_rounds(self):
+        """测试达到最大轮数后最终请求不再携带工具"""
+        self.client.config.max_tool_rounds = 1
+        adapter = ScriptedAdapter([
+            _tool_response("get_stores"),
+            AIResponse(content="请问您想预约哪家门店？", model="test-model", provider="test"),
+        ])
+        request = AIRequest(messages=[AIMessage(role=MessageRole.USER, content="预约")],
+                            tools=[{"type": "function", "function": {"name": "get_stores"}}])
+        
+        response = await self.client._run_tool_loop(adapter, request)
+        
+        assert response.content == "请问您想预约哪家门店？"
+        assert adapter.requests[0].tools is not None
+        assert adapter.requests[1].tools is None
+    
+    @pytest.mark.asyncio
+    async def test_side_effect_round_reported_before_execution(self):
+        """测试执行预约等有副作用的工具前先回调，只读工具不回调"""
+        adapter = ScriptedAdapter([
+            _tool_response("get_stores"),
+            _tool_response("search_therapists", "create_smart_appointment"),
+            AIResponse(content="已为您预约", model="test-model", provider="test"),
+        ])
+        request = AIRequest(messages=[AIMessage(role=MessageRole.USER, content="预约明天下午")],
+                            tools=[{"type": "function", "function": {"name": "get_stores"}}])
+        reported = []
+
+        def on_side_effect(tools):
+            reported.append((tools, list(adapter.executed)))
+
+        await self.client._run_tool_loop(adapter, request, on_side_effect=on_side_effect)
+        assert reported == [(["create_smart_appointment"], ["get_stores"])]
+
+    @staticmethod
+    def _failing_after_tools(tool_name):
+        """执行一轮工具调用后就失败的主提供商，以及记录请求内容的备用提供商"""
+        class FailingAfterTools(ScriptedAdapter):
+            def create_customer_service_prompt_with_history(self, message, history, context_info, history_summary=None):
+                return AIRequest(messages=[AIMessage(role=MessageRole.USER, content=message)],
+                                 tools=[{"type": "function", "function": {"name": tool_name}}])
+
+            async def chat_completion(self, request):
+                self.requests.append(len(request.messages))
+                if self.responses:
+                    return self.responses.pop(0)
+                raise RuntimeError("provider down")
+
+        class Fallback(ScriptedAdapter):
+            async def chat_completion(self, request):
+                self.requests.append(([m.content for m in request.messages], request.tools))
+                return AIResponse(content="好的", model="test-model", provider="test")
+
+        return FailingAfterTools([_tool_response(tool_name)]), Fallback([])
+
+    @pytest.mark.asyncio
+    async def test_fallback_starts_from_original_messages(self):
+        """测试只执行过只读工具时，备用提供商从原始对话开始，不重放已追加的工具调用和结果"""
+        primary, fallback = self._failing_after_tools("get_stores")
+        self.client.adapters = {AIProvider.OPENAI: primary, AIProvider.DEEPSEEK: fallback}
+        self.client.hedge_policy.enabled = False
+
+        response = await self.client.generate_customer_service_reply(
+            "有哪些门店", preferred_provider=AIProvider.OPENAI)
+
+        assert response.content == "好的"
+        assert primary.executed == ["get_stores"]
+        assert primary.requests == [1, 3]
+        assert fallback.requests == [(["有哪些门店"], [{"type": "function", "function": {"name": "get_stores"}}])]
+
+    @pytest.mark.asyncio
+    async def test_fallback_sees_side_effect_results(self):
+        """测试预约已执行后主提供商失败，备用提供商看到预约结果且不能再次调用工具"""
+        primary, fallback = self._failing_after_tools("create_smart_appointment")
+        self.client.adapters = {AIProvider.OPENAI: primary, AIProvider.DEEPSEEK: fallback}
+        self.client.hedge_policy.enabled = False
+        reported = []
+
+        response = await self.client.generate_customer_service_reply(
+            "帮我约明天下午三点", preferred_provider=AIProvider.OPENAI, on_side_effect=reported.append)
+
+        assert response.content == "好的"
+        assert primary.executed == ["create_smart_appointment"]
+        assert reported == [["create_smart_appointment"]]
+        (contents, tools), = fallback.requests
+        assert len(contents) == 3
+        assert "create_smart_appointment 执行结果" in contents[-1]
+        assert tools is None
+
     def test_get_status(self):
         """测试获取状态"""
         status = self.client.get_status()
@@ -93,6 +233,8 @@ class TestAIClient:
         assert "total_providers" in status
         assert "config_loaded" in status
         assert isinstance(status["available_providers"], list)
+        assert "hit_rate" in status["database_cache"]
+        assert "compression_ratio" in status["history_compaction"]
 
 
 def run_quick_test():
@@ -0,0 +1,203 @@
+"""
+异步数据库门面测试
+"""
+
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+os.environ.setdefault("DIANPING_DB_PATH", ":memory:")
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'dianping-scraper', 'backend'))
+from database import DatabaseManager  # noqa: E402
+from async_database import AsyncDatabase  # noqa: E402
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(DatabaseManager, "_instance", None)
+    manager = DatabaseManager(str(tmp_path / "history.db"))
+    yield manager
+    manager.close()
+
+
+def _memory(count, chat_id="chat_1"):
+    return [{
+        "chatId": chat_id,
+        "contactName": "张先生",
+        "role": "user" if i % 2 == 0 else "assistant",
+        "content": f"第{i}条消息",
+        "timestamp": f"2025-06-18T10:{i:02d}:00.000Z",
+    } for i in range(count)]
+
+
+class TestAsyncDatabase:
+    """测试写线程成组提交与读连接池"""
+
+    @pytest.mark.asyncio
+    async def test_write_and_read(self, manager):
+        db = AsyncDatabase(manager)
+        assert len(await db.add_messages_bulk(_memory(3))) == 3
+        assert await db.add_messages_bulk(_memory(3)) == []
+        assert await db.add_message(_memory(4)[3]) is True
+
+        history = await db.get_chat_history("chat_1")
+        assert [m["content"] for m in history] == [f"第{i}条消息" for i in range(4)]
+        assert await db.is_message_processed(manager._generate_message_id(_memory(1)[0]))
+        await db.close()
+
+    @pytest.mark.asyncio
+    async def test_concurrent_writes_group_committed(self, manager):
+        """测试并发写入合并到较少的提交中，且每个请求得到自己的结果"""
+        db = AsyncDatabase(manager, flush_messages=1000)
+        # 写线程忙于第一个请求时，后续请求在队列中累积
+        with manager._write_lock:
+            futures = [asyncio.ensure_future(db.add_messages_bulk(_memory(2, chat_id=f"chat_{i}")))
+                       for i in range(20)]
+            await asyncio.sleep(0.05)
+        results = await asyncio.gather(*futures)
+        assert all(len(r) == 2 for r in results)
+
+        stats = db.get_stats()
+        assert stats["write_jobs"] == 20
+        assert stats["commits"] < 20
+        count = manager.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        assert count == 40
+        await db.close()
+
+    @pytest.mark.asyncio
+    async def test_reads_do_not_block_event_loop(self, manager):
+        """测试读操作在线程中执行，不占用事件循环线程"""
+        db = AsyncDatabase(manager)
+        loop_thread = threading.get_ident()
+        threads = []
+        original = manager.get_chat_history
+
+        def traced(chat_id, limit=50):
+            threads.append(threading.get_ident())
+            return original(chat_id, limit)
+
+        manager.get_chat_history = traced
+        await db.get_chat_history("chat_1")
+        assert threads and threads[0] != loop_thread
+        await db.close()
+
+    @pytest.mark.asyncio
+    async def test_close_flushes_queue(self, manager):
+        db = AsyncDatabase(manager)
+        pending = asyncio.ensure_future(db.add_messages_bulk(_memory(5)))
+        await asyncio.sleep(0)
+        await db.close()
+        assert len(await pending) == 5
+        with pytest.raises(RuntimeError):
+            await db.add_messages_bulk(_memory(1))
+
+    @pytest.mark.asyncio
+    async def test_sync_api_still_available(self, manager):
+        db = AsyncDatabase(manager)
+        await db.add_messages_bulk(_memory(2))
+        assert manager.add_messages_bulk(_memory(3)) == [_memory(3)[2]]
+        assert len(manager.get_chat_history("chat_1")) == 3
+        await db.close()
+
+
+class TestWriteFailures:
+    """测试写入失败时写线程继续运行，且只影响失败的请求"""
+
+    @staticmethod
+    def _out_of_range_epoch(manager, monkeypatch, chat_id):
+        """让该聊天的消息带着超出SQLite INTEGER范围的时间戳到达SQLite"""
+        original = manager._prepare_row
+
+        def prepare(message, message_id):
+            row = original(message, message_id)
+            return row[:-1] + (10 ** 25,) if message.get("chatId") == chat_id else row
+
+        monkeypatch.setattr(manager, "_prepare_row", prepare)
+
+    @pytest.mark.asyncio
+    async def test_bad_job_isolated_in_group_commit(self, manager, monkeypatch):
+        self._out_of_range_epoch(manager, monkeypatch, "chat_bad")
+        db = AsyncDatabase(manager, flush_messages=1000)
+        with manager._write_lock:
+            futures = [asyncio.ensure_future(db.add_messages_bulk(_memory(2, chat_id=chat_id)))
+                       for chat_id in ("chat_a", "chat_bad", "chat_b")]
+            await asyncio.sleep(0.05)
+        results = await asyncio.wait_for(asyncio.gather(*futures, return_exceptions=True), timeout=2)
+
+        assert len(results[0]) == 2 and len(results[2]) == 2
+        assert isinstance(results[1], OverflowError)
+        assert db.get_stats()["commits"] == 1 and db.get_stats()["failed_jobs"] == 1
+        chats = {row[0] for row in manager.conn.execute("SELECT DISTINCT chat_id FROM messages")}
+        assert chats == {"chat_a", "chat_b"}
+        bad_id = manager._generate_message_id(_memory(1, chat_id="chat_bad")[0])
+        assert manager.is_message_processed(bad_id) is False
+        await db.close()
+
+    @pytest.mark.asyncio
+    async def test_writer_survives_failure(self, manager, monkeypatch):
+        self._out_of_range_epoch(manager, monkeypatch, "chat_bad")
+        db = AsyncDatabase(manager)
+        with pytest.raises(OverflowError):
+            await asyncio.wait_for(db.add_messages_bulk(_memory(1, chat_id="chat_bad")), timeout=2)
+        assert db._writer.is_alive()
+        assert not manager.conn.in_transaction
+        assert len(await asyncio.wait_for(db.add_messages_bulk(_memory(2)), timeout=2)) == 2
+        assert len(await asyncio.wait_for(db.add_messages_bulk(_memory(3)), timeout=2)) == 1
+        await db.close()
+
+    @pytest.mark.asyncio
+    async def test_out_of_range_timestamp_stored_with_received_time(self, manager):
+        db = AsyncDatabase(manager)
+        message = {**_memory(1)[0], "timestamp": 1e25}
+        assert len(await asyncio.wait_for(db.add_messages_bulk([message]), timeout=2)) == 1
+        assert db.get_stats()["failed_jobs"] == 0
+        await db.close()
+
+    @pytest.mark.asyncio
+    async def test_unexpected_commit_error_fails_batch(self, manager, monkeypatch):
+        db = AsyncDatabase(manager)
+        original = db._commit_batch
+
+        def broken(batch):
+            raise ValueError("boom")
+
+        monkeypatch.setattr(db, "_commit_batch", broken)
+        with pytest.raises(ValueError):
+            await asyncio.wait_for(db.add_messages_bulk(_memory(1)), timeout=2)
+        monkeypatch.setattr(db, "_commit_batch", original)
+        assert db._writer.is_alive()
+        assert len(await asyncio.wait_for(db.add_messages_bulk(_memory(1)), timeout=2)) == 1
+        await db.close()
+
+class TestGroupCommit:
+    """测试按消息条数和等待时间提交"""
+
+    @pytest.mark.asyncio
+    async def test_flush_on_message_count(self, manager):
+        """测试累计到 flush_messages 条消息立即提交，不等待超时"""
+        db = AsyncDatabase(manager, flush_messages=4, flush_interval_ms=10000)
+        results = await asyncio.wait_for(
+            asyncio.gather(*(db.add_messages_bulk(_memory(2, chat_id=f"chat_{i}")) for i in range(4))),
+            timeout=2
+        )
+        assert all(len(r) == 2 for r in results)
+        assert db.get_stats()["commits"] == 2
+        await db.close()
+
+    @pytest.mark.asyncio
+    async def test_flush_on_interval(self, manager):
+        """测试写入稀疏时等待 flush_interval_ms 后提交"""
+        db = AsyncDatabase(manager, flush_messages=1000, flush_interval_ms=30)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        first = asyncio.ensure_future(db.add_messages_bulk(_memory(1, chat_id="chat_a")))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(db.add_messages_bulk(_memory(1, chat_id="chat_b")))
+        await asyncio.gather(first, second)
+        assert 0.02 <= loop.time() - start < 1
+        assert db.get_stats()["commits"] == 1
+        assert db.get_stats()["write_messages"] == 2
+        await db.close()
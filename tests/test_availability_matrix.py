@@ -0,0 +1,91 @@
+"""
+批量排班查询测试
+"""
+
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from aiclient.database_service import DatabaseAPIService, BUSINESS_SLOTS
+
+
+STORES = [{"id": 3, "name": "名医堂·颈肩腰腿特色调理（静安寺店）"}]
+
+
+class TestAvailabilityMatrix:
+    """测试门店 × 技师 × 时段可预约矩阵"""
+
+    @pytest.mark.asyncio
+    async def test_bulk_endpoint(self):
+        """测试优先使用门店批量接口，一次请求得到多天排班"""
+        service = DatabaseAPIService()
+        bulk = {
+            "store": STORES[0],
+            "therapists": [
+                {"id": 1, "name": "马老师", "appointments": [
+                    {"date": "2025-06-20", "start_time": "14:00:00"},
+                    {"date": "2025-06-21", "start_time": "09:00"},
+                ]},
+                {"id": 2, "name": "李老师", "appointments": []},
+            ]
+        }
+
+        async def make_request(endpoint, params=None):
+            return STORES if endpoint == "/client/stores" else bulk
+
+        with patch.object(service, "_make_request", side_effect=make_request) as mock_request, \
+                patch.object(service, "get_therapist_schedule") as mock_schedule:
+            matrix = await service.get_availability_matrix("2025-06-20", "2025-06-21", store_id=3)
+
+        assert matrix["source"] == "bulk"
+        assert matrix["dates"] == ["2025-06-20", "2025-06-21"]
+        ma = matrix["therapists"][0]
+        assert "14:00" not in ma["available"]["2025-06-20"]
+        assert "09:00" not in ma["available"]["2025-06-21"]
+        assert matrix["therapists"][1]["available"]["2025-06-20"] == BUSINESS_SLOTS
+        assert mock_request.call_args_list[-1].args[0].endswith("/therapists-schedule")
+        mock_schedule.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_per_day_fallback_is_bounded(self):
+        """测试批量接口不可用时并发查询且不超过并发上限"""
+        service = DatabaseAPIService()
+        running = 0
+        peak = 0
+
+        async def schedule(therapist_id, date):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return {"therapist_id": therapist_id, "date": date, "available_times": ["10:00"]}
+
+        therapists = [{"id": i, "name": f"技师{i}"} for i in range(6)]
+        with patch.object(service, "get_stores", AsyncMock(return_value=STORES)), \
+                patch.object(service, "_make_request", AsyncMock(return_value=[])), \
+                patch.object(service, "search_therapists", AsyncMock(return_value=therapists)), \
+                patch.object(service, "get_therapist_schedule", side_effect=schedule):
+            matrix = await service.get_availability_matrix("2025-06-20", "2025-06-22", store_id=3,
+                                                           max_concurrency=4)
+
+        assert matrix["source"] == "per_day"
+        assert len(matrix["therapists"]) == 6
+        assert all(len(t["available"]) == 3 for t in matrix["therapists"])
+        assert peak == 4
+
+    @pytest.mark.asyncio
+    async def test_query_available_appointments_uses_matrix(self):
+        """测试按门店查询可用时段的返回格式保持不变"""
+        service = DatabaseAPIService()
+        matrix = {"dates": ["2025-06-20"], "therapists": [
+            {"id": 1, "name": "马老师", "available": {"2025-06-20": ["10:00", "11:00"]}}
+        ]}
+        with patch.object(service, "get_availability_matrix", AsyncMock(return_value=matrix)):
+            slots = await service.query_available_appointments("2025-06-20", store_id=3)
+
+        assert slots == [
+            {"therapist_id": 1, "therapist_name": "马老师", "time": "10:00", "date": "2025-06-20"},
+            {"therapist_id": 1, "therapist_name": "马老师", "time": "11:00", "date": "2025-06-20"},
+        ]
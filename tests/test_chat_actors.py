@@ -0,0 +1,108 @@
+"""
+按聊天划分的消息处理队列测试
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'dianping-scraper', 'backend'))
+from chat_actors import ChatActorPool  # noqa: E402
+
+
+def _job(log, name, delay=0.0, result=None):
+    async def job():
+        log.append(("start", name))
+        await asyncio.sleep(delay)
+        log.append(("end", name))
+        return result
+    return job
+
+
+class TestChatActorPool:
+    """测试聊天队列的顺序与并发"""
+
+    @pytest.mark.asyncio
+    async def test_order_preserved_within_chat(self):
+        pool = ChatActorPool()
+        log = []
+        futures = [pool.submit("chat_a", _job(log, i, delay=0.01 * (3 - i), result=i)) for i in range(3)]
+        assert await asyncio.gather(*futures) == [0, 1, 2]
+        assert log == [("start", 0), ("end", 0), ("start", 1), ("end", 1), ("start", 2), ("end", 2)]
+        await pool.close()
+
+    @pytest.mark.asyncio
+    async def test_chats_run_in_parallel(self):
+        """测试一个聊天的慢任务不阻塞其他聊天"""
+        pool = ChatActorPool()
+        log = []
+        slow = pool.submit("chat_a", _job(log, "slow", delay=0.2))
+        fast = pool.submit("chat_b", _job(log, "fast"))
+        await asyncio.wait_for(fast, timeout=0.1)
+        assert not slow.done()
+        await slow
+        assert pool.get_stats()["processed"] == 2
+        await pool.close()
+
+    @pytest.mark.asyncio
+    async def test_submit_returns_immediately(self):
+        pool = ChatActorPool()
+        future = pool.submit("chat_a", _job([], "slow", delay=0.1))
+        assert not future.done()
+        assert pool.get_stats()["active_chats"] == 1
+        await future
+        await pool.close()
+
+    @pytest.mark.asyncio
+    async def test_failure_does_not_stop_chat(self):
+        pool = ChatActorPool()
+
+        async def broken():
+            raise RuntimeError("boom")
+
+        failed = pool.submit("chat_a", broken)
+        ok = pool.submit("chat_a", _job([], "next", result="ok"))
+        with pytest.raises(RuntimeError):
+            await failed
+        assert await ok == "ok"
+        assert pool.get_stats()["failed"] == 1
+        await pool.close()
+
+    @pytest.mark.asyncio
+    async def test_idle_worker_reclaimed(self):
+        pool = ChatActorPool(idle_timeout=0.02)
+        await pool.submit("chat_a", _job([], "one"))
+        await asyncio.sleep(0.06)
+        assert pool.get_stats()["active_chats"] == 0
+        # 回收后再次投递会重新创建工作协程
+        assert await pool.submit("chat_a", _job([], "two", result=2)) == 2
+        await pool.close()
+
+
+class TestAISlot:
+    """测试全局AI调用并发上限"""
+
+    @pytest.mark.asyncio
+    async def test_ai_calls_bounded_across_chats(self):
+        pool = ChatActorPool(max_concurrent_ai=2)
+        in_flight = []
+        peak = []
+
+        def ai_job():
+            async def job():
+                async with pool.ai_slot():
+                    in_flight.append(1)
+                    peak.append(len(in_flight))
+                    await asyncio.sleep(0.02)
+                    in_flight.pop()
+            return job
+
+        await asyncio.gather(*(pool.submit(f"chat_{i}", ai_job()) for i in range(6)))
+        assert max(peak) == 2
+        stats = pool.get_stats()
+        assert stats["ai_calls"] == 6
+        assert stats["ai_peak"] == 2
+        assert stats["ai_in_flight"] == 0
+        await pool.close()
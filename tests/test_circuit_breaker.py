@@ -0,0 +1,244 @@
+"""
+AI提供商熔断器测试
+"""
+
+import pytest
+from aiohttp import web
+
+from aiclient.adapters.openai_adapter import OpenAIAdapter
+from aiclient.circuit_breaker import CircuitBreaker, CircuitOpenError, CircuitState
+from aiclient.client import AIClient
+from aiclient.config import ModelConfig, AIProvider
+from aiclient.models import AIRequest, AIMessage, MessageRole
+
+
+class FakeClock:
+    """可手动推进的时钟"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _breaker(clock, **kwargs):
+    settings = dict(min_calls=4, window=10, open_seconds=30.0, slow_call_ms=1000.0)
+    settings.update(kwargs)
+    return CircuitBreaker(name="test", clock=clock, **settings)
+
+
+class TestCircuitBreaker:
+    """测试熔断器状态转换"""
+
+    def test_opens_on_failure_rate(self):
+        """测试失败率达到阈值后熔断并拒绝请求"""
+        clock = FakeClock()
+        breaker = _breaker(clock)
+        for success in (True, False, True, False):
+            assert breaker.allow_request()
+            (breaker.record_success if success else breaker.record_failure)(100)
+
+        assert breaker.state == CircuitState.OPEN
+        assert not breaker.allow_request()
+        assert breaker.health_score() == 0.0
+        assert breaker.get_stats()["rejected_count"] == 1
+
+    def test_not_opened_below_min_calls(self):
+        """测试请求数不足时不熔断"""
+        breaker = _breaker(FakeClock())
+        for _ in range(3):
+            breaker.record_failure(100)
+        assert breaker.state == CircuitState.CLOSED
+
+    def test_opens_on_slow_calls(self):
+        """测试慢请求比例达到阈值后熔断"""
+        breaker = _breaker(FakeClock(), slow_call_rate_threshold=0.75)
+        for latency in (1500, 1500, 1500, 200):
+            breaker.record_success(latency)
+        assert breaker.state == CircuitState.OPEN
+
+    def test_half_open_probe_closes(self):
+        """测试冷却期后放行一个探测请求，成功则恢复"""
+        clock = FakeClock()
+        breaker = _breaker(clock)
+        for _ in range(4):
+            breaker.record_failure(100)
+
+        clock.now = 31.0
+        assert breaker.allow_request()
+        assert breaker.state == CircuitState.HALF_OPEN
+        assert not breaker.allow_request()  # 探测请求进行中，其余请求仍被拒绝
+
+        breaker.record_success(100)
+        assert breaker.state == CircuitState.CLOSED
+        assert breaker.health_score() == 1.0
+
+    def test_half_open_probe_failure_reopens(self):
+        """测试探测请求失败后重新熔断"""
+        clock = FakeClock()
+        breaker = _breaker(clock)
+        for _ in range(4):
+            breaker.record_failure(100)
+
+        clock.now = 31.0
+        assert breaker.allow_request()
+        breaker.record_failure(100)
+        assert breaker.state == CircuitState.OPEN
+        assert breaker.open_count == 2
+        assert not breaker.allow_request()
+
+    def test_released_probe_can_retry(self):
+        """测试被取消的探测请求归还名额"""
+        clock = FakeClock()
+        breaker = _breaker(clock)
+        for _ in range(4):
+            breaker.record_failure(100)
+
+        clock.now = 31.0
+        assert breaker.allow_request()
+        breaker.release()
+        assert breaker.allow_request()
+
+    def test_health_score_penalizes_failures_and_latency(self):
+        """测试健康分随失败率和超阈值延迟下降"""
+        breaker = _breaker(FakeClock(), min_calls=100)
+        breaker.record_success(2000)
+        breaker.record_failure(100)
+        assert breaker.health_score() == 0.25
+
+
+async def _start_failing_server(status=500):
+    """启动始终返回错误状态码（默认500）的本地模拟LLM服务器"""
+    hits = []
+
+    async def chat_completions(request):
+        hits.append(1)
+        return web.Response(status=status, text="upstream error")
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1", hits
+
+
+class TestAdapterCircuitBreaker:
+    """测试适配器请求经过熔断器"""
+
+    @pytest.mark.asyncio
+    async def test_open_breaker_skips_requests(self):
+        """测试熔断后请求直接失败，不再访问上游也不再重试退避"""
+        runner, base_url, hits = await _start_failing_server()
+        adapter = OpenAIAdapter(ModelConfig(
+            provider=AIProvider.OPENAI,
+            model_name="stub-model",
+            api_key="test-key",
+            base_url=base_url,
+            max_retries=1,
+            breaker_min_calls=2
+        ))
+        request = AIRequest(messages=[AIMessage(role=MessageRole.USER, content="你好")])
+
+        try:
+            for _ in range(2):
+                with pytest.raises(Exception, match="HTTP错误 500"):
+                    await adapter.chat_completion(request)
+            assert adapter.breaker.state == CircuitState.OPEN
+
+            with pytest.raises(CircuitOpenError):
+                await adapter.chat_completion(request)
+            with pytest.raises(CircuitOpenError):
+                await adapter.stream_chat_completion(request)
+        finally:
+            await adapter.close()
+            await runner.cleanup()
+
+        assert len(hits) == 2
+
+    @pytest.mark.asyncio
+    async def test_retries_count_as_one_failure(self):
+        """测试一次请求的多次重试只记录一次熔断失败"""
+        runner, base_url, hits = await _start_failing_server()
+        adapter = _adapter(base_url, max_retries=2)
+        try:
+            with pytest.raises(Exception, match="HTTP错误 500"):
+                await adapter.chat_completion(_request())
+        finally:
+            await adapter.close()
+            await runner.cleanup()
+
+        assert len(hits) == 2
+        assert [ok for ok, _ in adapter.breaker.outcomes] == [False]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("stream", [False, True])
+    async def test_client_error_not_retried_or_counted(self, stream):
+        """测试4xx（如请求参数错误）不重试，也不计入熔断"""
+        runner, base_url, hits = await _start_failing_server(status=400)
+        adapter = _adapter(base_url, max_retries=3)
+        try:
+            for _ in range(3):
+                with pytest.raises(Exception, match="HTTP错误 400"):
+                    if stream:
+                        await adapter.stream_chat_completion(_request())
+                    else:
+                        await adapter.chat_completion(_request())
+        finally:
+            await adapter.close()
+            await runner.cleanup()
+
+        assert len(hits) == 3
+        assert len(adapter.breaker.outcomes) == 0
+        assert adapter.breaker.state == CircuitState.CLOSED
+
+
+def _adapter(base_url, **kwargs):
+    return OpenAIAdapter(ModelConfig(
+        provider=AIProvider.OPENAI,
+        model_name="stub-model",
+        api_key="test-key",
+        base_url=base_url,
+        breaker_min_calls=2,
+        **kwargs
+    ))
+
+
+def _request():
+    return AIRequest(messages=[AIMessage(role=MessageRole.USER, content="你好")])
+
+
+class StubAdapter:
+    """只带熔断器的模拟适配器"""
+
+    def __init__(self, clock):
+        self.breaker = _breaker(clock)
+
+
+class TestClientProviderSelection:
+    """测试客户端按健康分选择提供商"""
+
+    def test_select_skips_open_provider(self):
+        """测试熔断的提供商排到最后，偏好的提供商熔断时也改用其他提供商"""
+        clock = FakeClock()
+        client = AIClient()
+        client.adapters = {
+            AIProvider.OPENAI: StubAdapter(clock),
+            AIProvider.ZHIPU: StubAdapter(clock),
+            AIProvider.DEEPSEEK: StubAdapter(clock),
+        }
+        assert client._select_provider() == AIProvider.OPENAI
+
+        for _ in range(4):
+            client.adapters[AIProvider.OPENAI].breaker.record_failure(100)
+
+        assert client._select_provider() == AIProvider.ZHIPU
+        assert client._select_provider(AIProvider.OPENAI) == AIProvider.ZHIPU
+        assert client._fallback_order(AIProvider.ZHIPU) == [AIProvider.DEEPSEEK]
+
+        status = client.get_status()["circuit_breakers"]
+        assert status["openai"]["state"] == "open"
+        assert status["zhipu"]["state"] == "closed"
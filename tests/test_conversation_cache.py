@@ -0,0 +1,137 @@
+"""
+对话缓存测试
+"""
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'dianping-scraper', 'backend'))
+from conversation_cache import ConversationCache, estimate_message_bytes  # noqa: E402
+
+BASE_MS = 1750228200000
+
+
+def _loaded(count, start=0):
+    """从数据库加载的格式：timestamp 为UTC毫秒"""
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"第{i}条消息",
+             "timestamp": BASE_MS + i * 1000} for i in range(start, start + count)]
+
+
+def _raw(i, chat_id="chat_1"):
+    """扩展发送的原始消息"""
+    return {"chatId": chat_id, "role": "user", "content": f"第{i}条消息", "timestamp": BASE_MS + i * 1000}
+
+
+class TestConversationCache:
+    """测试读取、写穿和淘汰"""
+
+    def test_miss_then_hit(self):
+        cache = ConversationCache()
+        assert cache.get("chat_1") is None
+        assert cache.put("chat_1", _loaded(3), complete=True)
+        assert [m["content"] for m in cache.get("chat_1")] == ["第0条消息", "第1条消息", "第2条消息"]
+        stats = cache.get_stats()
+        assert stats["hits"] == 1 and stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+
+    def test_write_through_keeps_recent_window(self):
+        cache = ConversationCache(max_messages=5)
+        cache.get("chat_1")
+        cache.put("chat_1", _loaded(5))
+        cache.append("chat_1", [_raw(5), _raw(6)])
+        assert [m["content"] for m in cache.get("chat_1")] == [f"第{i}条消息" for i in range(2, 7)]
+        assert cache.get("chat_1")[-1]["timestamp"] == BASE_MS + 6000
+
+    def test_late_message_inserted_in_time_order(self):
+        cache = ConversationCache()
+        cache.put("chat_1", [m for m in _loaded(4) if m["content"] != "第2条消息"], complete=True)
+        cache.append("chat_1", [_raw(2)])
+        assert [m["content"] for m in cache.get("chat_1")] == [f"第{i}条消息" for i in range(4)]
+
+    def test_message_older_than_full_window_skipped(self):
+        cache = ConversationCache(max_messages=3)
+        cache.put("chat_1", _loaded(3, start=10))
+        cache.append("chat_1", [_raw(1)])
+        assert [m["content"] for m in cache.get("chat_1")] == ["第10条消息", "第11条消息", "第12条消息"]
+
+    def test_append_to_uncached_chat_ignored(self):
+        cache = ConversationCache()
+        cache.append("chat_1", [_raw(0)])
+        assert cache.get_stats()["chats"] == 0
+
+    def test_write_during_load_not_cached(self):
+        """测试从数据库加载期间有新写入时不缓存可能过期的结果"""
+        cache = ConversationCache()
+        assert cache.get("chat_1") is None
+        cache.append("chat_1", [_raw(3)])  # 写入发生在读取数据库之后、put 之前
+        assert cache.put("chat_1", _loaded(3)) is False
+        assert cache.get("chat_1") is None
+        assert cache.get_stats()["load_races"] == 1
+
+    def test_cancelled_load_not_leaked(self):
+        """测试加载被取消后不再影响之后无关的加载"""
+        cache = ConversationCache()
+        assert cache.get("chat_1") is None
+        cache.cancel_load("chat_1")  # 例如回复被新消息取消
+        assert cache.get_stats()["loading"] == 0
+
+        cache.append("chat_1", [_raw(5)])  # 与之后的加载无关的写入
+        assert cache.get("chat_1") is None
+        assert cache.put("chat_1", _loaded(6)) is True
+        assert cache.get_stats()["load_races"] == 0
+
+    def test_concurrent_loads_tracked_separately(self):
+        cache = ConversationCache()
+        cache.get("chat_1")
+        cache.get("chat_1")
+        cache.append("chat_1", [_raw(3)])
+        assert cache.put("chat_1", _loaded(3)) is False
+        assert cache.put("chat_1", _loaded(3)) is False  # 第二个加载同样可能缺少这条消息
+        assert cache.get_stats()["loading"] == 0
+
+    def test_invalidate(self):
+        cache = ConversationCache()
+        cache.put("chat_1", _loaded(2))
+        cache.invalidate("chat_1")
+        assert cache.get("chat_1") is None
+        cache.invalidate("chat_1")  # 加载期间写入失败
+        assert cache.put("chat_1", _loaded(2)) is False
+        stats = cache.get_stats()
+        assert stats["invalidated"] == 2 and stats["bytes"] == 0
+
+    def test_lru_eviction_by_bytes(self):
+        size = sum(estimate_message_bytes(m) for m in _loaded(3))
+        cache = ConversationCache(max_bytes=size * 2)
+        for chat_id in ("a", "b"):
+            cache.get(chat_id)
+            cache.put(chat_id, _loaded(3))
+        cache.get("a")  # a 变为最近使用
+        cache.get("c")
+        cache.put("c", _loaded(3))
+
+        stats = cache.get_stats()
+        assert stats["chats"] == 2
+        assert stats["evicted_lru"] == 1
+        assert stats["bytes"] <= stats["max_bytes"]
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+
+    def test_idle_eviction(self):
+        cache = ConversationCache(idle_seconds=0.01)
+        cache.put("chat_1", _loaded(2))
+        time.sleep(0.02)
+        assert cache.evict_idle() == 1
+        stats = cache.get_stats()
+        assert stats["chats"] == 0 and stats["bytes"] == 0
+
+    def test_empty_load_not_cached(self):
+        cache = ConversationCache()
+        cache.get("chat_1")
+        assert cache.put("chat_1", []) is False
+
+    def test_returned_list_is_copy(self):
+        cache = ConversationCache()
+        cache.put("chat_1", _loaded(2))
+        cache.get("chat_1").append({"content": "x"})
+        assert len(cache.get("chat_1")) == 2
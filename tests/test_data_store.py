@@ -0,0 +1,138 @@
+"""
+上报数据存储测试
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'dianping-scraper', 'backend'))
+import data_store  # noqa: E402
+from data_store import DataStore  # noqa: E402
+
+BASE_MS = 1750228200000
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可控的接收时间（UTC毫秒）"""
+    now = [BASE_MS]
+    monkeypatch.setattr(data_store, "now_ms", lambda: now[0])
+    return now
+
+
+def _fill(store, clock, count, start=0, step=1000):
+    for i in range(start, start + count):
+        clock[0] = BASE_MS + i * step
+        store.add(f"dianping_{i}", "dianping_data_object", {"index": i, "text": "数据" * 10})
+
+
+class TestBounds:
+    """测试条数、字节数和保留时间限制"""
+
+    def test_max_entries(self, clock):
+        store = DataStore(max_entries=3)
+        _fill(store, clock, 5)
+        assert [r["data_id"] for r in store.query()] == ["dianping_2", "dianping_3", "dianping_4"]
+        stats = store.get_stats()
+        assert stats["entries"] == 3 and stats["evicted_size"] == 2
+        assert store.get("dianping_0") is None
+
+    def test_max_bytes(self, clock):
+        store = DataStore(max_entries=100)
+        store.add("dianping_0", "dianping_data_object", {"index": 0, "text": "数据" * 10})
+        size = store.bytes
+        store = DataStore(max_entries=100, max_bytes=size * 2)
+        _fill(store, clock, 4)
+        stats = store.get_stats()
+        assert stats["entries"] == 2
+        assert stats["bytes"] <= stats["max_bytes"]
+
+    def test_ttl(self, clock):
+        store = DataStore(ttl_seconds=10)
+        _fill(store, clock, 3)
+        clock[0] = BASE_MS + 11500
+        assert store.evict_expired() == 2
+        assert [r["data_id"] for r in store.query()] == ["dianping_2"]
+
+    def test_replace_same_id(self, clock):
+        store = DataStore()
+        store.add("dianping_1", "dianping_data_object", {"v": 1})
+        clock[0] += 1000
+        store.add("dianping_1", "dianping_data_object", {"v": 2})
+        assert store.get("dianping_1")["content"] == {"v": 2}
+        assert store.get_stats()["entries"] == 1
+        assert store.bytes == len(data_store.serialization.dumpb(store.get("dianping_1")))
+
+
+class TestQuery:
+    """测试按ID和时间范围查询"""
+
+    def test_get_record(self, clock):
+        store = DataStore()
+        meta = store.add("dianping_list_1", "dianping_data_list", [{"a": 1}], "2025-06-18T14:30:00")
+        assert "content" not in meta
+        record = store.get("dianping_list_1")
+        assert record == {"data_id": "dianping_list_1", "type": "dianping_data_list",
+                          "timestamp": "2025-06-18T14:30:00", "received_ms": BASE_MS, "content": [{"a": 1}]}
+
+    def test_time_range_and_type(self, clock):
+        store = DataStore()
+        _fill(store, clock, 5)
+        store.add("list", "dianping_data_list", [])
+        since = "2025-06-18T06:30:01.000Z"
+        assert [r["data_id"] for r in store.query(since=since, until=BASE_MS + 3000)] == ["dianping_1", "dianping_2", "dianping_3"]
+        assert [r["data_id"] for r in store.query(entry_type="dianping_data_list")] == ["list"]
+
+    def test_limit_keeps_latest(self, clock):
+        store = DataStore()
+        _fill(store, clock, 5)
+        assert [r["data_id"] for r in store.query(limit=2)] == ["dianping_3", "dianping_4"]
+
+
+class TestSpill:
+    """测试淘汰数据写入磁盘分段"""
+
+    def test_spilled_entries_queryable(self, clock, tmp_path):
+        store = DataStore(max_entries=2, spill_dir=str(tmp_path))
+        _fill(store, clock, 5)
+        assert store.get("dianping_0")["content"]["index"] == 0
+        assert [r["data_id"] for r in store.query(since=BASE_MS + 1000)] == [f"dianping_{i}" for i in range(1, 5)]
+        assert [r["data_id"] for r in store.query(limit=3)] == ["dianping_2", "dianping_3", "dianping_4"]
+        assert [r["data_id"] for r in store.query(include_spilled=False)] == ["dianping_3", "dianping_4"]
+        assert store.get_stats()["spilled"] == 3
+
+    def test_segment_rotation_bounded(self, clock, tmp_path):
+        store = DataStore(max_entries=1, spill_dir=str(tmp_path), segment_bytes=1, max_segments=2)
+        _fill(store, clock, 6)
+        store.close()
+        assert sorted(os.listdir(tmp_path)) == ["data-000004.jsonl", "data-000005.jsonl"]
+        assert store.get("dianping_0") is None
+        assert store.get("dianping_4") is not None
+        stats = store.get_stats()
+        assert stats["spill_segments"] == 2 and stats["dropped_segments"] == 3
+
+    def test_replaced_entry_returns_latest_version(self, clock, tmp_path):
+        store = DataStore(max_entries=1, spill_dir=str(tmp_path))
+        store.add("a", "dianping_data_object", {"v": 1})
+        store.add("b", "dianping_data_object", {})
+        store.add("a", "dianping_data_object", {"v": 2})
+        assert store.get("a")["content"] == {"v": 2}
+        assert [r["content"] for r in store.query() if r["data_id"] == "a"] == [{"v": 2}]
+
+    def test_reload_segments_and_truncate_partial(self, clock, tmp_path):
+        store = DataStore(max_entries=1, spill_dir=str(tmp_path))
+        _fill(store, clock, 3)
+        store.close()
+        with open(tmp_path / "data-000001.jsonl", "ab") as f:
+            f.write(b'{"data_id": "broken"')
+
+        reopened = DataStore(max_entries=1, spill_dir=str(tmp_path))
+        assert reopened.get_stats()["spill_entries"] == 2
+        assert reopened.get("dianping_1")["content"]["index"] == 1
+        clock[0] += 1000
+        reopened.add("next", "dianping_data_object", {})
+        reopened.add("last", "dianping_data_object", {})
+        assert sorted(os.listdir(tmp_path)) == ["data-000001.jsonl", "data-000002.jsonl"]
+        assert reopened.get("next") is not None and reopened.get("broken") is None
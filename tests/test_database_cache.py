@@ -0,0 +1,183 @@
+"""
+数据库API读穿缓存测试
+"""
+
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from aiclient.database_service import AsyncTTLCache, DatabaseAPIService
+
+
+class TestAsyncTTLCache:
+    """测试TTL + LRU缓存"""
+
+    @pytest.mark.asyncio
+    async def test_hit_and_expiry(self):
+        """测试命中与过期"""
+        cache = AsyncTTLCache()
+        loader = AsyncMock(return_value=["store"])
+
+        assert await cache.get_or_load(("/client/stores", ()), 60, loader) == ["store"]
+        assert await cache.get_or_load(("/client/stores", ()), 60, loader) == ["store"]
+        assert loader.await_count == 1
+
+        with patch("aiclient.database_service.time.monotonic", return_value=10 ** 9):
+            await cache.get_or_load(("/client/stores", ()), 60, loader)
+        assert loader.await_count == 2
+        assert cache.get_stats()["hits"] == 1
+        assert cache.get_stats()["misses"] == 2
+
+    @pytest.mark.asyncio
+    async def test_lru_eviction(self):
+        """测试超出容量时淘汰最久未使用的条目"""
+        cache = AsyncTTLCache(max_entries=2)
+        for key in ("a", "b"):
+            await cache.get_or_load((key, ()), 60, AsyncMock(return_value=key))
+        await cache.get_or_load(("a", ()), 60, AsyncMock())  # 访问a，使b成为最久未使用
+        await cache.get_or_load(("c", ()), 60, AsyncMock(return_value="c"))
+
+        loader = AsyncMock(return_value="b")
+        await cache.get_or_load(("b", ()), 60, loader)
+        assert loader.await_count == 1
+        assert cache.get_stats()["evictions"] == 2
+
+    @pytest.mark.asyncio
+    async def test_single_flight(self):
+        """测试并发的相同请求只加载一次"""
+        cache = AsyncTTLCache()
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return [calls]
+
+        results = await asyncio.gather(*(cache.get_or_load(("k", ()), 60, loader) for _ in range(5)))
+        assert calls == 1
+        assert all(r == [1] for r in results)
+        assert cache.get_stats()["coalesced"] == 4
+
+    @pytest.mark.asyncio
+    async def test_errors_not_cached(self):
+        """测试加载失败时不写入缓存"""
+        cache = AsyncTTLCache()
+        with pytest.raises(RuntimeError):
+            await cache.get_or_load(("k", ()), 60, AsyncMock(side_effect=RuntimeError("down")))
+        assert await cache.get_or_load(("k", ()), 60, AsyncMock(return_value="ok")) == "ok"
+
+
+    @pytest.mark.asyncio
+    async def test_leader_cancelled_followers_reload(self):
+        """测试发起加载的任务被取消时，合并等待的调用方重新加载而不是被取消"""
+        cache = AsyncTTLCache()
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return [calls]
+
+        leader = asyncio.ensure_future(cache.get_or_load(("k", ()), 60, loader))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(cache.get_or_load(("k", ()), 60, loader)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        results = await asyncio.gather(*followers)
+        assert leader.cancelled()
+        assert calls == 2
+        assert all(r == [2] for r in results)
+        assert cache.get_stats()["retries"] == 3
+
+    @pytest.mark.asyncio
+    async def test_empty_results_not_cached(self):
+        cache = AsyncTTLCache()
+        loader = AsyncMock(return_value=[])
+        await cache.get_or_load(("k", ()), 60, loader)
+        await cache.get_or_load(("k", ()), 60, loader)
+        assert loader.await_count == 2
+        assert cache.get_stats()["entries"] == 0
+
+    @pytest.mark.asyncio
+    async def test_returns_copies(self):
+        """测试调用方修改返回值不影响缓存"""
+        cache = AsyncTTLCache()
+        first = await cache.get_or_load(("k", ()), 60, AsyncMock(return_value=[{"name": "名医堂"}]))
+        first[0]["name"] = "已修改"
+        second = await cache.get_or_load(("k", ()), 60, AsyncMock())
+        second.append({"name": "多余"})
+        assert await cache.get_or_load(("k", ()), 60, AsyncMock()) == [{"name": "名医堂"}]
+
+    @pytest.mark.asyncio
+    async def test_load_started_before_invalidate_not_stored(self):
+        """测试失效前开始的加载不写入缓存，失效后的请求重新加载"""
+        cache = AsyncTTLCache()
+        release = asyncio.Event()
+
+        async def stale_loader():
+            await release.wait()
+            return ["旧数据"]
+
+        stale = asyncio.ensure_future(cache.get_or_load(("k", ()), 60, stale_loader))
+        await asyncio.sleep(0)
+        cache.invalidate()
+        fresh = await cache.get_or_load(("k", ()), 60, AsyncMock(return_value=["新数据"]))
+        release.set()
+        assert await stale == ["旧数据"]
+        assert fresh == ["新数据"]
+        assert await cache.get_or_load(("k", ()), 60, AsyncMock()) == ["新数据"]
+
+class TestDatabaseServiceCache:
+    """测试数据库服务的缓存接入"""
+
+    @pytest.mark.asyncio
+    async def test_stores_cached_and_invalidated_after_appointment(self):
+        """测试门店查询被缓存，创建预约后失效"""
+        service = DatabaseAPIService()
+        fetch = AsyncMock(return_value={"stores": [{"id": 1, "name": "名医堂"}]})
+
+        with patch.object(service, "_fetch", fetch), \
+                patch.object(service, "_make_post_request", AsyncMock(return_value={"success": True, "data": {"id": 9}})):
+            assert len(await service.get_stores()) == 1
+            assert len(await service.get_stores()) == 1
+            assert fetch.await_count == 1
+
+            await service.create_smart_appointment({"therapist_name": "马老师"})
+            await service.get_stores()
+            assert fetch.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_uncached_endpoint(self):
+        """测试未配置TTL的端点不走缓存"""
+        service = DatabaseAPIService()
+        fetch = AsyncMock(return_value={"appointments": []})
+        with patch.object(service, "_fetch", fetch):
+            await service.get_user_appointments("13800000000")
+            await service.get_user_appointments("13800000000")
+        assert fetch.await_count == 2
+        assert service.cache.get_stats()["entries"] == 0
+
+    @pytest.mark.asyncio
+    async def test_failed_response_not_cached(self):
+        """测试 success: false 的响应当作失败处理，不写入缓存"""
+        service = DatabaseAPIService()
+
+        class Response:
+            status = 200
+
+            async def json(self, loads=None):
+                return {"success": False, "error": "数据库繁忙"}
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *args):
+                return False
+
+        service.session = type("Session", (), {"get": lambda self, url, params=None: Response()})()
+        assert await service.get_stores() == []
+        assert service.cache.get_stats()["entries"] == 0
@@ -0,0 +1,284 @@
+"""
+聊天数据库管理器测试
+"""
+
+import os
+import sqlite3
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+os.environ.setdefault("DIANPING_DB_PATH", ":memory:")
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'dianping-scraper', 'backend'))
+from database import DatabaseManager  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """每个测试使用独立的数据库文件"""
+    monkeypatch.setattr(DatabaseManager, "_instance", None)
+    manager = DatabaseManager(str(tmp_path / "history.db"))
+    yield manager
+    manager.close()
+
+
+def _memory(count, chat_id="chat_1", start=0):
+    return [{
+        "chatId": chat_id,
+        "contactName": "张先生",
+        "role": "user" if i % 2 == 0 else "assistant",
+        "content": f"第{i}条消息",
+        "timestamp": f"2025-06-18T10:{i:02d}:00.000Z",
+    } for i in range(start, start + count)]
+
+
+class TestBulkInsert:
+    """测试批量去重写入"""
+
+    def test_returns_only_new_messages(self, db):
+        first = db.add_messages_bulk(_memory(5))
+        assert len(first) == 5
+
+        # 扩展重发完整记忆，只有末尾两条是新的
+        second = db.add_messages_bulk(_memory(7))
+        assert [m["content"] for m in second] == ["第5条消息", "第6条消息"]
+        assert db.add_messages_bulk(_memory(7)) == []
+
+        count = db.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        assert count == 7
+
+    def test_duplicates_within_batch(self, db):
+        batch = _memory(2) + _memory(2)
+        assert len(db.add_messages_bulk(batch)) == 2
+
+    def test_single_round_trip(self, db):
+        """测试一批消息只有一次存在性查询和一次提交"""
+        statements = []
+        db.add_messages_bulk(_memory(3))
+        db.conn.set_trace_callback(statements.append)
+        db.add_messages_bulk(_memory(10))
+        db.conn.set_trace_callback(None)
+
+        selects = [s for s in statements if s.startswith("SELECT id FROM messages")]
+        commits = [s for s in statements if s.strip().upper() == "COMMIT"]
+        assert len(selects) <= 1
+        assert len(commits) == 1
+
+    def test_large_batch_chunks_query(self, db):
+        assert len(db.add_messages_bulk(_memory(1200))) == 1200
+        assert db.add_messages_bulk(_memory(1200)) == []
+
+    def test_add_message_compatible(self, db):
+        message = _memory(1)[0]
+        assert db.add_message(message) is True
+        assert db.add_message(message) is False
+        assert db.is_message_processed(db._generate_message_id(message))
+
+    def test_raw_data_round_trip(self, db):
+        db.add_messages_bulk(_memory(3))
+        history = db.get_chat_history("chat_1")
+        assert [m["content"] for m in history] == ["第0条消息", "第1条消息", "第2条消息"]
+        assert history[0]["contactName"] == "张先生"
+
+    def test_history_ordered_by_normalized_time(self, db):
+        """测试不同格式的时间戳按实际时间排序，timestamp 列保留原始值"""
+        db.add_messages_bulk([
+            _message("user", "第三", 1750228260000),
+            _message("user", "第二", "2025-06-18T06:30:00.000Z"),
+            _message("user", "第一", "2025-06-18T14:29:00+08:00"),
+        ])
+        assert [m["content"] for m in db.get_chat_history("chat_1")] == ["第一", "第二", "第三"]
+        stored = [row[0] for row in db.conn.execute("SELECT timestamp FROM messages ORDER BY ts_epoch")]
+        assert stored == ["2025-06-18T14:29:00+08:00", "2025-06-18T06:30:00.000Z", "1750228260000"]
+
+    def test_empty_batch(self, db):
+        assert db.add_messages_bulk([]) == []
+
+
+class TestSeenFilter:
+    """测试已处理消息ID过滤器与数据库的配合"""
+
+    def test_replayed_history_skips_database(self, db):
+        db.add_messages_bulk(_memory(20))
+        statements = []
+        db.conn.set_trace_callback(statements.append)
+        assert db.add_messages_bulk(_memory(20)) == []
+        assert all(db.is_message_processed(db._generate_message_id(m)) for m in _memory(20))
+        db.conn.set_trace_callback(None)
+
+        assert statements == []
+        assert db.get_stats()["seen_filter"]["hit_rate"] == 1.0
+
+    def test_filter_rebuilt_at_startup(self, tmp_path, monkeypatch):
+        path = str(tmp_path / "history.db")
+        monkeypatch.setattr(DatabaseManager, "_instance", None)
+        first = DatabaseManager(path)
+        first.add_messages_bulk(_memory(5))
+        first.close()
+
+        monkeypatch.setattr(DatabaseManager, "_instance", None)
+        second = DatabaseManager(path)
+        try:
+            assert second.get_stats()["seen_filter"]["bloom_entries"] == 5
+            # LRU为空，布隆过滤器判定可能存在，回查数据库确认
+            assert second.add_messages_bulk(_memory(6)) == [_memory(6)[5]]
+            stats = second.get_stats()["seen_filter"]
+            assert stats["db_fallbacks"] == 5
+            assert stats["bloom_negatives"] == 1
+        finally:
+            second.close()
+
+    def test_bloom_false_positive_falls_back_to_database(self, db):
+        message = _memory(1)[0]
+        message_id = db._generate_message_id(message)
+        db.seen_filter.bloom.add(message_id)  # 模拟误判
+
+        assert db.is_message_processed(message_id) is False
+        assert db.add_messages_bulk([message]) == [message]
+        assert db.get_stats()["seen_filter"]["bloom_false_positives"] == 2
+
+
+def _iso(offset_minutes):
+    """距现在 offset_minutes 分钟的UTC时间（扩展 toISOString 的格式）"""
+    moment = datetime.now(timezone.utc) + timedelta(minutes=offset_minutes)
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.") + f"{moment.microsecond // 1000:03d}Z"
+
+
+def _message(role, content, timestamp, chat_id="chat_1"):
+    return {"chatId": chat_id, "role": role, "content": content, "timestamp": timestamp}
+
+
+class TestReplyState:
+    """测试 ts_epoch 与 chat_state 支撑的回复判断"""
+
+    def test_recent_customer_message(self, db):
+        db.add_messages_bulk([_message("assistant", "您好", _iso(-3)), _message("user", "在吗", _iso(-1))])
+        assert db.should_reply_to_chat("chat_1") is True
+
+    def test_merchant_replied_last(self, db):
+        db.add_messages_bulk([_message("user", "在吗", _iso(-2))])
+        db.add_message(_message("assistant", "在的", datetime.now().isoformat()))
+        assert db.should_reply_to_chat("chat_1") is False
+
+    def test_stale_customer_message(self, db):
+        db.add_messages_bulk([_message("user", "在吗", _iso(-10))])
+        assert db.should_reply_to_chat("chat_1") is False
+
+    def test_unknown_chat(self, db):
+        assert db.should_reply_to_chat("missing") is False
+
+    def test_out_of_order_and_future_timestamps(self, db):
+        """测试乱序到达的旧消息不覆盖最新状态，未来时间戳被忽略"""
+        db.add_messages_bulk([_message("user", "最新", _iso(-1))])
+        db.add_messages_bulk([_message("assistant", "旧回复", _iso(-20)),
+                              _message("assistant", "时间错误", _iso(120))])
+        assert db.should_reply_to_chat("chat_1") is True
+
+        row = db.conn.execute("SELECT last_role, last_customer_ts_epoch FROM chat_state").fetchone()
+        assert row[0] == "user" and row[1] is not None
+
+    def test_reply_is_primary_key_lookup(self, db):
+        db.add_messages_bulk(_memory(50))
+        plan = " ".join(row[-1] for row in db.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT last_role, last_ts_epoch FROM chat_state WHERE chat_id = ?", ("chat_1",)))
+        assert "USING INDEX sqlite_autoindex_chat_state_1" in plan or "PRIMARY KEY" in plan
+
+    @pytest.mark.parametrize("timestamp", [1e25, 10 ** 25, "99999999999999999999999"])
+    def test_out_of_range_timestamp_uses_received_time(self, db, timestamp):
+        """测试超出范围的时间戳按接收时间入库，不影响写入"""
+        assert db.add_messages_bulk([_message("user", "在吗", timestamp)])
+        epoch = db.conn.execute("SELECT ts_epoch FROM messages").fetchone()[0]
+        assert abs(epoch - datetime.now(timezone.utc).timestamp() * 1000) < 60000
+        assert not db.conn.in_transaction
+
+    def test_ts_epoch_stored(self, db):
+        db.add_messages_bulk(_memory(1))
+        epoch = db.conn.execute("SELECT ts_epoch FROM messages").fetchone()[0]
+        expected = datetime(2025, 6, 18, 10, 0, tzinfo=timezone.utc).timestamp() * 1000
+        assert epoch == expected
+
+    def test_existing_database_migrated(self, tmp_path, monkeypatch):
+        """测试旧库增加 ts_epoch 列、回填并重建 chat_state"""
+        path = str(tmp_path / "old.db")
+        conn = sqlite3.connect(path)
+        conn.execute("""CREATE TABLE messages (id TEXT PRIMARY KEY, chat_id TEXT NOT NULL, role TEXT NOT NULL,
+                        content TEXT NOT NULL, timestamp TEXT, raw_data TEXT NOT NULL,
+                        processed_at DATETIME DEFAULT CURRENT_TIMESTAMP)""")
+        rows = [("a", "chat_old", "assistant", "您好", _iso(-4)),
+                ("b", "chat_old", "user", "在吗", _iso(-2)),
+                ("c", "chat_old", "user", "坏时间", "昨天")]
+        conn.executemany("INSERT INTO messages (id, chat_id, role, content, timestamp, raw_data) "
+                         "VALUES (?, ?, ?, ?, ?, '{}')", rows)
+        conn.commit()
+        conn.close()
+
+        monkeypatch.setattr(DatabaseManager, "_instance", None)
+        manager = DatabaseManager(path)
+        try:
+            epochs = dict(manager.conn.execute("SELECT id, ts_epoch FROM messages"))
+            assert epochs["a"] < epochs["b"]
+            # 无法解析的时间戳使用入库时间 processed_at
+            assert abs(epochs["c"] - datetime.now(timezone.utc).timestamp() * 1000) < 60000
+            assert manager.should_reply_to_chat("chat_old") is True
+        finally:
+            manager.close()
+
+
+class TestHistoryPage:
+    """测试按时间倒序分页读取历史"""
+
+    def test_tail_first_pagination(self, db):
+        db.add_messages_bulk(_memory(120))
+        page = db.get_history_page("chat_1", limit=50)
+        assert [e.content for e in page.entries] == [f"第{i}条消息" for i in range(70, 120)]
+        assert page.raw is None
+
+        older = db.get_history_page("chat_1", limit=50, before=page.before)
+        assert [e.content for e in older.entries] == [f"第{i}条消息" for i in range(20, 70)]
+        oldest = db.get_history_page("chat_1", limit=50, before=older.before)
+        assert len(oldest.entries) == 20
+        assert oldest.before is None
+
+    def test_entries_are_lightweight_tuples(self, db):
+        db.add_messages_bulk(_memory(2))
+        entry = db.get_history_page("chat_1").entries[0]
+        assert tuple(entry) == ("user", "第0条消息", datetime(2025, 6, 18, 10, 0, tzinfo=timezone.utc).timestamp() * 1000)
+        assert db.get_history_page("chat_1").as_messages()[1]["role"] == "assistant"
+
+    def test_include_raw(self, db):
+        db.add_messages_bulk(_memory(3))
+        page = db.get_history_page("chat_1", include_raw=True)
+        assert [m["content"] for m in page.raw] == [e.content for e in page.entries]
+        assert page.raw[0]["contactName"] == "张先生"
+
+    def test_since_id_incremental(self, db):
+        db.add_messages_bulk(_memory(10))
+        page = db.get_history_page("chat_1", limit=50)
+        db.add_messages_bulk(_memory(13))
+
+        delta = db.get_history_page("chat_1", since_id=page.latest_id)
+        assert [e.content for e in delta.entries] == ["第10条消息", "第11条消息", "第12条消息"]
+        assert db.get_history_page("chat_1", since_id=delta.latest_id).entries == []
+        assert db.get_history_page("chat_1", since_id=delta.latest_id).latest_id == delta.latest_id
+        # 未知的消息ID返回最新的一页
+        assert len(db.get_history_page("chat_1", since_id="missing").entries) == 13
+
+    def test_same_timestamp_keeps_insert_order(self, db):
+        db.add_messages_bulk([_message("user", f"同时{i}", "2025-06-18T10:00:00.000Z") for i in range(5)])
+        page = db.get_history_page("chat_1", limit=3)
+        assert [e.content for e in page.entries] == ["同时2", "同时3", "同时4"]
+        assert [e.content for e in db.get_history_page("chat_1", before=page.before).entries] == ["同时0", "同时1"]
+
+    def test_get_chat_history_returns_most_recent(self, db):
+        db.add_messages_bulk(_memory(60))
+        history = db.get_chat_history("chat_1", limit=50)
+        assert history[0]["content"] == "第10条消息"
+        assert history[-1]["content"] == "第59条消息"
+
+    def test_index_ordered_scan(self, db):
+        plan = " ".join(row[-1] for row in db.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT rowid, role FROM messages WHERE chat_id = ? AND (ts_epoch, rowid) < (?, ?) "
+            "ORDER BY ts_epoch DESC, rowid DESC LIMIT 51", ("chat_1", 0, 0)))
+        assert "idx_chat_ts" in plan
+        assert "TEMP B-TREE" not in plan
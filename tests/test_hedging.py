@@ -0,0 +1,229 @@
+"""
+跨提供商对冲请求测试
+"""
+
+import asyncio
+
+import pytest
+
+from aiclient.client import AIClient
+from aiclient.config import AIProvider
+from aiclient.hedging import HedgePolicy, HedgedRequest, LatencyHistogram, LatencyTracker
+from aiclient.models import AIRequest, AIResponse, AIMessage, MessageRole
+
+
+class DelayedAdapter:
+    """延迟指定时间后返回（或抛出异常）的模拟适配器"""
+
+    def __init__(self, name, delay, fail=False, chunks=None):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.chunks = chunks or [name]
+        self.calls = 0
+        self.cancelled = False
+
+    async def chat_completion(self, request):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.fail:
+            raise Exception(f"{self.name} 不可用")
+        return AIResponse(content=self.name, model="test-model", provider=self.name)
+
+    async def stream_chat_completion(self, request, on_delta=None):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+            for chunk in self.chunks:
+                await on_delta(chunk)
+                await asyncio.sleep(0.01)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return AIResponse(content="".join(self.chunks), model="test-model", provider=self.name,
+                          time_to_first_token=self.delay * 1000)
+
+
+def _attempt(adapter, streaming=False):
+    def attempt(on_delta):
+        if streaming:
+            return adapter.stream_chat_completion(None, on_delta)
+        return adapter.chat_completion(None)
+    return attempt
+
+
+class TestLatencyHistogram:
+    """测试滑动窗口延迟直方图"""
+
+    def test_percentile_uses_bucket_bounds(self):
+        """测试分位数按桶上界估算"""
+        histogram = LatencyHistogram(bounds_ms=(100, 200, 500, 1000))
+        for latency in [50] * 90 + [450] * 10:
+            histogram.observe(latency)
+        assert histogram.percentile(0.5) == 100
+        assert histogram.percentile(0.95) == 500
+
+    def test_window_evicts_old_samples(self):
+        """测试窗口外的旧样本不再参与统计"""
+        histogram = LatencyHistogram(window=10, bounds_ms=(100, 1000))
+        for _ in range(10):
+            histogram.observe(900)
+        for _ in range(10):
+            histogram.observe(50)
+        assert histogram.count == 10
+        assert histogram.total_count == 20
+        assert histogram.percentile(0.99) == 100
+
+    def test_overflow_bucket_returns_max(self):
+        """测试超过最大桶上界的样本返回实际最大值"""
+        histogram = LatencyHistogram(bounds_ms=(100,))
+        histogram.observe(5000)
+        assert histogram.percentile(0.95) == 5000
+
+
+class TestHedgePolicy:
+    """测试对冲等待时间推算"""
+
+    def test_default_delay_until_enough_samples(self):
+        policy = HedgePolicy(default_delay=3.0, min_samples=5)
+        histogram = LatencyHistogram()
+        histogram.observe(100)
+        assert policy.delay_for(histogram) == 3.0
+
+    def test_delay_follows_p95_with_clamp(self):
+        policy = HedgePolicy(min_samples=5, min_delay=0.5, max_delay=10.0)
+        fast, slow = LatencyHistogram(), LatencyHistogram()
+        for _ in range(20):
+            fast.observe(90)
+            slow.observe(59000)
+
+        assert policy.delay_for(fast) == 0.5
+        assert policy.delay_for(slow) == 10.0
+
+        medium = LatencyHistogram()
+        for _ in range(20):
+            medium.observe(1800)
+        assert policy.delay_for(medium) == 2.0
+
+
+class TestHedgedRequest:
+    """测试对冲请求执行"""
+
+    @pytest.mark.asyncio
+    async def test_slow_primary_is_hedged(self):
+        """测试主提供商超过对冲等待时间后请求备用提供商，先返回者胜出"""
+        primary = DelayedAdapter("openai", delay=1.0)
+        secondary = DelayedAdapter("zhipu", delay=0.02)
+        hedged = HedgedRequest(HedgePolicy(enabled=True, default_delay=0.05), LatencyTracker())
+
+        response = await hedged.run([
+            (AIProvider.OPENAI, _attempt(primary)),
+            (AIProvider.ZHIPU, _attempt(secondary)),
+        ])
+        await asyncio.sleep(0)
+
+        assert response.content == "zhipu"
+        assert hedged.stats == {"hedged": True, "winner": "zhipu", "attempts": ["openai", "zhipu"]}
+        assert primary.cancelled
+        assert hedged.tracker.histogram(AIProvider.ZHIPU).count == 1
+
+    @pytest.mark.asyncio
+    async def test_fast_primary_not_hedged(self):
+        """测试主提供商在对冲等待时间内返回时不请求备用提供商"""
+        primary = DelayedAdapter("openai", delay=0.01)
+        secondary = DelayedAdapter("zhipu", delay=0.01)
+        hedged = HedgedRequest(HedgePolicy(enabled=True, default_delay=0.5), LatencyTracker())
+
+        response = await hedged.run([
+            (AIProvider.OPENAI, _attempt(primary)),
+            (AIProvider.ZHIPU, _attempt(secondary)),
+        ])
+
+        assert response.content == "openai"
+        assert secondary.calls == 0
+        assert not hedged.stats["hedged"]
+
+    @pytest.mark.asyncio
+    async def test_failed_primary_switches_immediately(self):
+        """测试主提供商失败时不等待对冲时间，立即请求备用提供商"""
+        primary = DelayedAdapter("openai", delay=0, fail=True)
+        secondary = DelayedAdapter("zhipu", delay=0)
+        hedged = HedgedRequest(HedgePolicy(enabled=True, default_delay=5.0), LatencyTracker())
+
+        response = await asyncio.wait_for(hedged.run([
+            (AIProvider.OPENAI, _attempt(primary)),
+            (AIProvider.ZHIPU, _attempt(secondary)),
+        ]), timeout=1.0)
+
+        assert response.content == "zhipu"
+
+    @pytest.mark.asyncio
+    async def test_all_providers_fail(self):
+        """测试所有提供商失败时抛出最后一个错误"""
+        hedged = HedgedRequest(HedgePolicy(enabled=True, default_delay=0.01), LatencyTracker())
+        with pytest.raises(Exception, match="zhipu 不可用"):
+            await hedged.run([
+                (AIProvider.OPENAI, _attempt(DelayedAdapter("openai", delay=0.05, fail=True))),
+                (AIProvider.ZHIPU, _attempt(DelayedAdapter("zhipu", delay=0.1, fail=True))),
+            ])
+
+    @pytest.mark.asyncio
+    async def test_streaming_first_token_wins(self):
+        """测试流式模式下先输出文本的提供商获得输出权，另一个被取消"""
+        primary = DelayedAdapter("openai", delay=1.0, chunks=["慢"])
+        secondary = DelayedAdapter("zhipu", delay=0.02, chunks=["您", "好"])
+        deltas = []
+
+        async def on_delta(text):
+            deltas.append(text)
+
+        hedged = HedgedRequest(HedgePolicy(enabled=True, default_delay=0.05), LatencyTracker(), on_delta)
+        response = await hedged.run([
+            (AIProvider.OPENAI, _attempt(primary, streaming=True)),
+            (AIProvider.ZHIPU, _attempt(secondary, streaming=True)),
+        ])
+        await asyncio.sleep(0)
+
+        assert response.content == "您好"
+        assert deltas == ["您", "好"]
+        assert primary.cancelled
+        assert hedged.tracker.histogram(AIProvider.ZHIPU, streaming=True).count == 1
+
+
+class TestClientHedging:
+    """测试客户端集成"""
+
+    @pytest.mark.asyncio
+    async def test_client_hedges_completion(self):
+        """测试开启对冲后客户端的单次请求由更快的提供商完成"""
+        client = AIClient()
+        client.adapters = {
+            AIProvider.OPENAI: DelayedAdapter("openai", delay=1.0),
+            AIProvider.ZHIPU: DelayedAdapter("zhipu", delay=0.01),
+        }
+        client.hedge_policy = HedgePolicy(enabled=True, default_delay=0.05)
+        request = AIRequest(messages=[AIMessage(role=MessageRole.USER, content="你好")])
+
+        response = await client._complete(client.adapters[AIProvider.OPENAI], request)
+
+        assert response.content == "zhipu"
+        status = client.get_status()["hedging"]
+        assert status["requests"] == 1
+        assert status["hedged"] == 1
+        assert status["wins"] == {"zhipu": 1}
+
+    @pytest.mark.asyncio
+    async def test_latency_recorded_without_hedging(self):
+        """测试未开启对冲时也记录延迟，供之后推算对冲等待时间"""
+        client = AIClient()
+        client.adapters = {AIProvider.OPENAI: DelayedAdapter("openai", delay=0)}
+        client.hedge_policy = HedgePolicy(enabled=False)
+        request = AIRequest(messages=[AIMessage(role=MessageRole.USER, content="你好")])
+
+        await client._complete(client.adapters[AIProvider.OPENAI], request)
+
+        assert client.get_status()["latency"]["openai"]["total"]["count"] == 1
@@ -0,0 +1,123 @@
+"""
+对话历史压缩测试
+"""
+
+from aiclient.history import HistoryCompactor, TRUNCATED_MARKER, extractive_summary, message_tokens
+from aiclient.prompts import build_system_prompt, estimate_tokens
+
+
+def _conversation(count, start=0):
+    return [{
+        "role": "user" if i % 2 == 0 else "assistant",
+        "content": f"第{i}条消息，关于颈肩调理和预约时间的咨询内容",
+        "timestamp": f"2025-06-18 10:{i:02d}:00"
+    } for i in range(start, start + count)]
+
+
+class TestHistoryCompactor:
+    """测试按token预算压缩历史"""
+
+    def test_short_history_kept_verbatim(self):
+        """测试预算内的历史原样保留，不生成摘要"""
+        compactor = HistoryCompactor(token_budget=1000, summary_tokens=200)
+        history = _conversation(4)
+        result = compactor.compact(history, "chat_1")
+        assert result.summary is None
+        assert result.recent == history
+        assert result.compression_ratio == 1.0
+
+    def test_long_history_summarized_within_budget(self):
+        """测试超出预算时早期消息折叠为摘要，总token不超过预算"""
+        compactor = HistoryCompactor(token_budget=300, summary_tokens=100, min_recent=2)
+        history = _conversation(40)
+        result = compactor.compact(history, "chat_1")
+
+        assert result.summary
+        assert result.recent == history[-len(result.recent):]
+        assert sum(message_tokens(m) for m in result.recent) <= 200
+        assert result.compacted_tokens <= 300 + 10
+        assert result.compression_ratio < 0.5
+        assert compactor.get_stats()["compression_ratio"] == round(result.compression_ratio, 3)
+
+    def test_min_recent_kept_even_over_budget(self):
+        """测试即使超出预算也至少保留最近的若干条原文"""
+        compactor = HistoryCompactor(token_budget=50, summary_tokens=40, min_recent=4)
+        result = compactor.compact(_conversation(10))
+        assert len(result.recent) == 4
+
+    def test_empty_messages_dropped(self):
+        compactor = HistoryCompactor()
+        result = compactor.compact([{"role": "user", "content": "  "}, {"role": "user", "content": "你好"}])
+        assert [m["content"] for m in result.recent] == ["你好"]
+
+
+class TestRollingSummary:
+    """测试按聊天缓存的滚动摘要"""
+
+    def test_summary_updated_incrementally(self):
+        """测试新消息到达时只把新挤出窗口的消息并入摘要"""
+        calls = []
+
+        def summarizer(previous, new_messages, max_tokens):
+            calls.append((previous, [m["content"] for m in new_messages]))
+            return extractive_summary(previous, new_messages, max_tokens)
+
+        compactor = HistoryCompactor(token_budget=1200, summary_tokens=1000, min_recent=2, max_recent=4,
+                                     summarizer=summarizer)
+        history = _conversation(10)
+
+        first = compactor.compact(history, "chat_1")
+        assert len(first.recent) == 4
+        assert len(calls[0][1]) == 6
+
+        # 没有新消息：直接使用缓存的摘要
+        again = compactor.compact(history, "chat_1")
+        assert again.summary == first.summary
+        assert len(calls) == 1
+
+        # 新增两条消息：只并入新挤出窗口的两条
+        history = history + _conversation(2, start=10)
+        updated = compactor.compact(history, "chat_1")
+        assert len(calls) == 2
+        assert calls[1][0] == first.summary
+        assert calls[1][1] == [history[6]["content"], history[7]["content"]]
+        assert updated.summary.startswith(first.summary)
+
+        stats = compactor.get_stats()
+        assert stats["summary_cache_hits"] == 1
+        assert stats["summary_updates"] == 1
+        assert stats["cached_chats"] == 1
+
+    def test_summary_rebuilt_when_history_changes(self):
+        """测试缓存的摘要与历史不连续时重新生成"""
+        compactor = HistoryCompactor(token_budget=100, summary_tokens=1000, min_recent=2, max_recent=2)
+        compactor.compact(_conversation(6), "chat_1")
+        compactor.compact(_conversation(6, start=100), "chat_1")
+        assert compactor.get_stats()["summary_rebuilds"] == 1
+
+    def test_chats_do_not_share_summary(self):
+        compactor = HistoryCompactor(token_budget=100, summary_tokens=1000, min_recent=2, max_recent=2)
+        a = compactor.compact(_conversation(6), "chat_a")
+        b = compactor.compact(_conversation(6, start=50), "chat_b")
+        assert a.summary != b.summary
+
+
+class TestExtractiveSummary:
+    """测试抽取式摘要"""
+
+    def test_drops_assistant_lines_first(self):
+        """测试超出摘要预算时先删除最早的客服消息"""
+        messages = [
+            {"role": "user", "content": "我姓张，想约王师傅"},
+            {"role": "assistant", "content": "好的，王师傅今天下午有空，请问几点方便"},
+            {"role": "user", "content": "三点"},
+        ]
+        full = extractive_summary("", messages, 1000)
+        assert full.split("\n") == ["客户: 我姓张，想约王师傅", "客服: 好的，王师傅今天下午有空，请问几点方便", "客户: 三点"]
+
+        trimmed = extractive_summary("", messages, estimate_tokens("客户: 我姓张，想约王师傅\n客户: 三点") + 10)
+        assert trimmed.split("\n") == [TRUNCATED_MARKER, "客户: 我姓张，想约王师傅", "客户: 三点"]
+
+    def test_summary_in_system_prompt_after_prefix(self):
+        prompt = build_system_prompt({"shopName": "名医堂宜山路店"}, "客户: 我姓张")
+        assert prompt.endswith("【当前门店】: 名医堂宜山路店\n【早期对话摘要】\n客户: 我姓张")
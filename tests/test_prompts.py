@@ -0,0 +1,113 @@
+"""
+客服提示词构建测试
+"""
+
+from aiclient.adapters.openai_adapter import OpenAIAdapter
+from aiclient.config import ModelConfig, AIProvider
+from aiclient.models import MessageRole
+from aiclient.prompts import (
+    CUSTOMER_SERVICE_INSTRUCTIONS, build_customer_service_messages, build_message_tail,
+    build_system_prompt, estimate_tokens, shared_prefix_tokens
+)
+
+
+def _history(*pairs):
+    return [{"role": role, "content": content, "chatId": "chat_1", "timestamp": f"10:0{i}"}
+            for i, (role, content) in enumerate(pairs)]
+
+
+class TestSystemPrompt:
+    """测试系统提示词的固定前缀"""
+
+    def test_prefix_is_stable_across_chats(self):
+        """测试不同对话对象的系统提示词共享同一固定前缀"""
+        first = build_system_prompt({"combinedName": "名医堂宜山路店 - 张先生"})
+        second = build_system_prompt({"shopName": "名医堂静安店", "contactName": "李女士"})
+        assert first.startswith(CUSTOMER_SERVICE_INSTRUCTIONS)
+        assert second.startswith(CUSTOMER_SERVICE_INSTRUCTIONS)
+        assert first.endswith("【当前对话对象】: 名医堂宜山路店 - 张先生")
+        assert build_system_prompt(None) == CUSTOMER_SERVICE_INSTRUCTIONS
+
+    def test_history_not_in_system_prompt(self):
+        """测试对话历史不再写入系统提示词"""
+        messages = build_customer_service_messages(
+            "明天下午可以吗", _history(("user", "有技师推荐吗"), ("assistant", "推荐王师傅"))
+        )
+        assert messages[0].role == MessageRole.SYSTEM
+        assert "有技师推荐吗" not in messages[0].content
+        assert "明天下午可以吗" not in messages[0].content
+
+
+class TestMessageTail:
+    """测试消息尾部去重"""
+
+    def test_dedupes_repeated_and_current_message(self):
+        """测试连续重复消息合并，历史末尾的当前客户消息不重复追加"""
+        tail = build_message_tail("明天下午可以吗", _history(
+            ("user", "有技师推荐吗"),
+            ("user", "有技师推荐吗"),
+            ("assistant", "推荐王师傅"),
+            ("assistant", ""),
+            ("user", "明天下午可以吗"),
+        ))
+        assert [(m.role, m.content) for m in tail] == [
+            (MessageRole.USER, "有技师推荐吗"),
+            (MessageRole.ASSISTANT, "推荐王师傅"),
+            (MessageRole.USER, "明天下午可以吗"),
+        ]
+
+    def test_appends_current_message_when_missing(self):
+        """测试历史中没有当前客户消息时追加到末尾"""
+        tail = build_message_tail("你好", _history(("assistant", "欢迎光临")))
+        assert tail[-1].role == MessageRole.USER
+        assert tail[-1].content == "你好"
+
+    def test_history_limit(self):
+        """测试只保留最近的历史消息"""
+        history = _history(*[("user" if i % 2 else "assistant", f"消息{i}") for i in range(40)])
+        tail = build_message_tail("新消息", history, history_limit=10)
+        assert len(tail) == 11
+        assert tail[0].content == "消息30"
+
+
+class TestTokenEstimate:
+    """测试token估算"""
+
+    def test_estimate_tokens(self):
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("你好，师傅") == 5
+        assert estimate_tokens("abcdefgh") == 2
+        assert estimate_tokens("预约 10:00") == 2 + 2
+
+    def test_consecutive_turns_share_prefix(self):
+        """测试同一对话相邻两轮请求的公共前缀覆盖固定前缀和之前的历史"""
+        history = _history(("user", "有技师推荐吗"), ("assistant", "推荐王师傅"), ("user", "明天下午可以吗"))
+        context = {"combinedName": "名医堂宜山路店 - 张先生"}
+        previous = build_customer_service_messages("有技师推荐吗", history[:1], context)
+        current = build_customer_service_messages("明天下午可以吗", history, context)
+        assert shared_prefix_tokens(previous, current) >= estimate_tokens(previous[0].content) + 5
+
+
+class TestAdapterPrompt:
+    """测试适配器使用新的提示词结构"""
+
+    def test_prompt_with_history_uses_prefix_and_tail(self):
+        adapter = OpenAIAdapter(ModelConfig(
+            provider=AIProvider.OPENAI, model_name="gpt-4o", api_key="test-key", base_url="http://127.0.0.1:1"
+        ))
+        request = adapter.create_customer_service_prompt_with_history(
+            "明天下午可以吗",
+            _history(("user", "有技师推荐吗"), ("assistant", "推荐王师傅"), ("user", "明天下午可以吗")),
+            {"shopName": "名医堂宜山路店"}
+        )
+        assert request.messages[0].content.startswith(CUSTOMER_SERVICE_INSTRUCTIONS)
+        assert [m.content for m in request.messages[1:]] == ["有技师推荐吗", "推荐王师傅", "明天下午可以吗"]
+        assert request.tools
+
+    def test_prompt_without_history(self):
+        adapter = OpenAIAdapter(ModelConfig(
+            provider=AIProvider.OPENAI, model_name="gpt-4o", api_key="test-key", base_url="http://127.0.0.1:1"
+        ))
+        request = adapter.create_customer_service_prompt("你好")
+        assert request.messages[0].content == CUSTOMER_SERVICE_INSTRUCTIONS
+        assert request.messages[-1].content == "你好"
@@ -0,0 +1,142 @@
+"""
+AI回复防抖测试
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'dianping-scraper', 'backend'))
+from reply_debouncer import ReplyDebouncer  # noqa: E402
+
+
+def _reply_job(calls, name, duration=0.0):
+    async def job():
+        calls.append(("start", name))
+        await asyncio.sleep(duration)
+        calls.append(("done", name))
+        return name
+    return job
+
+
+class TestReplyDebouncer:
+    """测试连续消息合并与取消"""
+
+    @pytest.mark.asyncio
+    async def test_burst_coalesced_into_one_call(self):
+        debouncer = ReplyDebouncer(window=0.05, max_wait=1.0)
+        calls = []
+        for i in range(4):
+            task = debouncer.schedule("chat_a", _reply_job(calls, i))
+            await asyncio.sleep(0.01)
+        assert await task == 3
+        assert calls == [("start", 3), ("done", 3)]
+
+        stats = debouncer.get_stats()
+        assert stats["triggers"] == 4
+        assert stats["invocations"] == 1
+        assert stats["coalesced"] == 3
+        assert stats["saved_calls"] == 3
+
+    @pytest.mark.asyncio
+    async def test_in_flight_generation_superseded(self):
+        """测试生成中的回复被新消息取消"""
+        debouncer = ReplyDebouncer(window=0.01)
+        calls = []
+        first = debouncer.schedule("chat_a", _reply_job(calls, "old", duration=0.2))
+        await asyncio.sleep(0.05)
+        assert calls == [("start", "old")]
+
+        second = debouncer.schedule("chat_a", _reply_job(calls, "new"))
+        assert await second == "new"
+        assert first.cancelled()
+        assert ("done", "old") not in calls
+        assert debouncer.get_stats()["superseded"] == 1
+        assert debouncer.get_stats()["saved_calls"] == 0
+
+    @pytest.mark.asyncio
+    async def test_side_effect_generation_not_cancelled(self):
+        """测试已开始预约的回复不被新消息取消，新回复在它完成后才生成"""
+        debouncer = ReplyDebouncer(window=0.01)
+        calls = []
+
+        async def booking_job():
+            calls.append(("start", "booking"))
+            await asyncio.sleep(0.02)
+            debouncer.protect_current("create_smart_appointment")
+            calls.append(("booked", "booking"))
+            await asyncio.sleep(0.1)
+            calls.append(("done", "booking"))
+            return "booking"
+
+        first = debouncer.schedule("chat_a", booking_job)
+        await asyncio.sleep(0.05)
+        assert ("booked", "booking") in calls
+
+        second = debouncer.schedule("chat_a", _reply_job(calls, "new"))
+        await asyncio.sleep(0.02)
+        third = debouncer.schedule("chat_a", _reply_job(calls, "newer"))  # 等待期间再来消息，仍然合并
+        assert await third == "newer"
+        assert await first == "booking"
+        assert second.cancelled()
+        assert calls == [("start", "booking"), ("booked", "booking"), ("done", "booking"),
+                         ("start", "newer"), ("done", "newer")]
+        stats = debouncer.get_stats()
+        assert stats["deferred"] == 1 and stats["superseded"] == 0
+
+    @pytest.mark.asyncio
+    async def test_protect_outside_reply_is_noop(self):
+        debouncer = ReplyDebouncer(window=0.01)
+        debouncer.protect_current("test")
+        calls = []
+        first = debouncer.schedule("chat_a", _reply_job(calls, "old", duration=0.2))
+        await asyncio.sleep(0.05)
+        debouncer.schedule("chat_a", _reply_job(calls, "new"))
+        await asyncio.sleep(0)
+        assert first.cancelled()
+
+    @pytest.mark.asyncio
+    async def test_max_wait_bounds_delay(self):
+        """测试持续来消息时不超过最长等待时间"""
+        debouncer = ReplyDebouncer(window=0.05, max_wait=0.08)
+        calls = []
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for i in range(8):
+            debouncer.schedule("chat_a", _reply_job(calls, i))
+            await asyncio.sleep(0.02)
+            if calls:
+                break
+        assert calls
+        assert loop.time() - start < 0.15
+
+    @pytest.mark.asyncio
+    async def test_chats_independent(self):
+        debouncer = ReplyDebouncer(window=0.02)
+        calls = []
+        a = debouncer.schedule("chat_a", _reply_job(calls, "a"))
+        b = debouncer.schedule("chat_b", _reply_job(calls, "b"))
+        assert await asyncio.gather(a, b) == ["a", "b"]
+        assert debouncer.get_stats()["coalesced"] == 0
+
+    @pytest.mark.asyncio
+    async def test_failure_counted(self):
+        debouncer = ReplyDebouncer(window=0)
+
+        async def broken():
+            raise RuntimeError("boom")
+
+        await debouncer.schedule("chat_a", broken)
+        assert debouncer.get_stats()["failed"] == 1
+        assert debouncer.get_stats()["pending"] == 0
+
+    @pytest.mark.asyncio
+    async def test_close_cancels_pending(self):
+        debouncer = ReplyDebouncer(window=1.0)
+        calls = []
+        task = debouncer.schedule("chat_a", _reply_job(calls, "a"))
+        await debouncer.close()
+        assert task.cancelled()
+        assert calls == []
@@ -0,0 +1,71 @@
+"""
+已处理消息ID过滤器测试
+"""
+
+import hashlib
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'dianping-scraper', 'backend'))
+from seen_filter import BloomFilter, SeenIdFilter  # noqa: E402
+
+
+def _ids(count, prefix="msg"):
+    return [hashlib.md5(f"{prefix}{i}".encode()).hexdigest() for i in range(count)]
+
+
+class TestBloomFilter:
+    """测试布隆过滤器"""
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        ids = _ids(1000)
+        for message_id in ids:
+            bloom.add(message_id)
+        assert all(message_id in bloom for message_id in ids)
+
+    def test_false_positive_rate_near_target(self):
+        bloom = BloomFilter(2000, error_rate=0.01)
+        for message_id in _ids(2000):
+            bloom.add(message_id)
+        false_positives = sum(message_id in bloom for message_id in _ids(10000, prefix="other"))
+        assert false_positives / 10000 < 0.03
+
+    def test_is_full(self):
+        bloom = BloomFilter(2)
+        for message_id in _ids(3):
+            bloom.add(message_id)
+        assert bloom.is_full
+
+
+class TestSeenIdFilter:
+    """测试LRU与布隆过滤器的判定"""
+
+    def test_unknown_without_bloom(self):
+        seen = SeenIdFilter(use_bloom=False)
+        assert seen.check("a") is None
+        seen.add("a")
+        assert seen.check("a") is True
+        assert seen.get_stats()["hit_rate"] == 0.5
+
+    def test_bloom_negative_is_new(self):
+        seen = SeenIdFilter()
+        seen.rebuild(_ids(10), 10)
+        assert seen.check(_ids(1, prefix="new")[0]) is False
+        assert seen.check(_ids(10)[3]) is None  # 可能存在，需要回查
+
+    def test_lru_bounded(self):
+        seen = SeenIdFilter(lru_size=3, use_bloom=False)
+        for message_id in "abcd":
+            seen.add(message_id)
+        assert seen.check("a") is None
+        assert seen.check("d") is True
+        assert seen.get_stats()["lru_entries"] == 3
+
+    def test_inserted_ids_added_to_bloom(self):
+        seen = SeenIdFilter(lru_size=1)
+        seen.rebuild([], 0)
+        seen.add("x", inserted=True)
+        seen.add("y", inserted=True)  # x 被挤出LRU
+        assert seen.check("x") is None
+        assert seen.get_stats()["bloom_entries"] == 2
@@ -0,0 +1,113 @@
+"""
+JSON序列化层测试
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+from aiclient import serialization
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'dianping-scraper', 'backend'))
+from schemas import MemoryPayload  # noqa: E402
+
+
+BACKENDS = serialization.available_backends()
+
+SAMPLE = {
+    "type": "memory_update",
+    "payload": {
+        "chatId": "chat_1",
+        "contactName": "名医堂·颈肩腰腿特色调理（宜山路店） - 张先生",
+        "conversationMemory": [
+            {"role": "user", "content": "你好，请问今天还能约吗😊", "timestamp": "2025-06-18T02:00:00.000Z"},
+        ],
+        "contextInfo": {"shopName": "名医堂宜山路店", "count": 3, "rate": 0.5, "ok": True, "none": None},
+    },
+}
+
+
+@pytest.mark.parametrize("name", list(BACKENDS))
+class TestBackends:
+    """测试各实现的行为一致"""
+
+    def test_round_trip(self, name):
+        dumpb, loads = BACKENDS[name]
+        encoded = dumpb(SAMPLE)
+        assert isinstance(encoded, bytes)
+        assert "张先生".encode("utf-8") in encoded  # 不转义非ASCII字符
+        assert loads(encoded) == SAMPLE
+        assert loads(encoded.decode("utf-8")) == SAMPLE
+
+    def test_same_output_as_stdlib(self, name):
+        dumpb, _ = BACKENDS[name]
+        assert dumpb(SAMPLE) == json.dumps(SAMPLE, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def test_decode_error_is_stdlib_error(self, name):
+        _, loads = BACKENDS[name]
+        with pytest.raises(json.JSONDecodeError):
+            loads('{"type": ')
+
+    def test_big_int_falls_back(self, name):
+        dumpb, loads = BACKENDS[name]
+        assert loads(dumpb({"n": 2 ** 70})) == {"n": 2 ** 70}
+
+
+def test_default_helpers():
+    assert serialization.BACKEND in BACKENDS
+    assert serialization.loads(serialization.dumps(SAMPLE)) == SAMPLE
+    assert serialization.dumps({"a": "你好"}) == '{"a":"你好"}'
+
+
+class TestConvert:
+    """测试类型化解码"""
+
+    @pytest.fixture(params=["msgspec", "python"])
+    def convert_impl(self, request, monkeypatch):
+        if request.param == "msgspec" and serialization._msgspec is None:
+            pytest.skip("未安装msgspec")
+        if request.param == "python":
+            monkeypatch.setattr(serialization, "_msgspec", None)
+        return request.param
+
+    def test_memory_payload(self, convert_impl):
+        payload = serialization.convert(SAMPLE["payload"], MemoryPayload)
+        assert payload.chatId == "chat_1"
+        assert payload.conversationMemory[0]["content"] == "你好，请问今天还能约吗😊"
+        assert payload.contextInfo["shopName"] == "名医堂宜山路店"
+        assert payload.action is None
+
+    def test_missing_fields_use_defaults(self, convert_impl):
+        payload = serialization.convert({"chatId": None}, MemoryPayload)
+        assert payload.chatId is None
+        assert payload.conversationMemory == []
+
+    def test_memory_save_payload(self, convert_impl):
+        """测试扩展 saveCurrentMemory 发送的payload（timestamp 为 Date.now() 数字）"""
+        saved = {
+            "action": "save",
+            "chatId": "chat_1",
+            "contactName": "名医堂·颈肩腰腿特色调理（宜山路店） - 张先生",
+            "conversationMemory": SAMPLE["payload"]["conversationMemory"],
+            "timestamp": 1750228200123,
+        }
+        payload = serialization.convert(saved, MemoryPayload)
+        assert payload.timestamp == 1750228200123
+        assert payload.action == "save"
+        assert len(payload.conversationMemory) == 1
+
+    @pytest.mark.parametrize("timestamp", ["2025-06-18T06:30:00.000Z", 1750228200.5, None])
+    def test_timestamp_formats(self, convert_impl, timestamp):
+        assert serialization.convert({"timestamp": timestamp}, MemoryPayload).timestamp == timestamp
+
+    @pytest.mark.parametrize("bad", [
+        {"conversationMemory": "not a list"},
+        {"conversationMemory": ["not an object"]},
+        {"chatId": ["chat_1"]},
+        {"contextInfo": "名医堂"},
+    ])
+    def test_wrong_types_rejected(self, convert_impl, bad):
+        with pytest.raises(ValueError):
+            serialization.convert(bad, MemoryPayload)
@@ -0,0 +1,73 @@
+"""
+服务容器测试
+"""
+
+import pytest
+from unittest.mock import AsyncMock
+
+from aiclient.adapters.openai_adapter import OpenAIAdapter
+from aiclient.config import ModelConfig, AIProvider
+from aiclient.services import ServiceContainer
+
+
+class FakeDatabaseService:
+    """记录调用次数的模拟数据库服务"""
+
+    def __init__(self):
+        self.get_stores = AsyncMock(return_value=[{"id": 1, "name": "名医堂·颈肩腰腿特色调理（静安寺店）"}])
+        self.close = AsyncMock()
+
+
+@pytest.fixture
+def config():
+    return ModelConfig(
+        provider=AIProvider.OPENAI,
+        model_name="gpt-4o",
+        api_key="test-key",
+        base_url="http://127.0.0.1:1/v1"
+    )
+
+
+class TestServiceContainer:
+    """测试服务容器共享与生命周期"""
+
+    @pytest.mark.asyncio
+    async def test_adapters_share_database_service(self, config):
+        """测试多个适配器、多次函数调用复用同一个数据库服务"""
+        database_service = FakeDatabaseService()
+        services = ServiceContainer(database_service=database_service)
+        first = OpenAIAdapter(config, services)
+        second = OpenAIAdapter(config, services)
+
+        for adapter in (first, second, first):
+            result = await adapter.execute_function_call("get_stores", {})
+            assert result["success"] is True
+
+        assert first.services is second.services
+        assert database_service.get_stores.await_count == 3
+        database_service.close.assert_not_awaited()
+
+        # 共享容器由持有者关闭，适配器关闭时不会释放
+        await first.close()
+        database_service.close.assert_not_awaited()
+        await services.close()
+        database_service.close.assert_awaited_once()
+
+    def test_services_created_once(self):
+        """测试懒加载的服务只创建一次并共享数据库服务"""
+        services = ServiceContainer(database_service=FakeDatabaseService(), email_service=object())
+        smart_service = services.smart_appointment_service
+
+        assert services.smart_appointment_service is smart_service
+        assert smart_service.database_service is services.database_service
+        assert smart_service.email_service is services.email_service
+
+    @pytest.mark.asyncio
+    async def test_standalone_adapter_owns_services(self, config):
+        """测试未注入容器的适配器在关闭时释放私有容器"""
+        adapter = OpenAIAdapter(config)
+        database_service = FakeDatabaseService()
+        adapter.services._database_service = database_service
+
+        await adapter.close()
+        database_service.close.assert_awaited_once()
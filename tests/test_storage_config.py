@@ -0,0 +1,48 @@
+"""
+SQLite存储配置测试
+"""
+
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("DIANPING_DB_PATH", ":memory:")
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'dianping-scraper', 'backend'))
+from database import DatabaseManager  # noqa: E402
+from storage_config import StorageConfig  # noqa: E402
+
+
+class TestStorageConfig:
+    """测试PRAGMA设置"""
+
+    def test_pragmas_applied(self, tmp_path):
+        conn = StorageConfig(mmap_size=1 << 20, cache_size_kb=2048).connect(str(tmp_path / "a.db"))
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == -2048
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 10000
+        conn.close()
+
+    def test_from_env(self, monkeypatch):
+        monkeypatch.setenv("DB_SYNCHRONOUS", "full")
+        monkeypatch.setenv("DB_GROUP_COMMIT_MESSAGES", "32")
+        config = StorageConfig.from_env()
+        assert config.synchronous == "FULL"
+        assert config.group_commit_messages == 32
+        assert config.journal_mode == "WAL"
+
+    def test_invalid_mode_rejected(self):
+        with pytest.raises(ValueError):
+            StorageConfig(journal_mode="WAL; DROP TABLE messages")
+
+    def test_manager_uses_storage(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(DatabaseManager, "_instance", None)
+        manager = DatabaseManager(str(tmp_path / "history.db"), storage=StorageConfig(synchronous="FULL"))
+        try:
+            assert manager.get_stats()["journal_mode"] == "wal"
+            assert manager.conn.execute("PRAGMA synchronous").fetchone()[0] == 2
+            with manager._read_connection() as conn:
+                assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        finally:
+            manager.close()
@@ -0,0 +1,226 @@
+"""
+流式（SSE）聊天补全测试
+"""
+
+import json
+
+import pytest
+from aiohttp import web
+
+from aiclient.adapters.base import BaseAdapter, StreamAccumulator
+from aiclient.adapters.openai_adapter import OpenAIAdapter
+from aiclient.client import AIClient
+from aiclient.config import ModelConfig, AIProvider
+from aiclient.models import AIRequest, AIResponse, AIMessage, MessageRole
+
+
+def _chunk(delta, finish_reason=None):
+    return {
+        "model": "stub-model",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+    }
+
+
+async def _start_stub_sse_server(chunks):
+    """启动本地模拟SSE服务器，按顺序推送给定的增量块"""
+    received = []
+
+    async def chat_completions(request):
+        received.append(await request.json())
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for chunk in chunks:
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1", received
+
+
+class TestStreamAccumulator:
+    """测试增量块组装"""
+
+    def test_merges_content(self):
+        """测试文本增量按顺序拼接"""
+        accumulator = StreamAccumulator()
+        assert accumulator.feed(_chunk({"role": "assistant"})) == ("", False)
+        assert accumulator.feed(_chunk({"content": "您好"})) == ("您好", True)
+        assert accumulator.feed(_chunk({"content": "，请问"})) == ("，请问", True)
+        accumulator.feed(_chunk({}, finish_reason="stop"))
+
+        data = accumulator.to_response_data()
+        assert data["model"] == "stub-model"
+        assert data["choices"][0]["message"]["content"] == "您好，请问"
+        assert data["choices"][0]["finish_reason"] == "stop"
+
+    def test_merges_tool_call_fragments(self):
+        """测试按 index 分片下发的工具调用参数被正确合并"""
+        accumulator = StreamAccumulator()
+        accumulator.feed(_chunk({"tool_calls": [{
+            "index": 0, "id": "call_0", "type": "function",
+            "function": {"name": "get_stores", "arguments": ""}
+        }]}))
+        accumulator.feed(_chunk({"tool_calls": [{
+            "index": 1, "id": "call_1", "type": "function",
+            "function": {"name": "search_therapists", "arguments": "{\"store"}
+        }]}))
+        accumulator.feed(_chunk({"tool_calls": [{"index": 0, "function": {"arguments": "{}"}}]}))
+        accumulator.feed(_chunk({"tool_calls": [{"index": 1, "function": {"arguments": "_name\": \"宜山路店\"}"}}]}))
+        accumulator.feed(_chunk({}, finish_reason="tool_calls"))
+
+        tool_calls = accumulator.to_response_data()["choices"][0]["message"]["tool_calls"]
+        assert [call["id"] for call in tool_calls] == ["call_0", "call_1"]
+        assert tool_calls[0]["function"] == {"name": "get_stores", "arguments": "{}"}
+        assert json.loads(tool_calls[1]["function"]["arguments"]) == {"store_name": "宜山路店"}
+
+
+class TestStreamChatCompletion:
+    """测试适配器流式请求"""
+
+    @pytest.mark.asyncio
+    async def test_stream_forwards_deltas(self):
+        """测试流式请求逐段回调文本并记录首字延迟"""
+        runner, base_url, received = await _start_stub_sse_server([
+            _chunk({"role": "assistant"}),
+            _chunk({"content": "您好"}),
+            _chunk({"content": "，欢迎光临"}),
+            _chunk({}, finish_reason="stop"),
+        ])
+        adapter = OpenAIAdapter(ModelConfig(
+            provider=AIProvider.OPENAI,
+            model_name="stub-model",
+            api_key="test-key",
+            base_url=base_url
+        ))
+        deltas = []
+
+        async def on_delta(text):
+            deltas.append(text)
+
+        try:
+            response = await adapter.stream_chat_completion(
+                AIRequest(messages=[AIMessage(role=MessageRole.USER, content="你好")]), on_delta
+            )
+        finally:
+            await adapter.close()
+            await runner.cleanup()
+
+        assert received[0]["stream"] is True
+        assert deltas == ["您好", "，欢迎光临"]
+        assert response.content == "您好，欢迎光临"
+        assert response.finish_reason == "stop"
+        assert response.time_to_first_token is not None
+        assert response.time_to_first_token >= 0
+
+
+class StreamingScriptedAdapter:
+    """按预设脚本流式返回响应的模拟适配器"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.executed = []
+
+    async def stream_chat_completion(self, request, on_delta=None):
+        response = self.responses.pop(0)
+        if on_delta and response.content:
+            for char in response.content:
+                await on_delta(char)
+        return response
+
+    async def execute_function_call(self, function_name, function_args):
+        self.executed.append(function_name)
+        return {"success": True, "data": function_name}
+
+
+class TestClientStreaming:
+    """测试客户端多轮工具调用中的流式转发"""
+
+    @pytest.mark.asyncio
+    async def test_tool_loop_streams_final_reply(self):
+        """测试工具调用轮之后的最终回复被逐段转发"""
+        adapter = StreamingScriptedAdapter([
+            AIResponse(content="", model="test-model", provider="test", tool_calls=[{
+                "id": "call_0", "type": "function",
+                "function": {"name": "get_stores", "arguments": "{}"}
+            }]),
+            AIResponse(content="有三家门店", model="test-model", provider="test"),
+        ])
+        deltas = []
+
+        async def on_delta(text):
+            deltas.append(text)
+
+        client = AIClient()
+        request = AIRequest(messages=[AIMessage(role=MessageRole.USER, content="有哪些门店")])
+        response = await client._run_tool_loop(adapter, request, on_delta)
+
+        assert adapter.executed == ["get_stores"]
+        assert "".join(deltas) == "有三家门店"
+        assert response.content == "有三家门店"
+        assert response.time_to_first_token is not None
+
+    @pytest.mark.asyncio
+    async def test_round_start_reported_after_tool_round(self):
+        """测试工具调用后开始新一轮时回调，调用方据此丢弃上一轮的预览文本"""
+        adapter = StreamingScriptedAdapter([
+            AIResponse(content="我查一下", model="test-model", provider="test", tool_calls=[{
+                "id": "call_0", "type": "function",
+                "function": {"name": "get_stores", "arguments": "{}"}
+            }]),
+            AIResponse(content="有三家门店", model="test-model", provider="test"),
+        ])
+        preview = []
+
+        async def on_delta(text):
+            preview.append(text)
+
+        async def on_round_start(round_number):
+            preview.append(f"<{round_number}>")
+
+        client = AIClient()
+        request = AIRequest(messages=[AIMessage(role=MessageRole.USER, content="有哪些门店")])
+        await client._run_tool_loop(adapter, request, on_delta, on_round_start=on_round_start)
+
+        assert "".join(preview) == "我查一下<2>有三家门店"
+
+
+class NonStreamingAdapter(BaseAdapter):
+    """只实现普通请求的适配器"""
+
+    async def chat_completion(self, request):
+        return AIResponse(content="完整回复", model="stub-model", provider="stub")
+
+    def _prepare_request(self, request):
+        return {}
+
+    def _parse_response(self, response_data):
+        return AIResponse(content="", model="stub-model", provider="stub")
+
+
+class TestStreamingFallback:
+    """测试不支持流式输出的适配器"""
+
+    @pytest.mark.asyncio
+    async def test_base_stream_falls_back_to_chat_completion(self):
+        """测试基类的流式请求退回普通请求，并把完整文本作为一段增量回调"""
+        adapter = NonStreamingAdapter(ModelConfig(
+            provider=AIProvider.OPENAI, model_name="stub-model", api_key="test-key"
+        ))
+        deltas = []
+
+        async def on_delta(text):
+            deltas.append(text)
+
+        response = await adapter.stream_chat_completion(
+            AIRequest(messages=[AIMessage(role=MessageRole.USER, content="你好")]), on_delta
+        )
+        assert deltas == ["完整回复"]
+        assert response.content == "完整回复"
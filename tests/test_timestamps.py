@@ -0,0 +1,175 @@
+"""
+消息时间戳规范化测试
+样本取自扩展发送的时间戳：timestamp-extractor.js 各解析分支经 toISOString() 的输出、
+memory.js / contact-manager.js 的 Date.now()，以及服务器自己写入的 datetime.now().isoformat()。
+"""
+
+import os
+import sqlite3
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'dianping-scraper', 'backend'))
+from timestamps import (  # noqa: E402
+    backfill_epochs, epoch_ms_sql, epoch_ms_to_iso, normalize_timestamp, parse_epoch_ms
+)
+
+# 2025-06-18 14:30:00 北京时间
+BASE_MS = 1750228200000
+
+EXTENSION_SAMPLES = [
+    # 绝对时间 "14:30"（浏览器在UTC+8）
+    ("2025-06-18T06:30:00.000Z", BASE_MS),
+    # 相对时间 "5分钟前"
+    ("2025-06-18T06:25:00.000Z", BASE_MS - 5 * 60000),
+    # 相对时间 "1小时前"，带毫秒
+    ("2025-06-18T05:30:00.417Z", BASE_MS - 3600000 + 417),
+    # 日期 "5月28日"（默认中午）
+    ("2025-05-28T04:00:00.000Z", 1748404800000),
+    # 相对日期 "昨天"（默认中午）
+    ("2025-06-17T04:00:00.000Z", BASE_MS - 86400000 - 2.5 * 3600000),
+    # Date.now()
+    (1750228200000, BASE_MS),
+    (1750228200123, BASE_MS + 123),
+    # 秒级数字和数字字符串
+    (1750228200, BASE_MS),
+    (1750228200.5, BASE_MS + 500),
+    ("1750228200000", BASE_MS),
+    ("1750228200", BASE_MS),
+    # 带时区偏移
+    ("2025-06-18T14:30:00+08:00", BASE_MS),
+    ("2025-06-18T14:30:00.250+08:00", BASE_MS + 250),
+    ("2025-06-18T06:30:00+00:00", BASE_MS),
+]
+
+# 不带时区的时间（服务器 datetime.now().isoformat()），在UTC+8时区的机器上
+NAIVE_SAMPLES = [
+    ("2025-06-18T14:30:00.123456", BASE_MS + 123),
+    ("2025-06-18T14:30:00", BASE_MS),
+    ("2025-06-18 14:30:00", BASE_MS),
+    ("2025-06-18T14:30", BASE_MS),
+]
+
+UNPARSEABLE = ["昨天", "14:30", "5分钟前", "", "not a time", None]
+
+# 超出可信范围（其中一部分无法存入SQLite INTEGER）
+OUT_OF_RANGE = [1e25, 10 ** 25, "99999999999999999999999", -1750228200000, 0, 1000,
+                "1999-12-31T23:59:59Z", "2100-01-01T00:00:00Z", "0001-01-01T00:00:00Z", "9999-12-31T23:59:59"]
+
+
+@pytest.fixture
+def beijing_tz(monkeypatch):
+    """把本机时区设为UTC+8"""
+    if not hasattr(time, "tzset"):
+        pytest.skip("平台不支持 time.tzset")
+    monkeypatch.setenv("TZ", "Asia/Shanghai")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def _sql_epoch(conn, value):
+    return conn.execute(f"SELECT {epoch_ms_sql('v')} FROM (SELECT ? AS v)", (value,)).fetchone()[0]
+
+
+class TestParseEpoch:
+    """测试各种格式转换为UTC毫秒"""
+
+    @pytest.mark.parametrize("value,expected", EXTENSION_SAMPLES)
+    def test_extension_formats(self, value, expected):
+        assert parse_epoch_ms(value) == expected
+
+    @pytest.mark.parametrize("value,expected", NAIVE_SAMPLES)
+    def test_naive_uses_local_timezone(self, beijing_tz, value, expected):
+        assert parse_epoch_ms(value) == expected
+
+    @pytest.mark.parametrize("value", UNPARSEABLE + [float("nan"), True])
+    def test_unparseable(self, value):
+        assert parse_epoch_ms(value) is None
+
+    @pytest.mark.parametrize("value", OUT_OF_RANGE)
+    def test_out_of_range(self, value):
+        assert parse_epoch_ms(value) is None
+
+    def test_ordering_fixed(self):
+        """测试字符串排序错误的样本按时间排序正确"""
+        values = ["2025-06-18T14:29:00+08:00", "2025-06-18T06:30:00.000Z", 1750228260000]
+        assert sorted(values, key=str) != values
+        epochs = [parse_epoch_ms(v) for v in values]
+        assert epochs == sorted(epochs)
+
+
+class TestNormalize:
+    """测试入库规范化"""
+
+    def test_keeps_original(self):
+        normalized = normalize_timestamp("2025-06-18T06:30:00.000Z")
+        assert normalized.epoch_ms == BASE_MS
+        assert normalized.original == "2025-06-18T06:30:00.000Z"
+        assert normalized.text == normalized.original
+        assert not normalized.fallback
+
+    def test_number_original_as_string(self):
+        normalized = normalize_timestamp(1750228200000)
+        assert normalized.original == "1750228200000"
+        assert normalized.epoch_ms == BASE_MS
+
+    @pytest.mark.parametrize("value", UNPARSEABLE)
+    def test_fallback_to_received_time(self, value):
+        normalized = normalize_timestamp(value, received_ms=BASE_MS)
+        assert normalized.fallback
+        assert normalized.epoch_ms == BASE_MS
+        assert normalized.text == (value if value is not None else "2025-06-18T06:30:00.000Z")
+
+    @pytest.mark.parametrize("value", OUT_OF_RANGE)
+    def test_out_of_range_falls_back(self, value):
+        normalized = normalize_timestamp(value, received_ms=BASE_MS)
+        assert normalized.fallback and normalized.epoch_ms == BASE_MS
+
+    def test_iso_round_trip(self):
+        assert epoch_ms_to_iso(BASE_MS + 417) == "2025-06-18T06:30:00.417Z"
+        assert parse_epoch_ms(epoch_ms_to_iso(BASE_MS + 417)) == BASE_MS + 417
+
+
+class TestSqlParity:
+    """测试批量回填的SQL表达式与Python实现结果一致"""
+
+    @pytest.mark.parametrize("value,expected", EXTENSION_SAMPLES)
+    def test_extension_formats(self, value, expected):
+        conn = sqlite3.connect(":memory:")
+        # 数据库中数字以字符串形式存储
+        assert _sql_epoch(conn, str(value)) == expected == parse_epoch_ms(str(value))
+
+    @pytest.mark.parametrize("value,expected", NAIVE_SAMPLES)
+    def test_naive(self, beijing_tz, value, expected):
+        conn = sqlite3.connect(":memory:")
+        assert _sql_epoch(conn, value) == expected
+
+    @pytest.mark.parametrize("value", ["昨天", "14:30", "not a time"] + [str(v) for v in OUT_OF_RANGE])
+    def test_unparseable_is_null(self, value):
+        assert _sql_epoch(sqlite3.connect(":memory:"), value) is None
+
+
+class TestBackfill:
+    """测试已有数据库的回填"""
+
+    def test_backfill_stages(self):
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE TABLE messages (timestamp TEXT, processed_at DATETIME, ts_epoch INTEGER)")
+        rows = [(str(value), "2025-06-18 06:30:00", None) for value, _ in EXTENSION_SAMPLES]
+        rows += [("2025-06-18T14:30:00 +0800", "2025-06-18 06:30:00", None),  # 只有Python能解析
+                 ("昨天", "2025-06-18 06:31:00", None),
+                 (None, "2025-06-18 06:32:00", None),
+                 ("2025-06-18T06:30:00.000Z", None, 1)]  # 已有值不覆盖
+        conn.executemany("INSERT INTO messages VALUES (?, ?, ?)", rows)
+
+        stats = backfill_epochs(conn, chunk=4)
+        assert stats == {"sql": len(EXTENSION_SAMPLES), "python": 1, "processed_at": 2}
+
+        epochs = [row[0] for row in conn.execute("SELECT ts_epoch FROM messages ORDER BY rowid")]
+        assert epochs[:len(EXTENSION_SAMPLES)] == [expected for _, expected in EXTENSION_SAMPLES]
+        assert epochs[len(EXTENSION_SAMPLES):] == [BASE_MS, BASE_MS + 60000, BASE_MS + 120000, 1]
+        assert backfill_epochs(conn) == {"sql": 0, "python": 0, "processed_at": 0}
@@ -0,0 +1,187 @@
+"""
+工具调用分发器测试
+"""
+
+import asyncio
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+import pytest
+from aiohttp import web
+
+from aiclient.database_service import DatabaseAPIService
+from aiclient.tool_dispatcher import TOOL_DISPATCHER, ArgumentError, ToolDispatcher, coerce_argument
+
+
+class FakeDatabaseService:
+    """记录调用参数的数据库服务"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def search_therapists(self, **kwargs):
+        self.calls.append(("search_therapists", kwargs))
+        return [{"id": 1, "name": "王师傅"}]
+
+    async def get_therapist_schedule(self, therapist_id, date):
+        self.calls.append(("get_therapist_schedule", therapist_id, date))
+        return {"therapist_id": therapist_id, "date": date}
+
+    async def create_smart_appointment(self, data):
+        self.calls.append(("create_smart_appointment", data))
+        return {"success": True}
+
+
+def _services(db=None):
+    return SimpleNamespace(database_service=db or FakeDatabaseService())
+
+
+class TestCoercion:
+    """测试参数类型转换"""
+
+    @pytest.mark.parametrize("value, annotation, expected", [
+        ("3", int, 3),
+        (3.0, int, 3),
+        ("2.5", float, 2.5),
+        (" 推拿 ", str, "推拿"),
+        (12, str, "12"),
+        ("true", bool, True),
+        ('{"a": 1}', Dict[str, Any], {"a": 1}),
+        ("5", Optional[int], 5),
+        (None, int, None),
+    ])
+    def test_coerce(self, value, annotation, expected):
+        assert coerce_argument("x", value, annotation) == expected
+
+    @pytest.mark.parametrize("value, annotation", [("王师傅", int), (True, int), ("[1]", dict), (1.5, int)])
+    def test_reject(self, value, annotation):
+        with pytest.raises(ArgumentError):
+            coerce_argument("x", value, annotation)
+
+
+class TestDispatch:
+    """测试分发与执行"""
+
+    @pytest.mark.asyncio
+    async def test_arguments_coerced_from_signature(self):
+        db = FakeDatabaseService()
+        result = await TOOL_DISPATCHER.dispatch(
+            "get_therapist_schedule", {"therapist_id": "7", "date": "2025-06-18", "extra": 1}, _services(db))
+        assert result["success"] is True
+        assert db.calls == [("get_therapist_schedule", 7, "2025-06-18")]
+
+    @pytest.mark.asyncio
+    async def test_bad_argument_not_executed(self):
+        db = FakeDatabaseService()
+        result = await TOOL_DISPATCHER.dispatch(
+            "get_therapist_schedule", {"therapist_id": "王师傅", "date": "2025-06-18"}, _services(db))
+        assert result["success"] is False
+        assert "therapist_id" in result["error"]
+        assert db.calls == []
+
+    @pytest.mark.asyncio
+    async def test_unknown_function(self):
+        result = await TOOL_DISPATCHER.dispatch("unknown_function", {}, _services())
+        assert result["success"] is False
+        assert "未知的函数" in result["error"]
+
+    @pytest.mark.asyncio
+    async def test_search_filters_pushed_down(self):
+        """测试专长、经验和分页条件直接传给数据库服务，不在本地过滤"""
+        db = FakeDatabaseService()
+        result = await TOOL_DISPATCHER.dispatch(
+            "search_therapists", {"specialty": "艾灸", "min_experience": "5", "limit": 10}, _services(db))
+        assert result["message"] == "查询到 1 个技师"
+        assert db.calls == [("search_therapists", {
+            "store_id": None, "specialty": "艾灸", "min_experience": 5, "page": None, "limit": 10
+        })]
+
+    @pytest.mark.asyncio
+    async def test_pass_arguments_handler(self):
+        db = FakeDatabaseService()
+        args = {"therapist_name": "王师傅", "appointment_time": "15:00"}
+        await TOOL_DISPATCHER.dispatch("create_smart_appointment", args, _services(db))
+        assert db.calls == [("create_smart_appointment", args)]
+
+
+class TestLimits:
+    """测试超时、并发限制和统计"""
+
+    @pytest.mark.asyncio
+    async def test_timeout(self):
+        dispatcher = ToolDispatcher()
+
+        @dispatcher.tool("slow", timeout=0.05)
+        async def slow(services):
+            await asyncio.sleep(1)
+
+        result = await dispatcher.dispatch("slow", {}, None)
+        assert result["success"] is False
+        assert "超时" in result["message"]
+        assert dispatcher.get_stats()["slow"]["timeouts"] == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrency_limit(self):
+        dispatcher = ToolDispatcher()
+        running = []
+        peak = []
+
+        @dispatcher.tool("limited", max_concurrency=2)
+        async def limited(services, n: int):
+            running.append(n)
+            peak.append(len(running))
+            await asyncio.sleep(0.02)
+            running.remove(n)
+            return {"success": True}
+
+        await asyncio.gather(*(dispatcher.dispatch("limited", {"n": i}, None) for i in range(6)))
+        assert max(peak) == 2
+
+        stats = dispatcher.get_stats()["limited"]
+        assert stats["calls"] == 6
+        assert stats["errors"] == 0
+        assert stats["in_flight"] == 0
+        assert stats["avg_ms"] > 0
+
+    @pytest.mark.asyncio
+    async def test_error_metrics(self):
+        dispatcher = ToolDispatcher()
+
+        @dispatcher.tool("broken")
+        async def broken(services, n: int):
+            raise RuntimeError("Database error")
+
+        result = await dispatcher.dispatch("broken", {"n": 1}, None)
+        assert result == {"success": False, "error": "Database error", "message": "函数 broken 执行失败"}
+        await dispatcher.dispatch("broken", {}, None)
+
+        stats = dispatcher.get_stats()["broken"]
+        assert stats["errors"] == 1
+        assert stats["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_search_query_params_sent_to_api():
+    """测试筛选条件作为查询参数发送到API服务器"""
+    received = []
+
+    async def search(request):
+        received.append(dict(request.query))
+        return web.json_response({"success": True, "data": {"therapists": [{"id": 1}]}})
+
+    app = web.Application()
+    app.router.add_get("/api/v1/client/therapists/search", search)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    service = DatabaseAPIService(base_url=f"http://127.0.0.1:{port}")
+    try:
+        await service.search_therapists(specialty="艾灸", min_experience=5, page=2, limit=10)
+    finally:
+        await service.close()
+        await runner.cleanup()
+
+    assert received == [{"specialty": "艾灸", "min_experience": "5", "page": "2", "limit": "10"}]
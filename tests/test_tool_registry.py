@@ -0,0 +1,172 @@
+"""
+工具定义注册表测试
+"""
+
+import json
+
+import pytest
+from aiohttp import web
+
+from aiclient.adapters.openai_adapter import OpenAIAdapter
+from aiclient.adapters.tool_registry import (
+    BOOKING_STAGE, CONSULT_STAGE, TOOL_REGISTRY, ToolSet, detect_conversation_stage, encode_request_body
+)
+from aiclient.config import ModelConfig, AIProvider
+from aiclient.models import AIRequest, AIMessage, MessageRole
+from aiclient.tool_scheduler import ToolScheduler
+
+
+def _adapter(base_url="http://127.0.0.1:1/v1"):
+    return OpenAIAdapter(ModelConfig(
+        provider=AIProvider.OPENAI, model_name="stub-model", api_key="test-key", base_url=base_url
+    ))
+
+
+class TestToolRegistry:
+    """测试工具集构建与缓存"""
+
+    def test_tool_sets_are_cached(self):
+        """测试同一工具组合只构建一次"""
+        assert TOOL_REGISTRY.for_stage(BOOKING_STAGE) is TOOL_REGISTRY.tool_set()
+        assert TOOL_REGISTRY.group("database") is TOOL_REGISTRY.group("database")
+
+    def test_json_bytes_match_schema(self):
+        tools = TOOL_REGISTRY.tool_set()
+        assert json.loads(tools.json_bytes) == list(tools)
+        assert set(tools.names) == set(TOOL_REGISTRY.names)
+
+    def test_consult_stage_is_smaller(self):
+        """测试咨询阶段只提供查询类工具"""
+        consult = TOOL_REGISTRY.for_stage(CONSULT_STAGE)
+        assert "get_stores" in consult.names
+        assert "create_smart_appointment" not in consult.names
+        assert "send_appointment_emails" not in consult.names
+        assert len(consult.json_bytes) < len(TOOL_REGISTRY.tool_set().json_bytes) / 2
+
+    def test_adapter_groups_unchanged(self):
+        """测试适配器原有的工具分组接口仍然可用"""
+        adapter = _adapter()
+        names = [t["function"]["name"] for t in
+                 adapter.get_database_tools() + adapter.get_email_notification_tools()
+                 + adapter.get_smart_appointment_tools()]
+        assert sorted(names) == sorted(TOOL_REGISTRY.names)
+
+
+class TestConversationStage:
+    """测试对话阶段判断"""
+
+    @pytest.mark.parametrize("message", ["有什么技师推荐", "你们店在哪里", "推拿多少钱",
+                                         "在点评上看到你们家", "大约要多久", "一个疗程大概几次",
+                                         "今天营业吗", "老百姓都说好", "订金怎么收", "有什么优惠"])
+    def test_consult(self, message):
+        assert detect_conversation_stage(message) == CONSULT_STAGE
+
+    @pytest.mark.parametrize("message", ["我想预约王师傅", "明天下午可以吗", "姓张 13800001234", "15:30",
+                                         "帮我约个下午三点的", "晚上7点有空吗", "我姓李", "下周六呢"])
+    def test_booking(self, message):
+        assert detect_conversation_stage(message) == BOOKING_STAGE
+
+    def test_booking_intent_in_history(self):
+        history = [{"role": "user", "content": "帮我约一下"}, {"role": "assistant", "content": "请问您贵姓"}]
+        assert detect_conversation_stage("好的", history) == BOOKING_STAGE
+
+    def test_merchant_turns_ignored(self):
+        """测试商家话术中的预约字样不影响判断"""
+        history = [{"role": "user", "content": "你们有什么项目"},
+                   {"role": "assistant", "content": "您好，欢迎预约，明天下午3点也有空位，请留下手机号"}]
+        assert detect_conversation_stage("推拿多少钱", history) == CONSULT_STAGE
+
+    def test_prompt_uses_stage_subset(self):
+        adapter = _adapter()
+        history = [{"role": "user", "content": "你好"}, {"role": "assistant", "content": "您好"}]
+        request = adapter.create_customer_service_prompt_with_history("有什么技师推荐", history)
+        assert request.tools is TOOL_REGISTRY.for_stage(CONSULT_STAGE)
+
+
+class TestArgumentValidation:
+    """测试函数调用参数校验"""
+
+    def test_valid_arguments(self):
+        assert TOOL_REGISTRY.validate("get_therapist_schedule", {"therapist_id": 3, "date": "2025-06-18"}) == []
+        # 模型经常把整数写成字符串，视为合法
+        assert TOOL_REGISTRY.validate("get_therapist_schedule", {"therapist_id": "3", "date": "2025-06-18"}) == []
+
+    def test_missing_required(self):
+        errors = TOOL_REGISTRY.validate("get_therapist_schedule", {"therapist_id": 3})
+        assert errors == ["缺少必填参数 date"]
+
+    def test_wrong_type(self):
+        errors = TOOL_REGISTRY.validate("get_therapist_schedule", {"therapist_id": "王师傅", "date": "2025-06-18"})
+        assert len(errors) == 1
+        assert "therapist_id" in errors[0]
+
+    def test_unknown_tool_not_validated(self):
+        assert TOOL_REGISTRY.validate("query_technician_schedule", {"anything": 1}) == []
+
+    @pytest.mark.asyncio
+    async def test_scheduler_rejects_invalid_arguments(self):
+        """测试参数校验失败时不执行函数，把错误返回给模型"""
+        executed = []
+
+        async def executor(name, args):
+            executed.append(name)
+            return {"success": True}
+
+        scheduler = ToolScheduler(validator=TOOL_REGISTRY.validate)
+        results = await scheduler.run([{
+            "id": "call_0", "type": "function",
+            "function": {"name": "cancel_appointment", "arguments": json.dumps({"appointment_id": 5})}
+        }], executor)
+
+        assert executed == []
+        assert not results[0].success
+        assert "phone" in results[0].result["error"]
+
+
+class TestRequestEncoding:
+    """测试请求体编码"""
+
+    def test_encode_splices_tool_bytes(self):
+        tools = TOOL_REGISTRY.for_stage(CONSULT_STAGE)
+        data = {"model": "m", "messages": [{"role": "user", "content": "你好"}], "tools": tools, "tool_choice": "auto"}
+        decoded = json.loads(encode_request_body(data))
+        assert decoded == dict(data, tools=list(tools))
+
+    def test_encode_plain_tools(self):
+        data = {"messages": [], "tools": [{"type": "function"}]}
+        assert json.loads(encode_request_body(data)) == data
+        assert isinstance(TOOL_REGISTRY.tool_set(), ToolSet)
+
+    @pytest.mark.asyncio
+    async def test_adapter_sends_preserialized_tools(self):
+        """测试适配器发送的请求体包含完整的工具定义"""
+        received = []
+
+        async def chat_completions(request):
+            received.append(await request.json())
+            return web.json_response({
+                "model": "stub-model",
+                "choices": [{"message": {"role": "assistant", "content": "您好"}, "finish_reason": "stop"}],
+                "usage": {}
+            })
+
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", chat_completions)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        adapter = _adapter(f"http://127.0.0.1:{port}/v1")
+
+        try:
+            await adapter.chat_completion(AIRequest(
+                messages=[AIMessage(role=MessageRole.USER, content="你好")],
+                tools=TOOL_REGISTRY.for_stage(CONSULT_STAGE)
+            ))
+        finally:
+            await adapter.close()
+            await runner.cleanup()
+
+        assert [t["function"]["name"] for t in received[0]["tools"]] == list(TOOL_REGISTRY.for_stage(CONSULT_STAGE).names)
+        assert received[0]["tool_choice"] == "auto"
@@ -0,0 +1,102 @@
+"""
+工具调用调度器测试
+"""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from aiclient.tool_scheduler import ToolScheduler
+
+
+def _tool_call(call_id, name, args=None):
+    return {
+        "id": call_id,
+        "type": "function",
+        "function": {"name": name, "arguments": json.dumps(args or {}, ensure_ascii=False)}
+    }
+
+
+class TestToolScheduler:
+    """测试工具调用调度器"""
+
+    @pytest.mark.asyncio
+    async def test_independent_calls_run_concurrently(self):
+        """测试相互独立的调用并发执行，结果顺序与调用顺序一致"""
+        async def executor(name, args):
+            await asyncio.sleep(0.2 if name == "get_stores" else 0.1)
+            return {"success": True, "data": name}
+
+        scheduler = ToolScheduler()
+        start = time.perf_counter()
+        results = await scheduler.run([
+            _tool_call("call_1", "get_stores"),
+            _tool_call("call_2", "search_therapists", {"store_id": 1}),
+        ], executor)
+        elapsed = time.perf_counter() - start
+
+        assert elapsed < 0.29
+        assert [r.tool_call_id for r in results] == ["call_1", "call_2"]
+        assert [r.result["data"] for r in results] == ["get_stores", "search_therapists"]
+        assert results[1].arguments == {"store_id": 1}
+
+    @pytest.mark.asyncio
+    async def test_dependent_call_waits(self):
+        """测试邮件发送等待预约创建完成"""
+        order = []
+
+        async def executor(name, args):
+            if name == "create_smart_appointment":
+                await asyncio.sleep(0.05)
+            order.append(name)
+            return {"success": True}
+
+        results = await ToolScheduler().run([
+            _tool_call("call_1", "send_appointment_emails"),
+            _tool_call("call_2", "create_smart_appointment"),
+        ], executor)
+
+        assert order == ["create_smart_appointment", "send_appointment_emails"]
+        assert [r.name for r in results] == ["send_appointment_emails", "create_smart_appointment"]
+
+    @pytest.mark.asyncio
+    async def test_dependent_call_skipped_on_failure(self):
+        """测试依赖失败时跳过后续调用"""
+        called = []
+
+        async def executor(name, args):
+            called.append(name)
+            return {"success": name != "create_smart_appointment"}
+
+        results = await ToolScheduler().run([
+            _tool_call("call_1", "create_smart_appointment"),
+            _tool_call("call_2", "send_appointment_emails"),
+        ], executor)
+
+        assert called == ["create_smart_appointment"]
+        assert results[1].success is False
+        assert "create_smart_appointment" in results[1].result["error"]
+
+    @pytest.mark.asyncio
+    async def test_timeout_and_bad_arguments(self):
+        """测试单个工具超时和参数解析失败不影响其他调用"""
+        async def executor(name, args):
+            if name == "get_therapist_schedule":
+                await asyncio.sleep(1)
+            return {"success": True}
+
+        scheduler = ToolScheduler(timeouts={"get_therapist_schedule": 0.05})
+        bad_call = {"id": "call_3", "function": {"name": "get_stores", "arguments": "{bad json"}}
+        results = await scheduler.run([
+            _tool_call("call_1", "get_therapist_schedule", {"therapist_id": 1, "date": "2025-06-20"}),
+            _tool_call("call_2", "get_stores"),
+            bad_call,
+        ], executor)
+
+        assert results[0].success is False
+        assert "超时" in results[0].result["error"]
+        assert results[1].success is True
+        assert results[2].success is False
+        assert "参数解析失败" in results[2].result["error"]